@@ -1,9 +1,44 @@
+import logging
+import threading
+
 from flask import Flask
 from config import Config
 
+from .upload_buffer import UploadRequest
+from .utils import AnalysisJSONProvider
+
+_celery_lock = threading.Lock()
+
+
+def get_celery(app):
+    """Return the app's Celery instance, creating it on first use so requests that never queue a job skip importing Celery."""
+    with _celery_lock:
+        if 'celery' not in app.extensions:
+            from .tasks import celery_init_app
+            celery_init_app(app)
+    return app.extensions['celery']
+
+
+def prewarm(app):
+    """
+    Import the analysis, plotting, report and job queue modules now rather than on the first request that needs them.
+
+    create_app calls this when PREWARM_IMPORTS is set. Run it before workers fork
+    (e.g. gunicorn --preload) and the forked workers share the imported modules.
+    """
+    from . import analysis, report_generator, student_index  # noqa: F401
+    from scipy.stats import linregress  # noqa: F401
+    from matplotlib.backends import backend_agg  # noqa: F401
+    from matplotlib.figure import Figure  # noqa: F401
+    get_celery(app)
+
+
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)  # Configure the app with the Config object
+    app.json = AnalysisJSONProvider(app)  # jsonify() serializes DataFrames directly, with NaN as null
+    app.request_class = UploadRequest  # Uploaded files are parsed into buffers the dataset store can keep without copying
+    logging.getLogger('app').setLevel(app.config['LOG_LEVEL'])  # Loggers of this package's modules, e.g. app.metrics
 
     # Import the Blueprint
     from .routes import main as main_blueprint
@@ -11,4 +46,8 @@ def create_app():
     # Register the Blueprint
     app.register_blueprint(main_blueprint)
 
-    return app
\ No newline at end of file
+    # The Celery job queue used by the /jobs routes is set up by get_celery on first use
+    if app.config.get('PREWARM_IMPORTS'):
+        prewarm(app)
+
+    return app
@@ -1,165 +1,166 @@
+import logging
 import pandas as pd
-from scipy.stats import zscore, linregress
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
-from celery import Celery
-import os
-import re
-from flask import jsonify, request, session
-import json
-
-
-
-
-app = Celery('tasks', broker='redis://localhost:6479')
-
-matplotlib.use('Agg')  # Use the non-GUI Agg backend
-
-
-def read_excel_file(file_path):
-    try:
-        return pd.read_excel(file_path)
-    except Exception as e:
-        raise ValueError(f"Failed to read Excel file: {e}")
-
-import tempfile
-from flask import session
-
-def preprocess_data(attendance_df, marks_df):
-    try:
-        print("\nPreprocessing data...")
-        print("Initial Attendance DataFrame shape:", attendance_df.shape)
-        print("Initial Marks DataFrame shape:", marks_df.shape)
-
-        # Log initial data overview
-        print("Initial attendance DataFrame sample:")
-        print(attendance_df.head())
-
-        # Validate required columns in marks DataFrame
-        required_marks_columns = ['StudentID', 'Subject', 'Class', 'T1Weight', 'T2Weight', 'T3Weight']
-        missing_marks_columns = [col for col in required_marks_columns if col not in marks_df.columns]
-        if missing_marks_columns:
-            raise ValueError(f"Missing required columns in marks data: {', '.join(missing_marks_columns)}")
-        print("Required columns check passed for marks data.")
-
-        # Validate required columns in attendance DataFrame
-        required_attendance_columns = ['StudentID', 'Class', 'Percentage']
-        missing_attendance_columns = [col for col in required_attendance_columns if col not in attendance_df.columns]
-        if missing_attendance_columns:
-            raise ValueError(f"Missing required columns in attendance data: {', '.join(missing_attendance_columns)}")
-        print("Required columns check passed for attendance data.")
-
-        # Calculate Final Marks
-        marks_df['CalculatedFinalMark'] = marks_df['T1Weight'] + marks_df['T2Weight'] + marks_df['T3Weight']
-        print("Calculated final marks.")
-
-        # Filter Attendance Data
-        print("\nFiltering Attendance Data...")
+from flask import has_app_context, current_app
+from .upload_cache import get_upload_cache, hash_file
+from .ingest import read_table_file
+from .dataset_store import get_dataset_store, stored_digest
+from .class_mapping import ClassSubjectResolver
+from .progress import ProgressReporter, stream_job_events, substage
+from .correlation import linear_regression, pair_attendance_with_marks, regression_table
+from .result_sections import RESULT_SECTIONS, section_frame_name, summarize_result_sections
+from .dtypes import compact_dtypes, frame_memory, widen_floats
+from .validation import missing_columns
+from .pipeline import DatasetStageMemo, Pipeline, Stage
+from .charts import DEFAULT_CHART_MODE, get_chart_service, histogram_chart_data, render_attendance_histogram, render_scatter_plot, scatter_chart_data
+
+# Frame shapes and samples are logged at DEBUG; set LOG_LEVEL=DEBUG to see them
+logger = logging.getLogger(__name__)
+
+
+def read_upload(file_path):
+    """Read an uploaded Excel, CSV or Parquet file, reusing the parsed frame if the same bytes were seen before."""
+    return get_upload_cache().get_or_parse(file_path, read_table_file)
+
+# Grouping keys for each supported z-score level, and the column each level is written to
+Z_SCORE_LEVELS = {
+    'subject': ('zScore', ['Subject']),
+    'class': ('ClassZScore', ['Class']),
+    'year': ('YearGroupZScore', ['School Year', 'Subject']),
+}
+
+def standardize_marks(marks_df, levels=('subject',), value_column='CalculatedFinalMark'):
+    """
+    Add z-score columns to marks_df, in place, in a single vectorized pass per level; return marks_df.
+
+    Each level standardizes value_column within its groups using the group mean
+    and sample standard deviation (ddof=1), matching scipy's zscore(x, ddof=1)
+    but without calling a Python function per group. Missing marks are ignored
+    when computing a group's statistics and keep a NaN z-score. The 'year' level
+    needs a 'School Year' column (see attach_school_year). Pass a copy of a
+    frame that must keep its columns (see with_z_scores).
+    """
+    for level in levels:
+        column, keys = Z_SCORE_LEVELS[level]
+        grouped = marks_df.groupby(keys, sort=False, observed=True)[value_column]
+        mean = grouped.transform('mean')
+        std = grouped.transform('std')
+        marks_df[column] = (marks_df[value_column] - mean) / std
+    return marks_df
+
+def attach_school_year(marks_df, attendance_df):
+    """Copy each student's 'School Year' from the attendance data onto their marks rows."""
+    school_years = attendance_df.drop_duplicates('StudentID').set_index('StudentID')['School Year']
+    marks_df['School Year'] = marks_df['StudentID'].map(school_years)
+    return marks_df
+
+def check_columns(df, name):
+    """Raise ValueError if df lacks a required column of the name upload (uploads are checked against the same schema before they are saved)."""
+    missing = missing_columns(df.columns, name)
+    if missing:
+        raise ValueError(f"Missing required columns in {name} data: {', '.join(missing)}")
+    logger.debug("Required columns check passed for %s data.", name)
+
+def preprocess_marks(marks_df):
+    """Return marks_df with CalculatedFinalMark and subject z-scores added; depends on the marks file alone."""
+    # Summed in float64 from the uploaded decimals, so z-scores and class means are not float32 values
+    weights = widen_floats(marks_df[['T1Weight', 'T2Weight', 'T3Weight']])
+    marks_df = marks_df.assign(CalculatedFinalMark=weights['T1Weight'] + weights['T2Weight'] + weights['T3Weight'])
+    logger.debug("Calculated final marks.")
+    with substage("Calculating Z-scores", metric='z_scores') as info:
+        marks_df = standardize_marks(marks_df)
+        info['rows'] = len(marks_df)
+    return marks_df
+
+def preprocess_attendance(attendance_df):
+    """
+    Return attendance filtered to timetabled classes, with OverallAttendancePercentage added.
+
+    attendance_df must already have its classes mapped to a Subject column (see prepare_attendance).
+    """
+    with substage("Filtering attendance data", metric='filter_attendance') as info:
         filtered_attendance_df = attendance_df[(attendance_df['Class Time'] >= 1000) & (~attendance_df['Class'].str.contains("MEN"))]
-        print("Filtered Attendance DataFrame shape:", filtered_attendance_df.shape)
-
-        # Map 'Class' to 'Subject' in the attendance DataFrame
-        class_to_subject = marks_df[['Class', 'Subject']].drop_duplicates().set_index('Class')['Subject'].to_dict()
-        filtered_attendance_df['Subject'] = filtered_attendance_df['Class'].map(class_to_subject)
-        print("Filtered unique values in 'Subject' column after mapping:", filtered_attendance_df['Subject'].unique())
-
-        # Calculate Overall Attendance Percentage (without narrowing down to 'Overall' class only)
-        # Assuming 'Absence Time' and 'Class Time' are columns that exist for all records
-        filtered_attendance_df.loc[:, 'OverallAttendancePercentage'] = 100 - (filtered_attendance_df['Absence Time'] / filtered_attendance_df['Class Time'] * 100)
-        print("Calculated overall attendance percentage for all records.")
-
-        # Log final shapes and sample data
-        print("\nPreprocessing complete.")
-        print("Final Marks DataFrame shape:", marks_df.shape)
-        print("Final Filtered Attendance DataFrame shape:", filtered_attendance_df.shape)
-        print("Final DataFrames sample:")
-        print(marks_df.head())
-        print(filtered_attendance_df.head())
-
-        # Store the DataFrames as temporary files and save the file paths in the session
-        # Store the DataFrames as temporary files and save the file paths in the session
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pkl') as temp_marks_file:
-            marks_df.to_pickle(temp_marks_file.name)
-            session['marks_file'] = temp_marks_file.name
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pkl') as temp_attendance_file:
-            filtered_attendance_df.to_pickle(temp_attendance_file.name)
-            session['attendance_file'] = temp_attendance_file.name
-
-        marks_df['zScore'] = marks_df.groupby('Subject')['CalculatedFinalMark'].transform(lambda x: zscore(x, ddof=1))
-
-
-        return marks_df, filtered_attendance_df
-
-    except ValueError as e:
-        print(f"Error during preprocessing: {e}")
-        # Return empty DataFrames in case of a ValueError
-        return pd.DataFrame(), pd.DataFrame()
-
-    except Exception as e:
-        print(f"Error during preprocessing: {e}")
-        # Return empty DataFrames in case of any other exception
-        return pd.DataFrame(), pd.DataFrame()
-
-def get_student_marks(student_id, marks_df):
-    student_marks = marks_df[marks_df['StudentID'] == student_id]
-    return student_marks[['Subject', 'CalculatedFinalMark', 'zScore']].to_dict(orient='records')
-
-def get_student_attendance(student_id, attendance_df):
-    student_attendance = attendance_df[attendance_df['StudentID'] == student_id]
-    return student_attendance[['Subject', 'OverallAttendancePercentage']].to_dict(orient='records')
+        info['rows'] = len(filtered_attendance_df)
+    logger.debug("Filtered Attendance DataFrame shape: %s", filtered_attendance_df.shape)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Filtered unique values in 'Subject' column: %s", filtered_attendance_df['Subject'].unique())
+
+    # Calculate Overall Attendance Percentage (without narrowing down to 'Overall' class only)
+    # Assuming 'Absence Time' and 'Class Time' are columns that exist for all records
+    filtered_attendance_df = filtered_attendance_df.assign(
+        OverallAttendancePercentage=100 - (filtered_attendance_df['Absence Time'] / filtered_attendance_df['Class Time'] * 100)
+    )
+    logger.debug("Calculated overall attendance percentage for all records.")
+    return filtered_attendance_df
+
+def with_z_scores(marks_df):
+    """marks_df if it has subject z-scores, else a copy with them added; marks_df itself is never modified."""
+    if 'zScore' in marks_df.columns:
+        return marks_df
+    return standardize_marks(marks_df.copy())
+
+def calculate_group_z_scores(marks_df, attendance_df):
+    """
+    Each mark's z-score within its subject, its class, and its year group and subject.
+
+    Students are placed in a year group by their attendance rows; marks of
+    students without attendance have no year group z-score.
+    """
+    columns = ['StudentID', 'Subject', 'Class', 'CalculatedFinalMark', 'zScore']
+    group_z_scores = attach_school_year(with_z_scores(marks_df)[columns].copy(), attendance_df)
+    return standardize_marks(group_z_scores, levels=('class', 'year'))
 
 def identify_low_z_scores(marks_df, low_marks_threshold):
     """Identify entries with z-scores below the specified threshold."""
-    marks_df['zScore'] = marks_df.groupby('Subject')['CalculatedFinalMark'].transform(lambda x: zscore(x, ddof=1))
+    marks_df = with_z_scores(marks_df)
     low_z_scores_df = marks_df[marks_df['zScore'] < low_marks_threshold]
     return low_z_scores_df
 
 def identify_high_z_scores(marks_df, high_marks_threshold):
     """Identify entries with z-scores above the specified threshold."""
-    marks_df['zScore'] = marks_df.groupby('Subject')['CalculatedFinalMark'].transform(lambda x: zscore(x, ddof=1))
+    marks_df = with_z_scores(marks_df)
     high_z_scores_df = marks_df[marks_df['zScore'] > high_marks_threshold]
     return high_z_scores_df
 
 def calculate_year_group_attendance_summary(attendance_df):
-    # Calculate the average attendance for each student
-    student_attendance = attendance_df.groupby(['StudentID', 'School Year'])['Percentage'].mean().reset_index()
+    # Calculate the average attendance for each student, in float64 from the uploaded decimals
+    percentages = attendance_df[['StudentID', 'School Year']].assign(Percentage=widen_floats(attendance_df['Percentage']))
+    student_attendance = percentages.groupby(['StudentID', 'School Year'], observed=True)['Percentage'].mean().reset_index()
     
     # Calculate summary statistics for each year group
-    year_group_summary = student_attendance.groupby('School Year')['Percentage'].agg(['mean', 'median', 'min', 'max', 'std']).reset_index()
+    year_group_summary = student_attendance.groupby('School Year', observed=True)['Percentage'].agg(['mean', 'median', 'min', 'max', 'std']).reset_index()
     
     
     student_attendance['AboveThreshold'] = student_attendance['Percentage'] > 90
-    attendance_above_90 = student_attendance.groupby('School Year')['AboveThreshold'].mean() * 100
+    attendance_above_90 = student_attendance.groupby('School Year', observed=True)['AboveThreshold'].mean() * 100
     year_group_summary = year_group_summary.merge(attendance_above_90.reset_index(name='PercentageAbove90'), on='School Year', how='left')
     year_group_summary['PercentageAbove90'] = year_group_summary['PercentageAbove90'].fillna(0)
     
-    # Generate a bar chart comparing the average attendance across year groups
-    plt.figure(figsize=(8, 6))
-    plt.hist(attendance_df['Percentage'], bins=20, alpha=0.7)
-    plt.xlabel('Attendance Percentage')
-    plt.ylabel('Number of Students')
-    plt.title('Distribution of Attendance Percentages')
-    
-    # Save the histogram image to the static images folder
-    static_folder = os.path.join(os.path.dirname(__file__), 'static', 'images')
-    os.makedirs(static_folder, exist_ok=True)
-    histogram_path = os.path.join(static_folder, 'attendance_distribution_histogram.png')
-    plt.savefig(histogram_path)
-    plt.close()
-    
     return year_group_summary.to_dict(orient='records')
 
+def subjects_by_student(rows):
+    """
+    One row per student in rows: StudentID, the list of their Subjects (in row order) and SubjectCount.
+
+    Built from one stable sort and a split of the subject values rather than a
+    per-group Python aggregation, which holds the GIL for most of a large
+    upload's analysis and keeps concurrent stages from running.
+    """
+    rows = rows[rows['StudentID'].notna()].sort_values('StudentID', kind='stable')
+    student_ids, starts, counts = np.unique(rows['StudentID'].to_numpy(), return_index=True, return_counts=True)
+    subjects = np.split(rows['Subject'].astype(object).to_numpy(), starts[1:]) if len(rows) else []
+    return pd.DataFrame({
+        'StudentID': student_ids,
+        'Subjects': [group.tolist() for group in subjects],
+        'SubjectCount': counts,
+    })
+
 def identify_students_with_subjects_below_threshold(marks_df, low_marks_threshold):
     # Filter rows with z-scores below the specified low marks threshold
-    low_z_scores = marks_df[marks_df['zScore'] < low_marks_threshold]
-    
-    # Group by StudentID and aggregate the subjects into a list
-    subjects_below_threshold = low_z_scores.groupby('StudentID')['Subject'].apply(list).reset_index(name='Subjects')
+    low_z_scores = identify_low_z_scores(marks_df, low_marks_threshold)
     
-    # Count the number of subjects below the threshold for each student
-    subjects_below_threshold['SubjectCount'] = subjects_below_threshold['Subjects'].apply(len)
+    # Group by StudentID and aggregate the subjects into a list, with the number of subjects below the threshold
+    subjects_below_threshold = subjects_by_student(low_z_scores)
     
     # Sort the results by the number of subjects in descending order
     subjects_below_threshold = subjects_below_threshold.sort_values(by='SubjectCount', ascending=False)
@@ -167,44 +168,28 @@ def identify_students_with_subjects_below_threshold(marks_df, low_marks_threshol
     return subjects_below_threshold
 
 def identify_students_below_low_attendance_threshold(attendance_df, low_attendance_threshold):
-    print(f"Analyzing students below low attendance threshold: {low_attendance_threshold}%")
+    logger.debug("Analyzing students below low attendance threshold: %s%%", low_attendance_threshold)
     below_threshold = attendance_df[attendance_df['Percentage'] < low_attendance_threshold]
-    print(f"Found {len(below_threshold)} students below {low_attendance_threshold}% attendance.")
+    logger.debug("Found %d students below %s%% attendance.", len(below_threshold), low_attendance_threshold)
     
-    students_below_threshold = (
-        below_threshold.groupby('StudentID')
-        .agg({
-            'Subject': list,
-            'Percentage': 'count'
-        })
-        .rename(columns={'Subject': 'Subjects', 'Percentage': 'SubjectCount'})
-        .reset_index()
-    )
-    print(f"Details of students below threshold: {students_below_threshold}")
+    students_below_threshold = subjects_by_student(below_threshold)
+    logger.debug("Details of students below threshold: %s", students_below_threshold)
     return students_below_threshold
 
 
 def identify_students_above_high_attendance_threshold(attendance_df, high_attendance_threshold):
-    print(f"Analyzing students above high attendance threshold: {high_attendance_threshold}%")
+    logger.debug("Analyzing students above high attendance threshold: %s%%", high_attendance_threshold)
     above_threshold = attendance_df[attendance_df['Percentage'] > high_attendance_threshold]
-    print(f"Found {len(above_threshold)} students above {high_attendance_threshold}% attendance.")
+    logger.debug("Found %d students above %s%% attendance.", len(above_threshold), high_attendance_threshold)
     
-    students_above_threshold = (
-        above_threshold.groupby('StudentID')
-        .agg({
-            'Subject': list,
-            'Percentage': 'count'
-        })
-        .rename(columns={'Subject': 'Subjects', 'Percentage': 'SubjectCount'})
-        .reset_index()
-    )
-    print(f"Details of students above threshold: {students_above_threshold}")
+    students_above_threshold = subjects_by_student(above_threshold)
+    logger.debug("Details of students above threshold: %s", students_above_threshold)
     return students_above_threshold
 
 
 
 def calculate_average_marks_by_class(marks_df):
-    return marks_df.groupby('Class')['CalculatedFinalMark'].mean()
+    return marks_df.groupby('Class', observed=True)['CalculatedFinalMark'].mean()
 
 def generate_regression_explainer(slope, intercept, r_value, p_value, std_err):
     regression_explainer = ""
@@ -237,32 +222,23 @@ def generate_regression_explainer(slope, intercept, r_value, p_value, std_err):
     return regression_explainer
 
 
-def analyze_correlation_and_prepare_scatter_plot_data(attendance_df, marks_df):
-    # Merge dataframes on 'StudentID'
-    combined_df = pd.merge(marks_df, attendance_df[['StudentID', 'OverallAttendancePercentage']], on='StudentID', how='inner')
-    
-    # Ensure data is numeric and handle NaNs
-    combined_df.dropna(subset=['CalculatedFinalMark', 'OverallAttendancePercentage'], inplace=True)
-    
-    final_mark = combined_df['CalculatedFinalMark']
-    attendance_percentage = combined_df['OverallAttendancePercentage']
+def correlation_statistics(student_pairs, attendance_df, marks_df):
+    """
+    Correlation and line of best fit of final marks against attendance over the
+    student pairs, with their explainer and the per-group regression table.
+    """
+    final_mark = student_pairs['FinalMark']
+    attendance_percentage = student_pairs['AttendancePercentage']
     
     # Optionally, remove outliers here if necessary
     
     # Calculate correlation
     correlation = final_mark.corr(attendance_percentage)
     
-    # Check if data is sufficient for linear regression
-    if len(final_mark) > 1 and len(attendance_percentage) > 1:
-        # Perform linear regression
-        slope, intercept, r_value, p_value, std_err = linregress(attendance_percentage, final_mark)
-    else:
-        slope, intercept, r_value, p_value, std_err = np.nan, np.nan, np.nan, np.nan, np.nan
-    
-    # Generate scatter plot
-    plot_filename = 'scatter_plot.png'
-    generate_scatter_plot(attendance_percentage.tolist(), final_mark.tolist(), slope, intercept, r_value, plot_filename)
-
+    # Linear regression from grouped sums, the same calculation as every row of the regression table (NaN if not enough data)
+    regression = linear_regression(student_pairs)
+    slope, intercept, r_value = regression['slope'], regression['intercept'], regression['r_value']
+    p_value, std_err = regression['p_value'], regression['std_err']
 
     correlation_explainer = f"The correlation coefficient of {correlation:.2f} suggests "
     if abs(correlation) > 0.7:
@@ -274,14 +250,12 @@ def analyze_correlation_and_prepare_scatter_plot_data(attendance_df, marks_df):
     correlation_explainer += " linear relationship between attendance percentage and final marks. "
     correlation_explainer += "A positive value indicates that higher attendance is associated with higher marks, while a negative value suggests the opposite."
 
-    regression_explainer = generate_regression_explainer(slope, intercept, r_value, p_value, std_err)
-
+    # The regression explainer is written on request (POST /regression_explainer) for whichever regression is opened
     explainer_text = {
         'correlation': correlation_explainer,
-        'regression': regression_explainer
     }
     # Ensure values are floats or N/A
-    correlation_analysis = {
+    return {
         'correlation': float(correlation) if not np.isnan(correlation) else 'N/A',
         'line_of_best_fit': {
             'slope': float(slope) if not np.isnan(slope) else 'N/A',
@@ -291,173 +265,297 @@ def analyze_correlation_and_prepare_scatter_plot_data(attendance_df, marks_df):
             'std_err': float(std_err) if not np.isnan(std_err) else 'N/A',
         },
         'explainer_text': explainer_text,  # Add explainer_text here
-        'plot_filename': plot_filename
+        'students': len(student_pairs),
+        # The student pairs are shared with the year group regressions rather than paired again
+        'regression_table': regression_table(attendance_df, marks_df, pairs_by_level={'student': student_pairs})
     }
-    
-    return correlation_analysis
 
-def generate_scatter_plot(attendance_percentage, final_mark, slope, intercept, r_value, plot_filename):
-    plt.figure(figsize=(9, 7))
-    plt.scatter(attendance_percentage, final_mark, alpha=0.5, label='Student Data')
-    
-    # Calculate values for the line of best fit
-    x_vals = np.linspace(min(attendance_percentage), max(attendance_percentage), 100)
-    y_vals = intercept + slope * x_vals
-    plt.plot(x_vals, y_vals, color='red', label=f'Line of Best Fit (R²={r_value**2:.2f})')  # Square the R-value for R-squared
-    
-    # Labels and Title
-    plt.xlabel('Attendance Percentage')
-    plt.ylabel('Final Mark')
-    plt.title('Correlation between Student Attendance and Final Marks')
-
-    # Legend
-    plt.legend()
-
-    # Save the plot to the specified path
-    full_path = os.path.join('/Users/Sam/Desktop/New schools data analysis', plot_filename)
-    plt.savefig(full_path, bbox_inches='tight')  # bbox_inches='tight' to include annotations outside the plot area
-    plt.close()
-
-
-def nan_to_none(value):
-    """Recursively convert NaN values in nested data structures to None."""
-    if isinstance(value, float) and np.isnan(value):
-        return None
-    elif isinstance(value, dict):
-        return {k: nan_to_none(v) for k, v in value.items()}
-    elif isinstance(value, list):
-        return [nan_to_none(v) for v in value]
-    elif isinstance(value, pd.DataFrame):
-        return value.where(pd.notnull(value), None)
-    elif isinstance(value, pd.Series):
-        return value.where(pd.notnull(value), None)
-    return value
-
-def replace_nan(obj):
-    """Recursively replace NaN values with None for JSON serialization."""
-    if isinstance(obj, float) and np.isnan(obj):
-        return None
-    elif isinstance(obj, dict):
-        return {k: replace_nan(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [replace_nan(item) for item in obj]
-    elif isinstance(obj, pd.DataFrame):
-        return obj.where(pd.notnull(obj), None).to_dict(orient='records')
-    elif isinstance(obj, pd.Series):
-        return obj.where(pd.notnull(obj), None).to_dict()
-    return obj
-
-def perform_comprehensive_analysis(attendance_file, marks_file, low_attendance_threshold, high_attendance_threshold, low_marks_threshold, high_marks_threshold):
-    def log_message(message):
-        # Emit the log message to the front-end with event type "log"
-        yield f"event: log\ndata: {message}\n\n"
-
-    try:
-        log_message("Reading attendance and marks files...")
-        attendance_df = read_excel_file(attendance_file)
-        marks_df = read_excel_file(marks_file)
-
-        log_message("Mapping classes to subjects...")
-        class_to_subject = marks_df[['Class', 'Subject']].drop_duplicates().set_index('Class')['Subject'].to_dict()
-
-        # Define a function to find the closest match for a class name
-        def find_closest_match(class_name, class_to_subject):
-            closest_match = None
-            closest_distance = float('inf')
-            for pattern, subject in class_to_subject.items():
-                distance = len(re.sub(pattern, '', class_name)) + len(re.sub(class_name, '', pattern))
-                if distance < closest_distance:
-                    closest_match = subject
-                    closest_distance = distance
-            return closest_match
-
-        # Map the classes in the attendance data to their respective subjects
-        attendance_df['Subject'] = attendance_df['Class'].apply(lambda x: class_to_subject.get(x, find_closest_match(x, class_to_subject)))
-        print("attendance Data origional")
-
-        print(attendance_df["Subject"].unique())
-        session['attendance_df'] = attendance_df
-
-        log_message("Identifying missing subjects...")
-        print("Identifying missing subjects")
-        # Identify missing subjects
-        missing_subjects = attendance_df[attendance_df['Subject'].isna()]['Class'].unique()
-        if len(missing_subjects) > 0:
-            log_message(f"Warning: Missing subjects for the following classes: {', '.join(missing_subjects)}")
-            print("The following are the missing subjects")
-            print(missing_subjects)
+def scatter_plot(student_pairs, correlation_statistics, chart_mode=DEFAULT_CHART_MODE):
+    """The scatter plot of the student pairs with the line of best fit from correlation_statistics: its chart key and URL, or its chart data."""
+    line = {stat: np.nan if value == 'N/A' else value for stat, value in correlation_statistics['line_of_best_fit'].items()}
+    slope, intercept, r_value = line['slope'], line['intercept'], line['r_value']
+    final_mark = student_pairs['FinalMark']
+    attendance_percentage = student_pairs['AttendancePercentage']
+
+    if chart_mode == 'data':
+        # Binned points and a sampled regression line, drawn by the browser without matplotlib
+        chart_data = scatter_chart_data(attendance_percentage.to_numpy(), final_mark.to_numpy(), slope, intercept, r_value)
+        plot_key, plot_filename = None, None
+    else:
+        # Render the scatter plot in the background; it is served from /scatter_plot.png?chart=<key>
+        chart_data = None
+        plot_key = get_chart_service().submit(
+            'scatter', render_scatter_plot, (attendance_percentage.to_numpy(), final_mark.to_numpy()),
+            slope=float(slope), intercept=float(intercept), r_value=float(r_value)
+        )
+        plot_filename = f"scatter_plot.png?chart={plot_key}"
+    return {'plot_filename': plot_filename, 'plot_key': plot_key, 'chart_data': chart_data}
+
+def combine_correlation_analysis(correlation_statistics, scatter_plot):
+    """The correlation_analysis result: the statistics with the scatter plot's fields after the explainer."""
+    statistics = dict(correlation_statistics)
+    return {
+        'correlation': statistics.pop('correlation'),
+        'line_of_best_fit': statistics.pop('line_of_best_fit'),
+        'explainer_text': statistics.pop('explainer_text'),
+        **scatter_plot,
+        **statistics,
+    }
+
+def analyze_correlation_and_prepare_scatter_plot_data(attendance_df, marks_df, chart_mode=DEFAULT_CHART_MODE):
+    # One pair per student (mean final mark, overall attendance) rather than a many-to-many merge on StudentID
+    pairs = pair_attendance_with_marks(attendance_df, marks_df, level='student')
+    statistics = correlation_statistics(pairs, attendance_df, marks_df)
+    return combine_correlation_analysis(statistics, scatter_plot(pairs, statistics, chart_mode))
+
+def format_memory_change(before, after):
+    return f"{before / 1e6:.1f} MB -> {after / 1e6:.1f} MB ({(1 - after / before) * 100 if before else 0:.0f}% smaller)"
+
+def compact_frame(df):
+    """Convert df to its compact column types; return it with a description of the memory saved."""
+    with substage("Compacting column types", metric='compact_dtypes') as info:
+        before = frame_memory(df)
+        df = compact_dtypes(df)
+        info['rows'] = len(df)
+    return df, format_memory_change(before, frame_memory(df))
+
+def read_upload_measured(file_path):
+    """read_upload, measured as a substage of the running stage."""
+    with substage("Reading upload", metric='read_upload') as info:
+        df = read_upload(file_path)
+        info['rows'] = len(df)
+    return df
+
+def upload_digest(file_path):
+    return stored_digest(file_path) or hash_file(file_path)
+
+def prepare_marks(marks_file):
+    """Read, compact and preprocess the marks upload; return the frame and a description of the memory saved."""
+    marks_df, memory_change = compact_frame(read_upload_measured(marks_file))
+    check_columns(marks_df, 'marks')
+    with substage("Preprocessing marks", metric='preprocess_marks') as info:
+        marks_df = preprocess_marks(marks_df)
+        info['rows'] = len(marks_df)
+    return marks_df, memory_change
+
+def prepare_attendance(attendance_file, class_resolver):
+    """
+    Read and compact the attendance upload, map its classes to subjects and preprocess it.
+
+    Returns the frame, the class mapping summary and a description of the memory saved.
+    """
+    attendance_df, memory_change = compact_frame(read_upload_measured(attendance_file))
+    check_columns(attendance_df, 'attendance')
+
+    # Map the classes in the attendance data to their respective subjects, kept categorical like the marks subjects
+    with substage("Mapping classes to subjects", metric='map_classes') as info:
+        attendance_df = attendance_df.assign(Subject=class_resolver.map_classes(attendance_df['Class']).astype('category'))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Attendance subjects as mapped: %s", attendance_df["Subject"].unique())
 
         # Drop rows where the subject is not found in the mapping
         attendance_df = attendance_df.dropna(subset=['Subject'])
-        print("attendance Data after dropna")
-
-        print(attendance_df["Subject"].unique())
-
-        log_message("Preprocessing data...")
-        marks_df, attendance_df = preprocess_data(attendance_df, marks_df)
-        print("attendance Data after preprocess")
-        print(attendance_df["Subject"].unique())
-
-
-        log_message("Identifying low Z-scores...")
-        low_z_scores_df = identify_low_z_scores(marks_df, low_marks_threshold)
-        log_message(f"Number of students with low z-scores: {len(low_z_scores_df['StudentID'].unique())}")
-
-        log_message("Identifying students with subjects below threshold...")
-        subjects_below_threshold = identify_students_with_subjects_below_threshold(marks_df, low_marks_threshold)
-        log_message(f"Number of students with subjects below threshold: {len(subjects_below_threshold)}")
-
-        log_message("Calculating average marks by class...")
-        average_marks_by_class = calculate_average_marks_by_class(marks_df)
-        
-        log_message(f"Identifying high Z-scores above threshold {high_marks_threshold}...")
-        high_z_scores_df = identify_high_z_scores(marks_df, high_marks_threshold)
-        log_message(f"Number of students with high z-scores: {len(high_z_scores_df['StudentID'].unique())}")
-
-
-        log_message("Analyzing correlation and preparing scatter plot...")
-        correlation_analysis = analyze_correlation_and_prepare_scatter_plot_data(attendance_df, marks_df)
-
-        log_message("Calculating year group attendance summary...")
-        year_group_attendance_summary = calculate_year_group_attendance_summary(attendance_df)
-
-        log_message("Identifying students below low attendance threshold...")
-        students_below_threshold = identify_students_below_low_attendance_threshold(attendance_df, low_attendance_threshold)
-        print(f"Students below threshold count: {students_below_threshold.shape[0]}")
-        log_message(f"Number of students below low attendance threshold: {students_below_threshold.shape[0]}")
-
-        log_message("Identifying students above high attendance threshold...")
-        students_above_threshold = identify_students_above_high_attendance_threshold(attendance_df, high_attendance_threshold)
-        print(f"Students above threshold count: {students_above_threshold.shape[0]}")
-        log_message(f"Number of students above high attendance threshold: {students_above_threshold.shape[0]}")
-
-        log_message("Attendance analysis completed.")
-
-
-        log_message("Analysis completed successfully.")
-        
-        results = {
-            "low_z_scores": low_z_scores_df.to_dict(orient='records'),
-            "students_below_threshold_in_multiple_subjects": subjects_below_threshold.to_dict(orient='records'),
-            "average_marks_by_class": average_marks_by_class.to_dict(),
-            "correlation_analysis": correlation_analysis,
-            "high_z_scores": high_z_scores_df.to_dict(orient='records'),
-            "plot_filename": correlation_analysis['plot_filename'],
-            "year_group_attendance_summary": year_group_attendance_summary,
-            "students_below_low_threshold": students_below_threshold.to_dict(orient='records'),
-            "students_above_high_threshold": students_above_threshold.to_dict(orient='records')
-        }
-        results = {key: replace_nan(value) for key, value in results.items()}
-        
-        print("students_below_low_threshold:")
-        print(results["students_below_low_threshold"])
-        print("\nstudents_above_high_threshold:")
-        print(results["students_above_high_threshold"])
-
-        # Send the final response data as JSON with event type "result"
-        yield f"event: result\ndata: {json.dumps(results)}\n\n"
-
-
-    except Exception as e:
-        log_message(f"An error occurred during analysis: {str(e)}")
-        raise
\ No newline at end of file
+        info['rows'] = len(attendance_df)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Attendance subjects after dropping unmapped classes: %s", attendance_df["Subject"].unique())
+
+    with substage("Preprocessing attendance", metric='preprocess_attendance') as info:
+        attendance_df = preprocess_attendance(attendance_df)
+        info['rows'] = len(attendance_df)
+    return attendance_df, class_resolver.summary(), memory_change
+
+def class_map_fingerprint(class_resolver):
+    """The class to subject pairs attendance is mapped with, so new marks with the same classes leave attendance alone."""
+    pairs = sorted((str(class_name), str(subject)) for class_name, subject in class_resolver.exact.items())
+    return pairs, class_resolver.min_similarity
+
+def attendance_messages(attendance_df, class_mapping, memory_change):
+    messages = [f"Attendance data: {memory_change}"]
+    if class_mapping['fuzzy']:
+        fuzzy_classes = ', '.join(f"{name} -> {match['matched_class']}" for name, match in class_mapping['fuzzy'].items())
+        messages.append(f"Classes matched by similarity: {fuzzy_classes}")
+    if class_mapping['unmatched']:
+        messages.append(f"Warning: Missing subjects for the following classes: {', '.join(class_mapping['unmatched'])}")
+    return messages
+
+def prepare_attendance_histogram(attendance_df, chart_mode):
+    """Start rendering the attendance histogram, or bin it for the browser; returns (chart key, chart data)."""
+    attendance_percentages = widen_floats(attendance_df['Percentage'].dropna()).to_numpy()
+    if chart_mode == 'data':
+        return None, histogram_chart_data(attendance_percentages)
+    return get_chart_service().submit('attendance_histogram', render_attendance_histogram, (attendance_percentages,)), None
+
+# The analysis as a graph of stages (see pipeline.Pipeline). Sources: attendance_file and marks_file;
+# params: the four thresholds and chart_mode. Marks-only results re-run when the marks or marks thresholds
+# change, attendance results when the attendance, its thresholds or the class to subject mapping change.
+ANALYSIS_PIPELINE = Pipeline([
+    Stage('marks', prepare_marks, inputs=('marks_file',), outputs=('marks_df', 'marks_memory'),
+          label="Reading and preprocessing marks",
+          message=lambda marks_df, memory_change: f"Marks data: {memory_change}"),
+    Stage('class_resolver', ClassSubjectResolver.from_marks, inputs=('marks_df',),
+          label="Reading classes and subjects from marks", fingerprint=class_map_fingerprint),
+    Stage('attendance', prepare_attendance, inputs=('attendance_file', 'class_resolver'),
+          outputs=('attendance_df', 'class_mapping', 'attendance_memory'),
+          label="Reading, mapping and preprocessing attendance", message=attendance_messages),
+    Stage('low_z_scores', identify_low_z_scores, inputs=('marks_df',), params=('low_marks_threshold',),
+          label="Identifying low Z-scores",
+          message=lambda df: f"Number of students with low z-scores: {df['StudentID'].nunique()}"),
+    Stage('students_below_threshold_in_multiple_subjects', identify_students_with_subjects_below_threshold,
+          inputs=('marks_df',), params=('low_marks_threshold',),
+          label="Identifying students with subjects below threshold",
+          message=lambda df: f"Number of students with subjects below threshold: {len(df)}"),
+    Stage('average_marks_by_class', calculate_average_marks_by_class, inputs=('marks_df',),
+          label="Calculating average marks by class"),
+    Stage('high_z_scores', identify_high_z_scores, inputs=('marks_df',), params=('high_marks_threshold',),
+          label="Identifying high Z-scores above threshold {high_marks_threshold}",
+          message=lambda df: f"Number of students with high z-scores: {df['StudentID'].nunique()}"),
+    # One pair per student (mean final mark, overall attendance) rather than a many-to-many merge on StudentID
+    Stage('student_pairs', pair_attendance_with_marks, inputs=('attendance_df', 'marks_df'),
+          label="Pairing attendance with marks"),
+    Stage('correlation_statistics', correlation_statistics, inputs=('student_pairs', 'attendance_df', 'marks_df'),
+          label="Analyzing correlation"),
+    # Charts are prepared every run, as a stored key could outlive its PNG; the chart service only renders charts it does not have
+    Stage('scatter_plot', scatter_plot, inputs=('student_pairs', 'correlation_statistics'), params=('chart_mode',),
+          label="Preparing scatter plot", memoize=False),
+    Stage('attendance_histogram', prepare_attendance_histogram, inputs=('attendance_df',), params=('chart_mode',),
+          outputs=('histogram_key', 'histogram_data'), label="Preparing attendance histogram", memoize=False),
+    Stage('group_z_scores', calculate_group_z_scores, inputs=('marks_df', 'attendance_df'),
+          label="Calculating Z-scores by class and year group"),
+    Stage('year_group_attendance_summary', calculate_year_group_attendance_summary, inputs=('attendance_df',),
+          label="Calculating year group attendance summary"),
+    Stage('students_below_low_threshold', identify_students_below_low_attendance_threshold,
+          inputs=('attendance_df',), params=('low_attendance_threshold',),
+          label="Identifying students below low attendance threshold",
+          message=lambda df: f"Number of students below low attendance threshold: {df.shape[0]}"),
+    Stage('students_above_high_threshold', identify_students_above_high_attendance_threshold,
+          inputs=('attendance_df',), params=('high_attendance_threshold',),
+          label="Identifying students above high attendance threshold",
+          message=lambda df: f"Number of students above high attendance threshold: {df.shape[0]}"),
+])
+
+# Results of the full analysis, and the ones /apply_thresholds recomputes
+ANALYSIS_RESULTS = (
+    'low_z_scores', 'high_z_scores', 'students_below_threshold_in_multiple_subjects', 'average_marks_by_class',
+    'class_mapping', 'year_group_attendance_summary', 'students_below_low_threshold', 'students_above_high_threshold',
+    'correlation_statistics', 'scatter_plot', 'histogram_key', 'histogram_data', 'group_z_scores',
+)
+THRESHOLD_RESULTS = (
+    'low_z_scores', 'high_z_scores', 'students_below_threshold_in_multiple_subjects',
+    'students_below_low_threshold', 'students_above_high_threshold',
+)
+
+# Stored frames the memoized stage outputs are kept in: the preprocessed dataset and the paged result sections
+STAGE_FRAMES = {
+    'marks_df': 'marks',
+    'attendance_df': 'attendance',
+    **{section: section_frame_name(section) for section in RESULT_SECTIONS},
+}
+
+def run_analysis_pipeline(attendance_file, marks_file, params, targets, dataset_id=None, reporter=None):
+    """
+    Run ANALYSIS_PIPELINE for targets on the uploaded files.
+
+    With a dataset_id every stage output is memoized with the dataset, keyed by
+    the upload digests and the params it depends on, so only stages whose
+    inputs changed since the dataset was last analysed (or since the dataset it
+    was derived from, see DatasetStore.derive_dataset) are run.
+    """
+    memo = DatasetStageMemo(get_dataset_store(), dataset_id, frame_names=STAGE_FRAMES) if dataset_id else None
+    return ANALYSIS_PIPELINE.run(
+        {'attendance_file': attendance_file, 'marks_file': marks_file}, params, targets=targets,
+        source_keys={'attendance_file': upload_digest(attendance_file), 'marks_file': upload_digest(marks_file)},
+        memo=memo, reporter=reporter
+    )
+
+def apply_thresholds(attendance_file, marks_file, low_attendance_threshold, high_attendance_threshold, low_marks_threshold, high_marks_threshold, dataset_id=None):
+    """
+    Re-run only the threshold-dependent steps; with a dataset_id the preprocessed frames are reused from the store.
+
+    With a dataset_id the new sections replace the stored ones and come back as summaries.
+    """
+    params = {
+        'low_attendance_threshold': low_attendance_threshold,
+        'high_attendance_threshold': high_attendance_threshold,
+        'low_marks_threshold': low_marks_threshold,
+        'high_marks_threshold': high_marks_threshold,
+    }
+    results = run_analysis_pipeline(attendance_file, marks_file, params, THRESHOLD_RESULTS, dataset_id=dataset_id)
+    # Without a dataset the DataFrames are left as they are; utils.to_json writes them out as lists of records
+    if dataset_id:
+        results = summarize_result_sections(results)
+    return results
+
+def run_comprehensive_analysis(attendance_file, marks_file, low_attendance_threshold, high_attendance_threshold, low_marks_threshold, high_marks_threshold, dataset_id=None, reporter=None, chart_mode=None):
+    """
+    Run every analysis step on the uploaded files and return the results dict, reporting progress per stage.
+
+    The steps are the stages of ANALYSIS_PIPELINE, run concurrently where they
+    do not depend on each other. With a dataset_id stage outputs are memoized
+    with the dataset, so re-analysing it, or a dataset derived from it with one
+    file replaced, only runs the stages whose inputs changed.
+    """
+    if reporter is None:
+        reporter = ProgressReporter()
+    if chart_mode is None:
+        chart_mode = current_app.config.get('CHART_MODE', DEFAULT_CHART_MODE) if has_app_context() else DEFAULT_CHART_MODE
+
+    params = {
+        'low_attendance_threshold': low_attendance_threshold,
+        'high_attendance_threshold': high_attendance_threshold,
+        'low_marks_threshold': low_marks_threshold,
+        'high_marks_threshold': high_marks_threshold,
+        'chart_mode': chart_mode,
+    }
+    outputs = run_analysis_pipeline(attendance_file, marks_file, params, ANALYSIS_RESULTS, dataset_id=dataset_id, reporter=reporter)
+    correlation_analysis = combine_correlation_analysis(outputs['correlation_statistics'], outputs['scatter_plot'])
+    histogram_key = outputs['histogram_key']
+
+    reporter.log("Attendance analysis completed.")
+
+    if chart_mode != 'data':
+        with reporter.stage("Rendering charts"):
+            get_chart_service().wait(correlation_analysis['plot_key'], histogram_key)
+
+
+    reporter.log("Analysis completed successfully.")
+    
+    # DataFrames and Series are left as they are; utils.to_json serializes them column-wise with NaN as null
+    results = {
+        "low_z_scores": outputs['low_z_scores'],
+        "high_z_scores": outputs['high_z_scores'],
+        "students_below_threshold_in_multiple_subjects": outputs['students_below_threshold_in_multiple_subjects'],
+        "average_marks_by_class": outputs['average_marks_by_class'],
+        "class_mapping": outputs['class_mapping'],
+        "year_group_attendance_summary": outputs['year_group_attendance_summary'],
+        "students_below_low_threshold": outputs['students_below_low_threshold'],
+        "students_above_high_threshold": outputs['students_above_high_threshold'],
+        "correlation_analysis": correlation_analysis,
+        "plot_filename": correlation_analysis['plot_filename'],
+        "histogram_filename": f"charts/{histogram_key}.png" if histogram_key else None,
+        "histogram_data": outputs['histogram_data'],
+        "group_z_scores": outputs['group_z_scores'],
+    }
+
+    logger.debug("students_below_low_threshold: %s", results["students_below_low_threshold"])
+    logger.debug("students_above_high_threshold: %s", results["students_above_high_threshold"])
+
+    # The row-level sections were stored with the dataset by the pipeline and are paged from /results/<section>;
+    # the result event carries their summaries
+    if dataset_id:
+        results = summarize_result_sections(results)
+
+    return results
+
+def perform_comprehensive_analysis(attendance_file, marks_file, low_attendance_threshold, high_attendance_threshold, low_marks_threshold, high_marks_threshold, dataset_id=None, chart_mode=None):
+    """
+    Run the analysis on a background worker and return a generator of server-sent
+    events: 'log' and 'stage' events while it runs, then one 'result' (or 'error')
+    event. Closing the generator, as happens when the client disconnects, cancels it.
+    """
+    return stream_job_events(
+        run_comprehensive_analysis,
+        attendance_file, marks_file,
+        low_attendance_threshold, high_attendance_threshold,
+        low_marks_threshold, high_marks_threshold,
+        dataset_id=dataset_id, chart_mode=chart_mode
+    )
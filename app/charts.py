@@ -0,0 +1,244 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from flask import current_app, has_app_context
+
+from .metrics import measure_stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHART_DIR = os.path.join(tempfile.gettempdir(), 'school_data_analysis', 'charts')
+DEFAULT_CHART_WORKERS = 2
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 64 Megabytes
+CHART_KEY = re.compile(r'^[0-9a-f]{64}$')
+
+# Chart modes: 'image' renders PNGs on the server, 'data' sends binned data for the browser to draw
+CHART_MODES = ('image', 'data')
+DEFAULT_CHART_MODE = 'image'
+SCATTER_BINS = 40
+HISTOGRAM_BINS = 20
+REGRESSION_LINE_POINTS = 10
+
+
+def chart_key(kind, arrays, params):
+    """Hash a chart's kind, input data and drawing parameters into the key its PNG is stored under."""
+    digest = hashlib.sha256(kind.encode())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    for values in arrays:
+        digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+        digest.update(b'|')
+    return digest.hexdigest()
+
+
+def render_scatter_plot(path, attendance_percentage, final_mark, slope, intercept, r_value):
+    """Draw final marks against attendance with the line of best fit and save it as a PNG."""
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(9, 7))
+    ax = figure.subplots()
+    ax.scatter(attendance_percentage, final_mark, alpha=0.5, label='Student Data')
+
+    # Calculate values for the line of best fit
+    if len(attendance_percentage) and np.isfinite(slope):
+        x_vals = np.linspace(np.min(attendance_percentage), np.max(attendance_percentage), 100)
+        y_vals = intercept + slope * x_vals
+        ax.plot(x_vals, y_vals, color='red', label=f'Line of Best Fit (R²={r_value**2:.2f})')  # Square the R-value for R-squared
+
+    # Labels and Title
+    ax.set_xlabel('Attendance Percentage')
+    ax.set_ylabel('Final Mark')
+    ax.set_title('Correlation between Student Attendance and Final Marks')
+    ax.legend()
+
+    figure.savefig(path, format='png', bbox_inches='tight')  # bbox_inches='tight' to include annotations outside the plot area
+
+
+def render_attendance_histogram(path, percentages, bins=20):
+    """Draw the distribution of attendance percentages and save it as a PNG."""
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(8, 6))
+    ax = figure.subplots()
+    ax.hist(percentages, bins=bins, alpha=0.7)
+    ax.set_xlabel('Attendance Percentage')
+    ax.set_ylabel('Number of Students')
+    ax.set_title('Distribution of Attendance Percentages')
+
+    figure.savefig(path, format='png')
+
+
+def _rounded(values, digits=2):
+    return [round(float(value), digits) for value in values]
+
+
+def scatter_chart_data(attendance_percentage, final_mark, slope, intercept, r_value, bins=SCATTER_BINS, line_points=REGRESSION_LINE_POINTS):
+    """
+    Summarize the attendance/marks scatter for drawing in the browser.
+
+    Points are counted into a bins x bins grid and only the occupied cells are
+    sent, as [x_bin, y_bin, count], so the payload is bounded by the grid size
+    however many students there are. The line of best fit is sampled at
+    line_points evenly spaced attendance values.
+    """
+    attendance_percentage = np.asarray(attendance_percentage, dtype=np.float64)
+    final_mark = np.asarray(final_mark, dtype=np.float64)
+    chart = {'points': int(len(attendance_percentage)), 'x_edges': [], 'y_edges': [], 'cells': [], 'line': None}
+    if not len(attendance_percentage):
+        return chart
+
+    counts, x_edges, y_edges = np.histogram2d(attendance_percentage, final_mark, bins=bins)
+    x_bins, y_bins = np.nonzero(counts)
+    chart['x_edges'] = _rounded(x_edges)
+    chart['y_edges'] = _rounded(y_edges)
+    chart['cells'] = [[int(x), int(y), int(count)] for x, y, count in zip(x_bins, y_bins, counts[x_bins, y_bins])]
+
+    if np.isfinite(slope):
+        x_vals = np.linspace(x_edges[0], x_edges[-1], line_points)
+        chart['line'] = {
+            'x': _rounded(x_vals),
+            'y': _rounded(intercept + slope * x_vals),
+            'r_squared': round(float(r_value ** 2), 4),
+        }
+    return chart
+
+
+def histogram_chart_data(percentages, bins=HISTOGRAM_BINS):
+    """Bin edges and counts of the attendance distribution for drawing in the browser."""
+    counts, edges = np.histogram(np.asarray(percentages, dtype=np.float64), bins=bins)
+    return {'edges': _rounded(edges), 'counts': counts.tolist()}
+
+
+class ChartService:
+    """
+    Renders charts as PNG files on a small thread pool.
+
+    Each chart is drawn on its own matplotlib Figure (never the shared pyplot
+    state), so concurrent renders cannot draw over each other. Files are named by
+    a hash of the chart's data and parameters: the same chart is rendered once
+    and reused, two uploads never overwrite each other's charts, and the key
+    doubles as an ETag. Old charts are evicted least recently used first once
+    the directory exceeds max_bytes.
+    """
+
+    def __init__(self, output_dir=DEFAULT_CHART_DIR, workers=DEFAULT_CHART_WORKERS, max_bytes=DEFAULT_MAX_BYTES):
+        self.output_dir = output_dir
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='charts')
+        self._pending = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def chart_path(self, key):
+        """Return the PNG path for key, or None if key is not a chart key."""
+        if not CHART_KEY.match(key or ''):
+            return None
+        return os.path.join(self.output_dir, f"{key}.png")
+
+    def submit(self, kind, renderer, arrays, **params):
+        """
+        Start rendering renderer(path, *arrays, **params) unless that chart already exists,
+        and return its key straight away; wait() blocks until it has been written.
+        A chart whose last render failed is rendered again.
+        """
+        key = chart_key(kind, arrays, params)
+        path = self.chart_path(key)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None and not (pending.done() and pending.exception() is not None):
+                return key
+            if os.path.exists(path):
+                try:
+                    os.utime(path)  # Mark as most recently used
+                except OSError:
+                    pass
+                return key
+            future = self._executor.submit(self._render, kind, path, renderer, arrays, params)
+            self._pending[key] = future
+        future.add_done_callback(lambda done: self._finished(key, done))
+        return key
+
+    def wait(self, *keys):
+        """Block until the given charts are written, re-raising any rendering error."""
+        with self._lock:
+            futures = [(key, self._pending.get(key)) for key in keys]
+        for key, future in futures:
+            if future is None:
+                continue
+            try:
+                future.result()
+            finally:
+                self._forget(key, future)  # A failed render is reported once, then forgotten
+
+    def _finished(self, key, future):
+        # A failed render stays pending until wait() has collected its error
+        if future.exception() is None:
+            self._forget(key, future)
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def _render(self, kind, path, renderer, arrays, params):
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # Runs on the chart pool, outside any analysis stage, so it is only logged and counted in /metrics
+            with measure_stage(f"Rendering {kind}", metric=f"chart.{kind}") as info:
+                renderer(temp_path, *arrays, **params)
+                info['rows'] = len(arrays[0]) if arrays else None
+            os.replace(temp_path, path)
+        except Exception:
+            logger.exception(f"Rendering {kind} chart {os.path.basename(path)} failed")
+            raise
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.output_dir):
+                if not name.endswith('.png'):
+                    continue
+                path = os.path.join(self.output_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total_bytes -= size
+
+
+_chart_service = None
+_chart_service_lock = threading.Lock()
+
+
+def get_chart_service():
+    """Return the process-wide chart service, configured from the Flask app when one is active."""
+    global _chart_service
+    with _chart_service_lock:
+        if _chart_service is None:
+            config = current_app.config if has_app_context() else {}
+            _chart_service = ChartService(
+                config.get('CHART_CACHE_DIR', DEFAULT_CHART_DIR),
+                config.get('CHART_WORKERS', DEFAULT_CHART_WORKERS),
+                config.get('CHART_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES),
+            )
+    return _chart_service
@@ -0,0 +1,123 @@
+import re
+from collections import Counter, defaultdict
+
+NON_ALPHANUMERIC = re.compile(r'[^0-9a-z]')
+
+# Attendance exports append a section letter to some class codes (e.g. '11AGR1a' for '11AGR1')
+STRIPPABLE_SUFFIXES = ('a',)
+
+
+def normalize_class_name(class_name):
+    """Lower-case a class name and drop whitespace and punctuation so '11HIA4/8 ' matches '11hia48'."""
+    return NON_ALPHANUMERIC.sub('', str(class_name).strip().casefold())
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ClassSubjectResolver:
+    """
+    Resolve attendance class names to the subject they belong to in the marks data.
+
+    The index is built once per upload from the marks data's Class -> Subject
+    pairs. A class name is tried, in order, as an exact match, a normalized match
+    (case, whitespace and punctuation ignored), a normalized match with a known
+    section suffix stripped, and finally a fuzzy match on trigram similarity.
+    Each distinct class name is resolved once and the result is broadcast back
+    to the rows, and fuzzy matches are recorded so they can be reported.
+    """
+
+    def __init__(self, class_to_subject, min_similarity=0.5):
+        self.min_similarity = min_similarity
+        self.exact = dict(class_to_subject)
+
+        self.normalized = {}
+        self.normalized_class = {}
+        for class_name, subject in self.exact.items():
+            key = normalize_class_name(class_name)
+            if key and key not in self.normalized:
+                self.normalized[key] = subject
+                self.normalized_class[key] = class_name
+
+        self.trigram_index = defaultdict(set)
+        self.key_trigrams = {}
+        for key in self.normalized:
+            grams = trigrams(key)
+            self.key_trigrams[key] = grams
+            for gram in grams:
+                self.trigram_index[gram].add(key)
+
+        self.resolved = {}
+        self.match_types = {}
+        self.fuzzy_matches = {}
+
+    @classmethod
+    def from_marks(cls, marks_df, **kwargs):
+        pairs = marks_df[['Class', 'Subject']].dropna().drop_duplicates(subset='Class')
+        return cls(dict(zip(pairs['Class'], pairs['Subject'])), **kwargs)
+
+    def _fuzzy_lookup(self, key):
+        grams = trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            for candidate in self.trigram_index.get(gram, ()):
+                shared[candidate] += 1
+
+        best_key, best_score = None, 0.0
+        for candidate, overlap in shared.items():
+            score = overlap / len(grams | self.key_trigrams[candidate])
+            if score > best_score or (score == best_score and best_key is not None and candidate < best_key):
+                best_key, best_score = candidate, score
+        if best_key is None or best_score < self.min_similarity:
+            return None, 0.0
+        return best_key, best_score
+
+    def resolve(self, class_name):
+        """Return the subject for class_name, or None if no sufficiently close class exists."""
+        if class_name in self.resolved:
+            return self.resolved[class_name]
+
+        subject, match_type = None, 'unmatched'
+        if class_name in self.exact:
+            subject, match_type = self.exact[class_name], 'exact'
+        else:
+            key = normalize_class_name(class_name)
+            if key in self.normalized:
+                subject, match_type = self.normalized[key], 'normalized'
+            else:
+                for suffix in STRIPPABLE_SUFFIXES:
+                    stripped = key[:-len(suffix)] if key.endswith(suffix) else None
+                    if stripped and stripped in self.normalized:
+                        subject, match_type = self.normalized[stripped], 'suffix'
+                        break
+                else:
+                    matched_key, score = self._fuzzy_lookup(key) if key else (None, 0.0)
+                    if matched_key is not None:
+                        subject, match_type = self.normalized[matched_key], 'fuzzy'
+                        self.fuzzy_matches[class_name] = {
+                            'matched_class': self.normalized_class[matched_key],
+                            'subject': subject,
+                            'similarity': round(score, 3),
+                        }
+
+        self.resolved[class_name] = subject
+        self.match_types[class_name] = match_type
+        return subject
+
+    def map_classes(self, classes):
+        """Map a Series of class names to subjects, resolving each distinct name only once."""
+        mapping = {class_name: self.resolve(class_name) for class_name in classes.dropna().unique()}
+        return classes.map(mapping)
+
+    def summary(self):
+        """Counts per match type plus the fuzzily matched and unmatched class names seen so far."""
+        counts = Counter(self.match_types.values())
+        return {
+            'exact': counts.get('exact', 0),
+            'normalized': counts.get('normalized', 0),
+            'suffix': counts.get('suffix', 0),
+            'fuzzy': self.fuzzy_matches,
+            'unmatched': sorted(str(name) for name, match_type in self.match_types.items() if match_type == 'unmatched'),
+        }
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+# Regressions reported alongside the whole-school one: grouping -> (pairing level, grouping column)
+REGRESSION_GROUPS = {
+    'subject': ('subject', 'Subject'),
+    'year': ('student', 'School Year'),
+    'class': ('subject', 'Class'),
+}
+
+# Groups with fewer pairs than this get no regression
+MIN_GROUP_PAIRS = 3
+
+PAIR_KEYS = {
+    'student': ['StudentID'],
+    'subject': ['StudentID', 'Subject'],
+}
+
+
+def attendance_by(attendance_df, keys):
+    """
+    Attendance percentage for each group of keys.
+
+    Uses total absence over total class time when those columns are present, so
+    a student's attendance weights each class by its length, otherwise the mean
+    of the per-row OverallAttendancePercentage.
+    """
+    if 'Absence Time' in attendance_df.columns and 'Class Time' in attendance_df.columns:
+        totals = attendance_df.groupby(keys, sort=False, observed=True)[['Absence Time', 'Class Time']].sum()
+        percentage = 100 - totals['Absence Time'] / totals['Class Time'].replace(0, np.nan) * 100
+    else:
+        percentage = attendance_df.groupby(keys, sort=False, observed=True)['OverallAttendancePercentage'].mean()
+    return percentage.rename('AttendancePercentage')
+
+
+def pair_attendance_with_marks(attendance_df, marks_df, level='student'):
+    """
+    Match attendance to marks without the many-to-many merge on StudentID.
+
+    Both sides are first reduced to one row per student (level='student') or per
+    student and subject (level='subject'), then joined one-to-one, so every
+    student contributes one pair per level instead of classes x subjects rows.
+    Each pair has the mean CalculatedFinalMark as FinalMark, AttendancePercentage,
+    the student's School Year and, per subject, the marks Class.
+    """
+    keys = PAIR_KEYS[level]
+    attendance = attendance_by(attendance_df.dropna(subset=keys), keys)
+
+    aggregations = {'FinalMark': ('CalculatedFinalMark', 'mean')}
+    if level == 'subject' and 'Class' in marks_df.columns:
+        aggregations['Class'] = ('Class', 'first')
+    marks = marks_df.dropna(subset=keys + ['CalculatedFinalMark']).groupby(keys, sort=False, observed=True).agg(**aggregations)
+
+    # A hash merge on the key columns; joining on the (StudentID, Subject) index is several times slower
+    pairs = marks.reset_index().merge(attendance.reset_index(), on=keys, how='inner')
+    if 'School Year' in attendance_df.columns:
+        school_years = attendance_df.drop_duplicates('StudentID').set_index('StudentID')['School Year']
+        pairs['School Year'] = pairs['StudentID'].map(school_years)
+    return pairs.dropna(subset=['FinalMark', 'AttendancePercentage']).reset_index(drop=True)
+
+
+REGRESSION_STATS = ['pairs', 'slope', 'intercept', 'r_value', 'p_value', 'std_err']
+
+
+def grouped_regressions(pairs, by, x='AttendancePercentage', y='FinalMark', min_pairs=MIN_GROUP_PAIRS):
+    """
+    Least-squares regression of y on x within each value of by, for all groups at once.
+
+    One groupby collects n, Σx, Σy, Σx², Σy² and Σxy per group (after centring on
+    the overall means, for numerical stability). Slope, intercept, r, the two-sided
+    p-value of the slope and its standard error then follow for every group as
+    column arithmetic, matching scipy.stats.linregress without calling it per group.
+    Returns a DataFrame indexed by group with REGRESSION_STATS columns; the statistics
+    are NaN for groups with fewer than min_pairs pairs or no spread in x. A group
+    with no spread in y gets r = 0, p = 1 and no standard error, as from linregress.
+    """
+    from scipy.special import stdtr
+
+    # Sums of squares in float64 even when the marks are stored as float32
+    frame = pairs[[by, x, y]].dropna().astype({x: np.float64, y: np.float64})
+    if frame.empty:
+        return pd.DataFrame(columns=REGRESSION_STATS)
+
+    x_mean, y_mean = frame[x].mean(), frame[y].mean()
+    dx = frame[x] - x_mean
+    dy = frame[y] - y_mean
+    sums = frame[[by]].assign(dx=dx, dy=dy, dxx=dx * dx, dyy=dy * dy, dxy=dx * dy).groupby(by, sort=True, observed=True).agg(
+        n=('dx', 'size'), sx=('dx', 'sum'), sy=('dy', 'sum'), sxx=('dxx', 'sum'), syy=('dyy', 'sum'), sxy=('dxy', 'sum')
+    )
+
+    n = sums['n'].astype(float)
+    ss_x = sums['sxx'] - sums['sx'] ** 2 / n
+    ss_y = sums['syy'] - sums['sy'] ** 2 / n
+    ss_xy = sums['sxy'] - sums['sx'] * sums['sy'] / n
+    valid = (n >= min_pairs) & (ss_x > 1e-12)
+    # No spread in y, allowing for rounding in the centred sums
+    flat = ss_y <= 1e-12 * sums['syy']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = ss_xy / ss_x
+        intercept = (y_mean + sums['sy'] / n) - slope * (x_mean + sums['sx'] / n)
+        r_value = (ss_xy / np.sqrt(ss_x * ss_y)).clip(-1, 1)
+        df = n - 2
+        t = r_value * np.sqrt(df / ((1 - r_value) * (1 + r_value)))
+        p_value = pd.Series(2 * stdtr(df, -np.abs(t)), index=sums.index)
+        std_err = np.sqrt((1 - r_value ** 2) * ss_y / ss_x / df)
+    # A perfect fit (allowing for rounding), as linregress reports it
+    perfect = r_value.abs() >= 1 - 1e-12
+    p_value[perfect] = 0.0
+    std_err[perfect] = 0.0
+    # A flat line, as linregress reports it
+    r_value[flat] = 0.0
+    p_value[flat] = 1.0
+    std_err[flat] = 0.0
+
+    table = pd.DataFrame({
+        'pairs': sums['n'],
+        'slope': slope,
+        'intercept': intercept,
+        'r_value': r_value,
+        'p_value': p_value,
+        'std_err': std_err,
+    })
+    table.loc[~valid, REGRESSION_STATS[1:]] = np.nan
+    return table
+
+
+def linear_regression(pairs, x='AttendancePercentage', y='FinalMark', min_pairs=2):
+    """Regression over all pairs as a dict of REGRESSION_STATS (NaN statistics when it cannot be fitted)."""
+    table = grouped_regressions(pairs.assign(_all=0), '_all', x, y, min_pairs)
+    if table.empty:
+        return {'pairs': 0, **{stat: np.nan for stat in REGRESSION_STATS[1:]}}
+    row = table.iloc[0]
+    return {'pairs': int(row['pairs']), **{stat: float(row[stat]) for stat in REGRESSION_STATS[1:]}}
+
+
+def regression_table(attendance_df, marks_df, groups=REGRESSION_GROUPS, pairs_by_level=None):
+    """
+    One table of regressions for every subject, class and year group.
+
+    Each row is {'grouping', 'group', 'pairs', 'slope', 'intercept', 'r_value',
+    'p_value', 'std_err'}, with None for statistics that cannot be computed.
+    Attendance is paired with marks once per pairing level and shared by the
+    groupings that use it; pairs_by_level passes in levels already paired.
+    """
+    pairs_by_level = dict(pairs_by_level or {})
+    rows = []
+    for grouping, (level, column) in groups.items():
+        if level not in pairs_by_level:
+            pairs_by_level[level] = pair_attendance_with_marks(attendance_df, marks_df, level)
+        pairs = pairs_by_level[level]
+        if column not in pairs.columns:
+            continue
+        table = grouped_regressions(pairs, column)
+        for group, stats in zip(table.index, table.itertuples(index=False)):
+            row = {'grouping': grouping, 'group': group.item() if hasattr(group, 'item') else group, 'pairs': int(stats.pairs)}
+            for stat in REGRESSION_STATS[1:]:
+                value = getattr(stats, stat)
+                row[stat] = None if np.isnan(value) else float(value)
+            rows.append(row)
+    return rows
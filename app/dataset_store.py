@@ -0,0 +1,350 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from uuid import uuid4
+
+from flask import current_app, has_app_context
+
+from .upload_buffer import DEFAULT_SPOOL_MEMORY_BYTES, SPOOL_SUFFIX, SpooledUpload
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_DIR = os.path.join(tempfile.gettempdir(), 'school_data_analysis', 'datasets')
+DEFAULT_TTL_SECONDS = 2 * 60 * 60  # 2 hours
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 Gigabyte
+DEFAULT_SWEEP_INTERVAL = 5 * 60  # 5 minutes
+DEFAULT_MAX_UPLOAD_BYTES = 1024 * 1024 * 1024  # 1 Gigabyte per uploaded file
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Each saved upload has its SHA-256 written beside it, so readers never hash it again
+DIGEST_SUFFIX = '.sha256'
+SPOOL_DIR_NAME = '.incoming'
+STATE_FILE = 'analysis_state.json'
+
+
+def format_size(size):
+    """A byte count for messages: whole bytes below 1 MB, megabytes to one decimal place from there."""
+    if size < 1024 * 1024:
+        return f"{size} bytes"
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+class UploadTooLargeError(ValueError):
+    """Raised while saving an upload once it passes the store's per-file limit."""
+
+    def __init__(self, max_bytes):
+        super().__init__(f"File size exceeds the limit. Please ensure each file is under {format_size(max_bytes)}.")
+        self.max_bytes = max_bytes
+
+
+class DatasetStore:
+    """
+    Server-side store for the preprocessed frames of an analysed upload.
+
+    Each analysis run gets a dataset ID (kept in the user's session, which holds
+    nothing else about the upload). Its uploaded files and its frames, as Feather
+    files, live under <root>/<dataset_id>/, so follow-up requests can reload them
+    without repeating the upload and preprocessing.
+
+    Frames are written uncompressed and read through a memory map, so a reader
+    pages in only the columns it asks for, numeric columns without missing values
+    are used in place rather than copied, and workers reading the same dataset
+    share its pages through the OS page cache.
+
+    Uploads arrive as SpooledUpload buffers (see UploadRequest), which keep
+    small files in memory and spill large ones under <root>/.incoming/, hashing
+    and counting bytes as the request body is parsed. Saving one writes the
+    in-memory bytes or renames the spilled file into the dataset, once; the
+    saved file is made read-only, so the analysis, report and search all read
+    the same copy. An upload past max_upload_bytes is never saved, however
+    large it is and whether or not the client sent its size.
+
+    derive_dataset() starts a dataset from another one with one upload left
+    out, hard-linking everything else, so replacing a single file re-analyses
+    only what depends on it (see analysis.run_comprehensive_analysis).
+
+    Every read or write marks the dataset as used. sweep() deletes datasets unused
+    for longer than ttl_seconds, then the least recently used ones until the store
+    fits in max_bytes, and spilled uploads as old as that, which only a process
+    that died mid-request leaves; start_sweeper() runs it periodically on a daemon thread.
+    """
+
+    def __init__(self, root=DEFAULT_STORE_DIR, ttl_seconds=DEFAULT_TTL_SECONDS, max_bytes=DEFAULT_MAX_BYTES,
+                 max_upload_bytes=DEFAULT_MAX_UPLOAD_BYTES, spool_memory_bytes=DEFAULT_SPOOL_MEMORY_BYTES):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_upload_bytes = max_upload_bytes
+        self.spool_memory_bytes = spool_memory_bytes
+        self.spool_dir = os.path.join(root, SPOOL_DIR_NAME)
+        self._sweeper = None
+        self._stop_sweeper = threading.Event()
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def new_dataset_id():
+        return uuid4().hex
+
+    def dataset_dir(self, dataset_id):
+        if not dataset_id or not dataset_id.isalnum():
+            raise ValueError(f"Invalid dataset ID: {dataset_id!r}")
+        return os.path.join(self.root, dataset_id)
+
+    def _frame_path(self, dataset_id, name):
+        return os.path.join(self.dataset_dir(dataset_id), f"{name}.feather")
+
+    def touch(self, dataset_id):
+        """Mark a dataset as just used, restarting its time to live."""
+        try:
+            os.utime(self.dataset_dir(dataset_id))
+        except OSError:
+            pass
+
+    def upload_path(self, dataset_id, name):
+        # No extension: the reader goes by the file's content (see ingest.detect_format)
+        return os.path.join(self.dataset_dir(dataset_id), f"{name}.upload")
+
+    def spooled_upload(self):
+        """A new buffer for an uploaded file, spilling to this store's disk and limited to max_upload_bytes."""
+        return SpooledUpload(self.spool_dir, self.spool_memory_bytes, self.max_upload_bytes)
+
+    def check_upload_size(self, *uploads):
+        """Raise UploadTooLargeError if any upload's buffer went past max_upload_bytes while the request was parsed."""
+        for upload in uploads:
+            if isinstance(upload.stream, SpooledUpload) and upload.stream.too_large:
+                raise UploadTooLargeError(self.max_upload_bytes)
+
+    def save_upload(self, dataset_id, name, upload):
+        """
+        Save an uploaded file (a werkzeug FileStorage) as the dataset's read-only name upload and return its path.
+
+        Raises UploadTooLargeError, leaving nothing behind, if the file has more
+        than max_upload_bytes (0 means no limit).
+        """
+        self.check_upload_size(upload)
+        os.makedirs(self.dataset_dir(dataset_id), exist_ok=True)
+        path = self.upload_path(dataset_id, name)
+        if isinstance(upload.stream, SpooledUpload):
+            digest = upload.stream.persist(path)
+        else:
+            digest = self._copy_upload(upload.stream, path)
+        os.chmod(path, 0o444)
+        with open(path + DIGEST_SUFFIX, 'w') as f:
+            f.write(digest)
+        self.touch(dataset_id)
+        return path
+
+    def _copy_upload(self, stream, path):
+        """Copy a stream that was not parsed into a SpooledUpload to path in chunks, hashing it on the way."""
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(temp_path, 'wb') as f:
+                for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+                    size += len(chunk)
+                    if self.max_upload_bytes and size > self.max_upload_bytes:
+                        raise UploadTooLargeError(self.max_upload_bytes)
+                    digest.update(chunk)
+                    f.write(chunk)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return digest.hexdigest()
+
+    def has_uploads(self, dataset_id, *names):
+        try:
+            return all(os.path.exists(self.upload_path(dataset_id, name)) for name in names)
+        except ValueError:
+            return False
+
+    def save_frame(self, dataset_id, name, df):
+        os.makedirs(self.dataset_dir(dataset_id), exist_ok=True)
+        path = self._frame_path(dataset_id, name)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.reset_index(drop=True).to_feather(temp_path, compression='uncompressed')  # Compressed files cannot be mapped
+        os.replace(temp_path, path)
+        self.touch(dataset_id)
+
+    def load_frame(self, dataset_id, name, columns=None):
+        """
+        Map a stored frame, or only the given columns of it, into a DataFrame.
+
+        Columns used in place are read-only: copy() the frame before modifying it.
+        """
+        from pyarrow import feather  # Deferred so the routes can import the store without loading pandas
+
+        table = feather.read_table(self._frame_path(dataset_id, name), columns=columns, memory_map=True)
+        # One block per column keeps pandas from consolidating (copying) the mapped columns
+        df = table.to_pandas(split_blocks=True)
+        self.touch(dataset_id)
+        return df
+
+    def frame_columns(self, dataset_id, name):
+        """Column names of a stored frame, read from the file's schema without loading any rows."""
+        import pyarrow as pa
+
+        with pa.memory_map(self._frame_path(dataset_id, name)) as source:
+            return pa.ipc.open_file(source).schema.names
+
+    def save_state(self, dataset_id, text):
+        """Save the JSON text describing how the dataset's frames and results were computed."""
+        path = os.path.join(self.dataset_dir(dataset_id), STATE_FILE)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+    def load_state(self, dataset_id):
+        """The dataset's saved analysis state, or None if it has none."""
+        try:
+            with open(os.path.join(self.dataset_dir(dataset_id), STATE_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def derive_dataset(self, dataset_id, without):
+        """
+        Start a new dataset holding every file of dataset_id except the without upload, and return its ID.
+
+        Files are hard-linked (copied where links are not supported). Every later
+        write replaces a file rather than writing into it, so the two datasets
+        never change each other's data.
+        """
+        source_dir = self.dataset_dir(dataset_id)
+        new_id = self.new_dataset_id()
+        target_dir = self.dataset_dir(new_id)
+        os.makedirs(target_dir)
+        upload_name = os.path.basename(self.upload_path(dataset_id, without))
+        skipped = {upload_name, upload_name + DIGEST_SUFFIX}
+        for entry in os.scandir(source_dir):
+            if not entry.is_file() or entry.name in skipped or entry.name.endswith('.tmp'):
+                continue
+            target = os.path.join(target_dir, entry.name)
+            try:
+                os.link(entry.path, target)
+            except OSError:
+                shutil.copy2(entry.path, target)
+        self.touch(dataset_id)
+        self.touch(new_id)
+        return new_id
+
+    def has_frames(self, dataset_id, *names):
+        try:
+            return all(os.path.exists(self._frame_path(dataset_id, name)) for name in names)
+        except ValueError:
+            return False
+
+    def delete(self, dataset_id):
+        shutil.rmtree(self.dataset_dir(dataset_id), ignore_errors=True)
+
+    @staticmethod
+    def _dir_size(path):
+        total = 0
+        for entry in os.scandir(path):
+            try:
+                total += entry.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def sweep(self):
+        """Delete expired datasets, then evict the least recently used until the store fits; return how many were deleted."""
+        now = time.time()
+        deleted = 0
+        entries = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir() or entry.name == SPOOL_DIR_NAME:
+                continue
+            try:
+                last_used = entry.stat().st_mtime
+                size = self._dir_size(entry.path)
+            except FileNotFoundError:
+                continue
+            if now - last_used > self.ttl_seconds:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                deleted += 1
+            else:
+                entries.append((last_used, size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total_bytes -= size
+            deleted += 1
+
+        if deleted:
+            logger.info(f"Dataset store sweep deleted {deleted} dataset(s); {total_bytes / (1024 * 1024):.1f} MB remain")
+        self._sweep_spool(now)
+        return deleted
+
+    def _sweep_spool(self, now):
+        """Delete spilled uploads older than ttl_seconds, left behind by a process that died mid-request."""
+        try:
+            entries = list(os.scandir(self.spool_dir))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                if entry.name.endswith(SPOOL_SUFFIX) and now - entry.stat().st_mtime > self.ttl_seconds:
+                    os.remove(entry.path)
+                    logger.info(f"Dataset store sweep deleted the stale spilled upload {entry.name}")
+            except FileNotFoundError:
+                pass
+
+    def start_sweeper(self, interval=DEFAULT_SWEEP_INTERVAL):
+        """Run sweep() every interval seconds on a daemon thread (once per store)."""
+        if self._sweeper is not None:
+            return
+
+        def run():
+            while not self._stop_sweeper.wait(interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.warning(f"Dataset store sweep failed: {e}")
+
+        self._sweeper = threading.Thread(target=run, name='dataset-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop_sweeper.set()
+
+
+def stored_digest(file_path):
+    """The SHA-256 recorded when file_path was saved as an upload, or None if it has none."""
+    try:
+        with open(file_path + DIGEST_SUFFIX) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+_dataset_store = None
+_dataset_store_lock = threading.Lock()
+
+
+def get_dataset_store():
+    """Return the process-wide dataset store, configured from the Flask app when one is active."""
+    global _dataset_store
+    with _dataset_store_lock:
+        if _dataset_store is None:
+            config = current_app.config if has_app_context() else {}
+            _dataset_store = DatasetStore(
+                config.get('DATASET_STORE_DIR', DEFAULT_STORE_DIR),
+                config.get('DATASET_TTL_SECONDS', DEFAULT_TTL_SECONDS),
+                config.get('DATASET_STORE_MAX_BYTES', DEFAULT_MAX_BYTES),
+                config.get('MAX_UPLOAD_BYTES', DEFAULT_MAX_UPLOAD_BYTES),
+                config.get('UPLOAD_SPOOL_MEMORY_BYTES', DEFAULT_SPOOL_MEMORY_BYTES),
+            )
+            sweep_interval = config.get('DATASET_SWEEP_INTERVAL', DEFAULT_SWEEP_INTERVAL)
+            if sweep_interval:
+                _dataset_store.start_sweeper(sweep_interval)
+    return _dataset_store
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+# Compact dtype for each known column of the uploaded files; other columns keep the dtype they were read with.
+#   'category': repeated labels, stored once with a small integer code per row
+#   'integer':  whole numbers, as int32 when they fit (IDs are at most 9 digits), else int64
+#   'float32':  marks and percentages, which are given to at most 4 decimal places
+COLUMN_TYPES = {
+    'StudentID': 'integer',
+    'School Year': 'category',
+    'Roll Class': 'category',
+    'Class': 'category',
+    'Subject': 'category',
+    'Course': 'category',
+    'Class Time': 'integer',
+    'Absence Time': 'integer',
+    'Untallied Time': 'integer',
+    'Percentage': 'float32',
+    'T1': 'float32',
+    'T2': 'float32',
+    'T3': 'float32',
+    'T4': 'float32',
+    'T1Weight': 'float32',
+    'T2Weight': 'float32',
+    'T3Weight': 'float32',
+    'T4Weight': 'float32',
+    'FinalMark': 'float32',
+    'Final Mark z-Score': 'float32',
+}
+
+
+def _smallest_integer(values):
+    """values as int32 or int64, or unchanged if any are missing or not whole numbers."""
+    if values.isna().any():
+        return values
+    try:
+        as_int64 = values.astype(np.int64)
+    except (TypeError, ValueError):
+        return values
+    if not (as_int64 == values).all():
+        return values
+    info = np.iinfo(np.int32)
+    if as_int64.empty or (as_int64.min() >= info.min and as_int64.max() <= info.max):
+        return as_int64.astype(np.int32)
+    return as_int64
+
+
+def compact_dtypes(df, column_types=COLUMN_TYPES):
+    """
+    Return df with each column listed in column_types converted to its compact dtype.
+
+    Integer columns with missing values are left as they are, and columns whose
+    values cannot be converted keep their original dtype. Group by categorical
+    columns with observed=True so empty categories are not expanded into rows.
+    """
+    converted = {}
+    for column, kind in column_types.items():
+        if column not in df.columns:
+            continue
+        values = df[column]
+        try:
+            if kind == 'category' and not isinstance(values.dtype, pd.CategoricalDtype):
+                converted[column] = values.astype('category')
+            elif kind == 'integer' and values.dtype != np.int32:
+                converted[column] = _smallest_integer(values)
+            elif kind == 'float32' and values.dtype != np.float32:
+                converted[column] = pd.to_numeric(values, errors='raise').astype(np.float32)
+        except (TypeError, ValueError):
+            continue
+    return df.assign(**converted) if converted else df
+
+
+def frame_memory(df):
+    """Bytes held by df, including the Python strings in object columns."""
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def widen_floats(data):
+    """
+    Return a DataFrame or Series with its float32 columns as float64, for output.
+
+    Each value becomes the shortest decimal that round-trips through float32, so
+    a mark read as 97.78 is written as 97.78 rather than 97.77999877929688.
+    """
+    if isinstance(data, pd.Series):
+        if data.dtype != np.float32:
+            return data
+        return pd.Series(_widen(data.to_numpy()), index=data.index, name=data.name)
+    float32_columns = [column for column, dtype in data.dtypes.items() if dtype == np.float32]
+    if not float32_columns:
+        return data
+    return data.assign(**{str(column): _widen(data[column].to_numpy()) for column in float32_columns})
+
+
+def _widen(values):
+    # Marks and percentages repeat a lot, so only the distinct values go through their decimal text
+    uniques, inverse = np.unique(values, return_inverse=True)
+    return uniques.astype(str).astype(np.float64)[inverse]
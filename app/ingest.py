@@ -0,0 +1,109 @@
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from .dtypes import COLUMN_TYPES, compact_dtypes
+
+# Upload formats, told apart by their first bytes rather than the file name
+PARQUET_MAGIC = b'PAR1'
+XLSX_MAGIC = b'PK\x03\x04'  # A zip archive
+XLS_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'  # An OLE2 compound document
+SNIFF_BYTES = 4096
+
+# Rows parsed per CSV chunk; each chunk is compacted before the next is read
+CSV_CHUNK_ROWS = 100_000
+
+# Columns read from a Parquet file: every column the analysis knows, plus the student name
+PARQUET_COLUMNS = tuple(COLUMN_TYPES) + ('Student Name', 'StudentName')
+
+
+def detect_format(file_path):
+    """Return 'excel', 'parquet' or 'csv' from the first bytes of a file (see sniff_format)."""
+    with open(file_path, 'rb') as f:
+        return sniff_format(f.read(SNIFF_BYTES))
+
+
+def sniff_format(head):
+    """
+    Return 'excel', 'parquet' or 'csv' for a file starting with the bytes head.
+
+    Text that is neither of the binary formats is taken as CSV; anything else
+    (e.g. a PDF or an image) raises ValueError.
+    """
+    if head.startswith(PARQUET_MAGIC):
+        return 'parquet'
+    if head.startswith(XLSX_MAGIC) or head.startswith(XLS_MAGIC):
+        return 'excel'
+    if head and b'\x00' not in head:
+        try:
+            head.decode('utf-8')
+            return 'csv'
+        except UnicodeDecodeError as e:
+            # A chunk boundary can split a multi-byte character; anything earlier is a real decoding error
+            if e.start >= len(head) - 3:
+                return 'csv'
+    raise ValueError("Unrecognised file format. Please upload an Excel (.xlsx or .xls), CSV or Parquet file.")
+
+
+def read_excel_file(file_path):
+    try:
+        return pd.read_excel(file_path)
+    except Exception as e:
+        raise ValueError(f"Failed to read Excel file: {e}")
+
+
+def concat_chunks(chunks):
+    """Concatenate compacted chunks, merging each categorical column's categories so it stays categorical."""
+    if len(chunks) == 1:
+        return chunks[0]
+    for column, dtype in chunks[0].dtypes.items():
+        if not isinstance(dtype, pd.CategoricalDtype):
+            continue
+        if not all(isinstance(chunk[column].dtype, pd.CategoricalDtype) for chunk in chunks):
+            continue
+        categories = union_categoricals([chunk[column] for chunk in chunks]).categories
+        for chunk in chunks:
+            chunk[column] = chunk[column].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def read_csv_file(file_path, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Parse a CSV file chunk by chunk, compacting each chunk as it is read.
+
+    Only one chunk is ever held with Python string columns, so the peak memory
+    of a large export stays close to the size of its compacted frame. Integer
+    columns are narrowed once more at the end, as a chunk with a missing value
+    leaves its column as floats.
+    """
+    try:
+        chunks = [compact_dtypes(chunk) for chunk in pd.read_csv(file_path, chunksize=chunk_rows, encoding='utf-8-sig')]
+    except Exception as e:
+        raise ValueError(f"Failed to read CSV file: {e}")
+    if not chunks:
+        raise ValueError("Failed to read CSV file: it has no rows.")
+    return compact_dtypes(concat_chunks(chunks))
+
+
+def read_parquet_file(file_path, columns=PARQUET_COLUMNS):
+    """Read only the known columns of a Parquet file (all of them if it has none), with compact types."""
+    import pyarrow.parquet as pq
+
+    try:
+        available = pq.read_schema(file_path).names
+        wanted = [column for column in available if column in columns]
+        df = pq.read_table(file_path, columns=wanted or None).to_pandas()
+    except Exception as e:
+        raise ValueError(f"Failed to read Parquet file: {e}")
+    return compact_dtypes(df)
+
+
+READERS = {
+    'excel': read_excel_file,
+    'csv': read_csv_file,
+    'parquet': read_parquet_file,
+}
+
+
+def read_table_file(file_path):
+    """Parse an uploaded file with the reader for the format its content is in."""
+    return READERS[detect_format(file_path)](file_path)
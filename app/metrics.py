@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# One JSON object per measured stage, e.g. {"event": "stage", "stage": "...", "elapsed_ms": 12.5, ...}
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def peak_rss_bytes():
+    """The process's peak resident set size so far, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Bytes on macOS, kilobytes elsewhere
+
+
+def current_rss_bytes():
+    """The process's resident set size now, or None where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _mb(value):
+    return None if value is None else round(value / MB, 1)
+
+
+class StageMetrics:
+    """
+    Running totals for every measured stage in this process, served by /metrics.
+
+    Stages are grouped by their metric name (the stage name unless given one),
+    so stages named after a parameter value still add up to one entry. Stages
+    run by Celery workers are counted in the worker's process, not the web app's.
+    """
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def record(self, info):
+        with self._lock:
+            totals = self._stages.setdefault(info['metric'], {
+                'count': 0, 'errors': 0, 'wall_ms': 0.0, 'max_wall_ms': 0.0, 'cpu_ms': 0.0, 'rows': 0, 'peak_rss_mb': None,
+            })
+            totals['count'] += 1
+            totals['errors'] += info['status'] != 'ok'
+            totals['wall_ms'] = round(totals['wall_ms'] + info['elapsed_ms'], 1)
+            totals['max_wall_ms'] = max(totals['max_wall_ms'], info['elapsed_ms'])
+            totals['cpu_ms'] = round(totals['cpu_ms'] + info['cpu_ms'], 1)
+            totals['rows'] += info['rows'] or 0
+            if info['peak_rss_mb'] is not None:
+                totals['peak_rss_mb'] = max(totals['peak_rss_mb'] or 0, info['peak_rss_mb'])
+            totals['last'] = {key: info[key] for key in ('stage', 'elapsed_ms', 'cpu_ms', 'rows', 'rss_delta_mb', 'finished')}
+
+    def snapshot(self):
+        """Per-stage totals, with the average wall time, and the process's current and peak memory."""
+        with self._lock:
+            stages = {
+                metric: {**totals, 'mean_wall_ms': round(totals['wall_ms'] / totals['count'], 1)}
+                for metric, totals in sorted(self._stages.items())
+            }
+        return {
+            'process': {
+                'pid': os.getpid(),
+                'uptime_seconds': round(time.time() - self.started, 1),
+                'rss_mb': _mb(current_rss_bytes()),
+                'peak_rss_mb': _mb(peak_rss_bytes()),
+            },
+            'stages': stages,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+
+_stage_metrics = StageMetrics()
+
+
+def get_stage_metrics():
+    return _stage_metrics
+
+
+@contextmanager
+def measure_stage(name, metric=None, **fields):
+    """
+    Measure a block as a stage and yield its info dict; set info['rows'] inside the block.
+
+    Records wall time, the CPU time of the thread running it (work done in other
+    threads or processes is not included), the process's peak RSS when it ends
+    and how much the RSS changed across it. The result is logged as one JSON line
+    and added to get_stage_metrics(), also when the block raises (with status
+    'error'). fields are added to the info, e.g. the parent stage.
+    """
+    info = {'stage': name, 'metric': metric or name, 'rows': None, **fields}
+    rss_before = current_rss_bytes()
+    start_wall, start_cpu = time.perf_counter(), time.thread_time()
+    status = 'error'
+    try:
+        yield info
+        status = 'ok'
+    finally:
+        rss_after = current_rss_bytes()
+        info.update(
+            status=status,
+            elapsed_ms=round((time.perf_counter() - start_wall) * 1000, 1),
+            cpu_ms=round((time.thread_time() - start_cpu) * 1000, 1),
+            peak_rss_mb=_mb(peak_rss_bytes()),
+            rss_delta_mb=_mb(rss_after - rss_before) if rss_before is not None and rss_after is not None else None,
+            finished=round(time.time(), 3),
+        )
+        _stage_metrics.record(info)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({'event': 'stage', **info}, default=str))
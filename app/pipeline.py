@@ -0,0 +1,255 @@
+import hashlib
+import json
+import threading
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from flask import current_app, has_app_context
+
+from .progress import ProgressReporter
+
+DEFAULT_PIPELINE_WORKERS = 4
+
+
+class Stage:
+    """
+    One named step of a Pipeline.
+
+    func is called with the stage's inputs and params as keyword arguments and
+    returns its output, or a tuple with one value per output when it has
+    several. It must not modify its inputs: stages sharing an input can run at
+    the same time.
+
+    label names the stage in progress events and may refer to params, e.g.
+    "Identifying high Z-scores above threshold {high_marks_threshold}".
+    message, if given, is called with the outputs and returns a line (or a list
+    of lines) to log after the stage has run.
+
+    Outputs are memoized unless memoize is False, which suits stages that are
+    cheap or whose outputs cannot be stored (e.g. a chart being rendered).
+    fingerprint, if given, hashes an output from its value rather than from the
+    stage's inputs, so stages using it only re-run when it really changed; a
+    stage with a fingerprint is not memoized.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=None, params=(), label=None, message=None, memoize=True, fingerprint=None):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs or (name,))
+        self.params = tuple(params)
+        self.label = label or name
+        self.message = message
+        self.memoize = memoize and fingerprint is None
+        self.fingerprint = fingerprint
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+
+def hash_parts(*parts):
+    """SHA-256 of JSON-encoded parts; the key an output is memoized under."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def count_rows(values):
+    """Rows produced by a stage: the total length of its outputs that have one, or None."""
+    lengths = [len(value) for value in values if hasattr(value, '__len__') and not isinstance(value, (str, dict))]
+    return sum(lengths) if lengths else None
+
+
+class Pipeline:
+    """
+    A set of stages wired together by the names of their inputs and outputs.
+
+    An input is either a source passed to run() or the output of another stage,
+    so the stages form a graph that run() walks in dependency order, running
+    stages whose inputs are ready concurrently. Each output is keyed by a hash
+    of its stage, its inputs' keys and its params, so with a memo a stage whose
+    inputs and params are unchanged is not run at all and its stored outputs
+    are used instead. Adding a stage therefore neither slows down nor re-runs
+    the stages it does not depend on.
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.producers = {}
+        for stage in self.stages:
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError(f"Output '{output}' is produced by both {self.producers[output]!r} and {stage!r}.")
+                self.producers[output] = stage
+
+    def required_stages(self, targets):
+        """The stages needed to produce targets, in the order they were declared."""
+        unknown = [target for target in targets if target not in self.producers]
+        if unknown:
+            raise ValueError(f"No stage produces: {', '.join(unknown)}")
+        required = set()
+        pending = [self.producers[target] for target in targets]
+        while pending:
+            stage = pending.pop()
+            if stage.name in required:
+                continue
+            required.add(stage.name)
+            pending.extend(self.producers[name] for name in stage.inputs if name in self.producers)
+        return [stage for stage in self.stages if stage.name in required]
+
+    def run(self, sources, params, targets=None, source_keys=None, memo=None, reporter=None, executor=None):
+        """
+        Produce targets (every output by default) and return them as a dict.
+
+        sources maps each input no stage produces to its value, and source_keys
+        to a hash of its content (e.g. an uploaded file's digest); a source
+        without a key is hashed from its text, which suits parameters but not
+        file paths. memo (see DatasetStageMemo) holds outputs from earlier
+        runs. Stages run on executor, or the shared stage pool.
+        """
+        reporter = reporter or ProgressReporter()
+        executor = executor or get_stage_executor()
+        targets = list(targets or self.producers)
+        stages = self.required_stages(targets)
+        source_keys = dict(source_keys or {})
+        app = current_app._get_current_object() if has_app_context() else None
+
+        # Outputs consumed by another required stage, or asked for; the others need not be stored or loaded
+        wanted = set(targets) | {name for stage in stages for name in stage.inputs}
+        missing = [name for name in wanted if name not in self.producers and name not in sources]
+        if missing:
+            raise ValueError(f"Missing pipeline source(s): {', '.join(missing)}")
+
+        keys = {name: source_keys.get(name) or hash_parts(name, sources[name]) for name in wanted if name not in self.producers}
+        values = dict(sources)
+        pending = list(stages)
+        running = {}
+
+        def value_of(name):
+            if name not in values:
+                values[name] = memo.load(name)
+            return values[name]
+
+        def execute(stage, inputs, key):
+            with app.app_context() if app is not None else nullcontext():
+                with reporter.stage(stage.label.format(**params), metric=stage.name) as info:
+                    result = stage.func(**inputs, **{name: params[name] for name in stage.params})
+                    outputs = result if len(stage.outputs) > 1 else (result,)
+                    info['rows'] = count_rows(outputs)
+                    if memo is not None and stage.memoize:
+                        for name, value in zip(stage.outputs, outputs):
+                            if name in wanted:
+                                memo.save(name, key, value)
+                output_keys = {
+                    name: hash_parts(stage.name, stage.fingerprint(value)) if stage.fingerprint else key
+                    for name, value in zip(stage.outputs, outputs)
+                }
+                return dict(zip(stage.outputs, outputs)), output_keys
+
+        try:
+            while pending or running:
+                reporter.check_cancelled()
+                for stage in list(pending):
+                    if not all(name in keys for name in stage.inputs):
+                        continue
+                    pending.remove(stage)
+                    key = hash_parts(stage.name, stage.func.__qualname__, [keys[name] for name in stage.inputs],
+                                     {name: params[name] for name in stage.params})
+                    stored = [name for name in stage.outputs if name in wanted]
+                    if memo is not None and stage.memoize and all(memo.has(name, key) for name in stored):
+                        reporter.log(f"Reusing the result of '{stage.label.format(**params)}': its inputs are unchanged.")
+                        keys.update((name, key) for name in stage.outputs)
+                        continue
+                    inputs = {name: value_of(name) for name in stage.inputs}
+                    running[executor.submit(execute, stage, inputs, key)] = stage
+
+                if not running:
+                    if pending:
+                        raise ValueError(f"Pipeline stages can never run: {', '.join(stage.name for stage in pending)}")
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    outputs, output_keys = future.result()
+                    values.update(outputs)
+                    keys.update(output_keys)
+                    if stage.message:
+                        lines = stage.message(*(outputs[name] for name in stage.outputs))
+                        for line in [lines] if isinstance(lines, str) else lines or ():
+                            reporter.log(line)
+        except BaseException:
+            for future in running:
+                future.cancel()
+            raise
+
+        if memo is not None:
+            memo.commit()
+        return {name: value_of(name) for name in targets}
+
+
+class DatasetStageMemo:
+    """
+    Stage outputs stored with a dataset, for Pipeline.run.
+
+    DataFrames are saved as the dataset's frames (named by frame_names, or
+    stage_<output>) and other outputs as JSON in the dataset's analysis state,
+    next to the key each was computed under. A JSON output comes back in its
+    JSON form, so only final results should be stored that way. The state is
+    written once the run has finished.
+    """
+
+    def __init__(self, store, dataset_id, frame_names=None):
+        self.store = store
+        self.dataset_id = dataset_id
+        self.frame_names = frame_names or {}
+        state = store.load_state(dataset_id) or {}
+        self.keys = state.get('keys', {})
+        self.values = state.get('values', {})
+        self._lock = threading.Lock()
+
+    def frame_name(self, name):
+        return self.frame_names.get(name, f"stage_{name}")
+
+    def has(self, name, key):
+        if self.keys.get(name) != key:
+            return False
+        return name in self.values or self.store.has_frames(self.dataset_id, self.frame_name(name))
+
+    def load(self, name):
+        if name in self.values:
+            return self.values[name]
+        return self.store.load_frame(self.dataset_id, self.frame_name(name))
+
+    def save(self, name, key, value):
+        import pandas as pd
+
+        from .utils import to_json
+
+        if isinstance(value, pd.DataFrame):
+            self.store.save_frame(self.dataset_id, self.frame_name(name), value)
+            with self._lock:
+                self.values.pop(name, None)
+                self.keys[name] = key
+        else:
+            stored = json.loads(to_json(value))
+            with self._lock:
+                self.values[name] = stored
+                self.keys[name] = key
+
+    def commit(self):
+        with self._lock:
+            text = json.dumps({'keys': self.keys, 'values': self.values})
+        self.store.save_state(self.dataset_id, text)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_stage_executor():
+    """The thread pool pipeline stages run on, sized by PIPELINE_WORKERS."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            config = current_app.config if has_app_context() else {}
+            max_workers = config.get('PIPELINE_WORKERS', DEFAULT_PIPELINE_WORKERS)
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pipeline')
+    return _executor
@@ -0,0 +1,163 @@
+import json
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app
+
+from .metrics import measure_stage
+from .utils import to_json
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_SECONDS = 15
+DEFAULT_ANALYSIS_WORKERS = 2
+
+
+class AnalysisCancelled(Exception):
+    """Raised inside a worker when the client that requested the job has gone away."""
+
+
+def format_sse(event_type, data):
+    return f"event: {event_type}\ndata: {data}\n\n"
+
+
+class ProgressReporter:
+    """
+    Collects progress from a running analysis.
+
+    Log lines and per-stage measurements (see metrics.measure_stage) are pushed
+    onto events (a queue drained by the streaming response) as (event_type,
+    data) pairs. Every log line and stage start checks cancel_event, so a
+    cancelled job stops at the next stage boundary. Without a queue the reporter
+    only tracks cancellation.
+    """
+
+    def __init__(self, events=None, cancel_event=None):
+        self.events = events
+        self.cancel_event = cancel_event or threading.Event()
+
+    def emit(self, event_type, data):
+        if self.events is not None:
+            self.events.put((event_type, data))
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise AnalysisCancelled()
+
+    def log(self, message):
+        self.check_cancelled()
+        self.emit('log', message)
+
+    @contextmanager
+    def stage(self, name, metric=None, parent=None):
+        """
+        Measure a named stage; set info['rows'] inside the block to report how many rows it produced.
+
+        metric groups the stage in /metrics when its name varies (e.g. holds a
+        threshold). Substages started inside the block are reported with this
+        stage as their parent.
+        """
+        if parent is None:
+            self.log(f"{name}...")
+        else:
+            self.check_cancelled()
+        with measure_stage(name, metric, parent=parent) as info:
+            token = _current_stage.set((self, name))
+            try:
+                yield info
+            finally:
+                _current_stage.reset(token)
+        self.emit('stage', json.dumps(info))
+
+
+# The reporter (None outside a streamed job) and stage running in this thread, so helpers deep inside a stage can report substages
+_current_stage = ContextVar('current_stage', default=None)
+
+
+@contextmanager
+def substage(name, metric=None):
+    """
+    Measure part of the running stage, reported to the same client with that stage as its parent.
+
+    Outside a reporter's stage (e.g. building a report for /download_report) the
+    part is still logged and counted in /metrics, and parts measured inside it
+    name it as their parent.
+    """
+    reporter, parent = _current_stage.get() or (None, None)
+    if reporter is not None:
+        with reporter.stage(name, metric, parent=parent) as info:
+            yield info
+        return
+    with measure_stage(name, metric, parent=parent) as info:
+        token = _current_stage.set((None, name))
+        try:
+            yield info
+        finally:
+            _current_stage.reset(token)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_analysis_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            max_workers = current_app.config.get('ANALYSIS_WORKERS', DEFAULT_ANALYSIS_WORKERS)
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis')
+    return _executor
+
+
+def stream_job_events(job, *args, **kwargs):
+    """
+    Run job(*args, reporter=..., **kwargs) on the analysis worker pool and return
+    a generator of server-sent events: its log and stage events as they happen,
+    then a single 'result' (the job's return value as JSON) or 'error' event.
+
+    Closing the generator early (the client disconnected) cancels the job.
+    """
+    app = current_app._get_current_object()
+    executor = get_analysis_executor()
+    return _drain_job_events(app, executor, job, args, kwargs)
+
+
+def _drain_job_events(app, executor, job, args, kwargs):
+    events = queue.Queue()
+    reporter = ProgressReporter(events)
+
+    def run():
+        with app.app_context():
+            try:
+                # The whole job, logged and counted in /metrics under the job's name
+                with measure_stage(job.__name__):
+                    result = job(*args, reporter=reporter, **kwargs)
+                    with reporter.stage('Serializing results', metric='serialize_results') as info:
+                        payload = to_json(result)
+                        info['rows'] = len(payload)
+                reporter.emit('result', payload)
+            except AnalysisCancelled:
+                logger.info("Analysis cancelled: the client disconnected.")
+            except Exception as e:
+                logger.exception(f"An error occurred during analysis: {e}")
+                reporter.emit('error', json.dumps({'error': f"An error occurred during analysis: {e}"}))
+            finally:
+                events.put(None)
+
+    executor.submit(run)
+    try:
+        while True:
+            try:
+                event = events.get(timeout=KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ": keep-alive\n\n"  # Comment line; lets the server notice a dropped connection
+                continue
+            if event is None:
+                break
+            yield format_sse(*event)
+    finally:
+        reporter.cancel_event.set()
@@ -2,204 +2,447 @@ from docx import Document
 from docx.shared import Inches
 import docx.shared
 import io
+import os
+import re
+import zipfile
 import pandas as pd
 import datetime
-import docx.oxml
-from docx.enum.style import WD_STYLE_TYPE
-from docx.shared import Pt
-from docx.oxml.ns import nsdecls, qn
-from docx.oxml import parse_xml, OxmlElement 
-
-def set_table_borders(table):
-    tbl = table._tbl
-    tbl.attrib[qn('w:tblBorders')] = ''
-    for cell in tbl.iter_tcs():
-        tcPr = cell.tcPr
-        tcBorders = OxmlElement('w:tcBorders')
-        top = OxmlElement('w:top')
-        top.set(qn('w:val'), 'single')
-        top.set(qn('w:sz'), '4')
-        top.set(qn('w:space'), '0')
-        top.set(qn('w:color'), 'auto')
-        tcBorders.append(top)
-
-        left = OxmlElement('w:left')
-        left.set(qn('w:val'), 'single')
-        left.set(qn('w:sz'), '4')
-        left.set(qn('w:space'), '0')
-        left.set(qn('w:color'), 'auto')
-        tcBorders.append(left)
-
-        bottom = OxmlElement('w:bottom')
-        bottom.set(qn('w:val'), 'single')
-        bottom.set(qn('w:sz'), '4')
-        bottom.set(qn('w:space'), '0')
-        bottom.set(qn('w:color'), 'auto')
-        tcBorders.append(bottom)
-
-        right = OxmlElement('w:right')
-        right.set(qn('w:val'), 'single')
-        right.set(qn('w:sz'), '4')
-        right.set(qn('w:space'), '0')
-        right.set(qn('w:color'), 'auto')
-        tcBorders.append(right)
-
-        tcPr.append(tcBorders)
-
-def generate_student_report(marks_df, student_ids, attendance_df=None, overall_attendance=None):
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from lxml import etree
+from .analysis import read_upload, standardize_marks
+from .class_mapping import ClassSubjectResolver
+from .dtypes import compact_dtypes, widen_floats
+from .progress import substage
+
+logger = logging.getLogger(__name__)
+
+LOGO_PATH = os.path.join(os.path.dirname(__file__), 'static', 'images', 'st-mary-logo.png')
+
+# One table style gives every report table its borders, instead of border XML on each cell
+REPORT_TABLE_STYLE = 'Table Grid'
+
+# Students rendered into each scratch document before it is merged into the report
+STUDENTS_PER_CHUNK = 25
+
+# Characters kept when a student's name is used in a file name inside the report archive
+UNSAFE_FILENAME_CHARS = re.compile(r'[^0-9A-Za-z._ -]+')
+
+# Dictionary to map long subject names to their shortened versions
+SUBJECT_NAME_MAPPING = {
+    'Community & Family Studies': 'CAFS',
+    'Earth & Environmental Science': 'Earth & Env. Sci.',
+    'English Extension 1': 'Eng Ext 1',
+    'English Standard': 'Eng Std',
+    'Information Processes & Technology': 'IPT',
+    'Mathematics Advanced': 'Math Adv',
+    'Mathematics Extension 1': 'Math Ext 1',
+    'Mathematics Standard 2': 'Math Std 2',
+    'Software Design & Development': 'SDD'
+}
+
+
+def build_report_template(logo_bytes):
+    """
+    Return the bytes of an empty report document with the school logo already embedded.
+
+    Every student section is rendered into a document opened from this template, so the
+    logo image part (and its relationship ID) is shared and stored only once in the output.
+    """
     document = Document()
-    print(f"Number of student IDs: {len(student_ids)}")  # Debugging statement
+    document.part.get_or_add_image(io.BytesIO(logo_bytes))
+    template = io.BytesIO()
+    document.save(template)
+    return template.getvalue()
 
-    # Get the current year
-    current_year = datetime.datetime.now().year
 
-    
-
-    # Dictionary to map long subject names to their shortened versions
-    subject_name_mapping = {
-        'Community & Family Studies': 'CAFS',
-        'Earth & Environmental Science': 'Earth & Env. Sci.',
-        'English Extension 1': 'Eng Ext 1',
-        'English Standard': 'Eng Std',
-        'Information Processes & Technology': 'IPT',
-        'Mathematics Advanced': 'Math Adv',
-        'Mathematics Extension 1': 'Math Ext 1',
-        'Mathematics Standard 2': 'Math Std 2',
-        'Software Design & Development': 'SDD'
-    }
+def build_student_payloads(marks_df, student_ids, attendance_df=None, overall_attendance=None):
+    """Split the report data into one plain-dict payload per student using a single groupby pass per frame."""
+    marks_by_student = {student_id: rows for student_id, rows in marks_df.groupby('StudentID', sort=False)}
+    attendance_by_student = {}
+    if attendance_df is not None:
+        attendance_by_student = {student_id: rows for student_id, rows in attendance_df.groupby('StudentID', sort=False)}
+    overall_by_student = {}
+    if overall_attendance is not None:
+        overall_by_student = dict(zip(overall_attendance['StudentID'], overall_attendance['AttendancePercentage']))
 
+    payloads = []
     for student_id in student_ids:
-        print(f"Generating report for student ID: {student_id}")  # Debugging statement
-        student_marks_data = marks_df[marks_df['StudentID'] == student_id]
-        print(f"Number of subjects for student {student_id}: {len(student_marks_data)}")  # Debugging statement
+        student_marks_data = marks_by_student.get(student_id, marks_df.iloc[0:0])
+        student_attendance_data = attendance_by_student.get(student_id)
 
         # Check if 'Student Name' exists and is not empty, otherwise use 'StudentID'
-        if 'Student Name' in student_marks_data.columns and not pd.isnull(student_marks_data['Student Name'].values[0]):
+        if 'Student Name' in student_marks_data.columns and len(student_marks_data) and not pd.isnull(student_marks_data['Student Name'].values[0]):
             student_identifier = student_marks_data['Student Name'].values[0]
         else:
             student_identifier = str(student_id)
 
-        # Create a table with one row and two cells
-        header_table = document.add_table(rows=1, cols=2)
-        header_table.autofit = False
-        header_table.allow_autofit = False
-        header_table.columns[0].width = Inches(1.5)
-        header_table.columns[1].width = Inches(6)
-
-        # Add the school logo to the left cell
-        left_cell = header_table.cell(0, 0)
-        left_cell.width = Inches(1.5)
-        para = left_cell.paragraphs[0]
-        run = para.add_run()
-        run.add_picture('/Users/Sam/Desktop/New schools data analysis/app/static/images/st-mary-logo.png', width=Inches(1.2))
-
-        # Add the school name and program name to the right cell
-        right_cell = header_table.cell(0, 1)
-        para = right_cell.paragraphs[0]
-        run = para.add_run('St Marys Senior High School\n')
-        run.bold = True
-        run.font.size = docx.shared.Pt(14)
-        para.alignment = docx.enum.text.WD_ALIGN_PARAGRAPH.CENTER
-
-        para = right_cell.add_paragraph('ACADEMIC IMPROVEMENT PROGRAM')
-        para.alignment = docx.enum.text.WD_ALIGN_PARAGRAPH.CENTER
-
-        # Add the student's identifier, date, and school year
-        if attendance_df is not None:
-            school_year = attendance_df[attendance_df['StudentID'] == student_id]['School Year'].values[0]
-        
+        if student_attendance_data is not None and len(student_attendance_data):
+            school_year = student_attendance_data['School Year'].values[0]
         else:
             school_year = 'N/A'
-        student_info = f"{student_identifier} - {datetime.datetime.now().strftime('%d %B %Y')} - Year {school_year}"
-        document.add_heading(student_info, level=1)
-
-        # Academic Results Section
-        document.add_heading(f'Academic Results {current_year}:', level=2)
-
-        # Check if any student has Term 4 data
-        has_term_4_data = False
-        for _, row in student_marks_data.iterrows():
-            if 'T4' in row and not pd.isnull(row['T4']):
-                has_term_4_data = True
-                break
-
-        # Determine the number of columns based on Term 4 data availability
-        num_columns = 7 if has_term_4_data else 6
-        academic_results_table = document.add_table(rows=1, cols=num_columns)
-
-        # Set column widths
-        academic_results_table.columns[0].width = Inches(2.1)  # Subject column
-        for i in range(1, num_columns):
-            academic_results_table.columns[i].width = Inches(1.0)  # Other columns
-
-        hdr_cells = academic_results_table.rows[0].cells
-        hdr_cells[0].text = 'Subject'
-        hdr_cells[1].text = 'Term 1 Mark'
-        hdr_cells[2].text = 'Term 2 Mark'
-        hdr_cells[3].text = 'Term 3 Mark'
+
+        payloads.append({
+            'student_id': student_id,
+            'identifier': student_identifier,
+            'school_year': school_year,
+            'marks': student_marks_data.to_dict(orient='records'),
+            'attendance': [] if student_attendance_data is None else student_attendance_data[['Subject', 'AttendancePercentage']].to_dict(orient='records'),
+            'overall_attendance': overall_by_student.get(student_id),
+        })
+    return payloads
+
+
+def render_student_section(document, payload, logo_bytes, current_year, report_date, page_break=False):
+    """Append one student's report (header, results, attendance and sign-off) to document."""
+    logger.debug("Generating report for student ID: %s", payload['student_id'])
+
+    # Create a table with one row and two cells
+    header_table = document.add_table(rows=1, cols=2)
+    header_table.autofit = False
+    header_table.allow_autofit = False
+    header_table.columns[0].width = Inches(1.5)
+    header_table.columns[1].width = Inches(6)
+
+    # Add the school logo to the left cell (the image part is shared through the template)
+    left_cell = header_table.cell(0, 0)
+    left_cell.width = Inches(1.5)
+    para = left_cell.paragraphs[0]
+    run = para.add_run()
+    run.add_picture(io.BytesIO(logo_bytes), width=Inches(1.2))
+
+    # Add the school name and program name to the right cell
+    right_cell = header_table.cell(0, 1)
+    para = right_cell.paragraphs[0]
+    run = para.add_run('St Marys Senior High School\n')
+    run.bold = True
+    run.font.size = docx.shared.Pt(14)
+    para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    para = right_cell.add_paragraph('ACADEMIC IMPROVEMENT PROGRAM')
+    para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    # Add the student's identifier, date, and school year
+    student_info = f"{payload['identifier']} - {report_date} - Year {payload['school_year']}"
+    document.add_heading(student_info, level=1)
+
+    # Academic Results Section
+    document.add_heading(f'Academic Results {current_year}:', level=2)
+
+    # Check if the student has Term 4 data
+    marks = payload['marks']
+    has_term_4_data = any('T4' in row and not pd.isnull(row['T4']) for row in marks)
+
+    # Determine the number of columns based on Term 4 data availability
+    num_columns = 7 if has_term_4_data else 6
+    academic_results_table = document.add_table(rows=1, cols=num_columns)
+    academic_results_table.style = REPORT_TABLE_STYLE
+
+    # Set column widths
+    academic_results_table.columns[0].width = Inches(2.1)  # Subject column
+    for i in range(1, num_columns):
+        academic_results_table.columns[i].width = Inches(1.0)  # Other columns
+
+    hdr_cells = academic_results_table.rows[0].cells
+    hdr_cells[0].text = 'Subject'
+    hdr_cells[1].text = 'Term 1 Mark'
+    hdr_cells[2].text = 'Term 2 Mark'
+    hdr_cells[3].text = 'Term 3 Mark'
+    if has_term_4_data:
+        hdr_cells[4].text = 'Term 4 Mark'
+        hdr_cells[5].text = 'Final Mark'
+        hdr_cells[6].text = 'Final z-Score'
+    else:
+        hdr_cells[4].text = 'Final Mark'
+        hdr_cells[5].text = 'Final z-Score'
+
+    for row in marks:
+        row_cells = academic_results_table.add_row().cells
+        subject = row['Subject']
+        if subject in SUBJECT_NAME_MAPPING:
+            subject = SUBJECT_NAME_MAPPING[subject]
+        row_cells[0].text = subject
+        row_cells[1].text = f"{row['T1']}%" if not pd.isnull(row['T1']) else '-'
+        row_cells[2].text = f"{row['T2']}%" if not pd.isnull(row['T2']) else '-'
+        row_cells[3].text = f"{row['T3']}%" if not pd.isnull(row['T3']) else '-'
         if has_term_4_data:
-            hdr_cells[4].text = 'Term 4 Mark'
-            hdr_cells[5].text = 'Final Mark'
-            hdr_cells[6].text = 'Final z-Score'
+            row_cells[4].text = f"{row['T4']}%" if 'T4' in row and not pd.isnull(row['T4']) else '-'
+            row_cells[5].text = f"{row['CalculatedFinalMark']}%"
+            row_cells[6].text = str(row['zScore'])
         else:
-            hdr_cells[4].text = 'Final Mark'
-            hdr_cells[5].text = 'Final z-Score'
-
-        for _, row in student_marks_data.iterrows():
-            row_cells = academic_results_table.add_row().cells
-            subject = row['Subject']
-            if subject in subject_name_mapping:
-                subject = subject_name_mapping[subject]
-            row_cells[0].text = subject
-            row_cells[1].text = f"{row['T1']}%" if not pd.isnull(row['T1']) else '-'
-            row_cells[2].text = f"{row['T2']}%" if not pd.isnull(row['T2']) else '-'
-            row_cells[3].text = f"{row['T3']}%" if not pd.isnull(row['T3']) else '-'
-            if has_term_4_data:
-                row_cells[4].text = f"{row['T4']}%" if 'T4' in row and not pd.isnull(row['T4']) else '-'
-                row_cells[5].text = f"{row['CalculatedFinalMark']}%"
-                row_cells[6].text = str(row['zScore'])
-            else:
-                row_cells[4].text = f"{row['CalculatedFinalMark']}%"
-                row_cells[5].text = str(row['zScore'])
-
-        set_table_borders(academic_results_table)
-
-        # Attendance Section
-        document.add_heading(f'Attendance {current_year}:', level=2)
-        attendance_table = document.add_table(rows=1, cols=2)
-
-        hdr_cells = attendance_table.rows[0].cells
-        hdr_cells[0].text = 'Overall Attendance'
-        hdr_cells[1].text = 'Percentage'
-
-        if overall_attendance is not None:
-            student_overall_attendance = overall_attendance[overall_attendance['StudentID'] == student_id]['AttendancePercentage'].values[0]
-            overall_attendance_row = attendance_table.add_row().cells
-            overall_attendance_row[0].text = 'Overall Attendance'
-            overall_attendance_row[1].text = f"{str(student_overall_attendance)}%"
-
-        if attendance_df is not None:
-            student_attendance_data = attendance_df[attendance_df['StudentID'] == student_id]
-            for _, row in student_attendance_data.iterrows():
-                subject = row['Subject']
-                attendance_percentage = row['AttendancePercentage']
-                new_row = attendance_table.add_row().cells
-                new_row[0].text = subject
-                new_row[1].text = f"{str(attendance_percentage)}%"
-
-        set_table_borders(attendance_table)
-
-        # Deputy Principal Sign Off
-        document.add_paragraph(" ")
-        document.add_paragraph("Deputy Principal Sign Off: ___________________________")
-
-        # Add a page break before the next student's report, if there are more students
-        if student_id != student_ids[-1]:
-            document.add_page_break()
-
-    print("Report generation completed")  # Debugging statement
+            row_cells[4].text = f"{row['CalculatedFinalMark']}%"
+            row_cells[5].text = str(row['zScore'])
+
+    # Attendance Section
+    document.add_heading(f'Attendance {current_year}:', level=2)
+    attendance_table = document.add_table(rows=1, cols=2)
+    attendance_table.style = REPORT_TABLE_STYLE
+
+    hdr_cells = attendance_table.rows[0].cells
+    hdr_cells[0].text = 'Overall Attendance'
+    hdr_cells[1].text = 'Percentage'
+
+    if payload['overall_attendance'] is not None:
+        overall_attendance_row = attendance_table.add_row().cells
+        overall_attendance_row[0].text = 'Overall Attendance'
+        overall_attendance_row[1].text = f"{str(payload['overall_attendance'])}%"
+
+    for row in payload['attendance']:
+        new_row = attendance_table.add_row().cells
+        new_row[0].text = str(row['Subject'])
+        new_row[1].text = f"{str(row['AttendancePercentage'])}%"
+
+    # Deputy Principal Sign Off
+    document.add_paragraph(" ")
+    document.add_paragraph("Deputy Principal Sign Off: ___________________________")
+
+    # Add a page break before the next student's report, if there are more students
+    if page_break:
+        document.add_page_break()
+
+
+def body_elements(document):
+    """The block-level elements of a document's body, excluding its section properties."""
+    return [child for child in document.element.body.iterchildren() if child.tag != qn('w:sectPr')]
+
+
+def _render_sections_xml(template_bytes, logo_bytes, payloads, current_year, report_date):
+    """Render a chunk of students into a document opened from the template and return its body XML."""
+    document = Document(io.BytesIO(template_bytes))
+    for payload in payloads:
+        render_student_section(document, payload, logo_bytes, current_year, report_date, page_break=payload['page_break'])
+    return [etree.tostring(element) for element in body_elements(document)]
+
+
+_report_executor = None
+_report_executor_lock = threading.Lock()
+
+
+def get_report_executor(max_workers):
+    """
+    The process pool report chunks are rendered on, started with max_workers processes on first use.
+
+    Its processes are spawned rather than forked: a fork of the server copies
+    locks held by its chart, pipeline and dataset sweeper threads, which can
+    deadlock the child. Started once, the pool's start-up is not paid per report.
+    """
+    global _report_executor
+    with _report_executor_lock:
+        if _report_executor is None:
+            _report_executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+    return _report_executor
+
+
+def generate_student_report(marks_df, student_ids, attendance_df=None, overall_attendance=None, workers=None):
+    """
+    Build one Word document with a report section for each student in student_ids.
+
+    Students are rendered in chunks, each into a small document opened from the shared
+    template (python-docx slows down as a document grows), and the chunks' body XML is
+    merged in order into one document opened from the same template. With workers > 1
+    the chunks are rendered in the shared report process pool (see get_report_executor).
+    """
+    student_ids = list(student_ids)
+    logger.debug("Number of student IDs: %d", len(student_ids))
+
+    # Get the current year
+    current_year = datetime.datetime.now().year
+    report_date = datetime.datetime.now().strftime('%d %B %Y')
+
+    with open(LOGO_PATH, 'rb') as logo_file:
+        logo_bytes = logo_file.read()
+    template_bytes = build_report_template(logo_bytes)
+
+    with substage("Building student payloads", metric='report.payloads') as info:
+        payloads = build_student_payloads(marks_df, student_ids, attendance_df, overall_attendance)
+        info['rows'] = len(payloads)
+    for position, payload in enumerate(payloads):
+        payload['page_break'] = position < len(payloads) - 1
+    chunks = [payloads[i:i + STUDENTS_PER_CHUNK] for i in range(0, len(payloads), STUDENTS_PER_CHUNK)]
+    render_args = (template_bytes, logo_bytes)
+
+    # With a process pool the CPU time is spent in the workers, so only the wall time here is meaningful
+    workers = workers or 1
+    with substage("Rendering student sections", metric='report.render') as info:
+        if workers > 1 and len(chunks) > 1:
+            executor = get_report_executor(workers)
+            rendered_chunks = list(executor.map(_render_sections_xml, *zip(*[render_args + (chunk, current_year, report_date) for chunk in chunks])))
+        else:
+            rendered_chunks = [_render_sections_xml(*render_args, chunk, current_year, report_date) for chunk in chunks]
+        info['rows'] = len(payloads)
+
+    with substage("Merging student sections", metric='report.merge') as info:
+        document = Document(io.BytesIO(template_bytes))
+        section_properties = document.element.body.sectPr
+        for rendered in rendered_chunks:
+            for xml in rendered:
+                section_properties.addprevious(parse_xml(xml))
+
+        # Each chunk numbered its drawings from 1; drawing IDs must be unique within the document
+        for shape_id, doc_pr in enumerate(document.element.body.iter(qn('wp:docPr')), start=1):
+            doc_pr.set('id', str(shape_id))
+        info['rows'] = len(rendered_chunks)
+
     # Save the document to a BytesIO object and return it
-    file_stream = io.BytesIO()
-    document.save(file_stream)
-    file_stream.seek(0)
-    return file_stream
\ No newline at end of file
+    with substage("Saving report", metric='report.save'):
+        file_stream = io.BytesIO()
+        document.save(file_stream)
+        file_stream.seek(0)
+    logger.debug("Report generation completed")
+    return file_stream
+
+
+class ZipStreamBuffer:
+    """
+    Write-only file object for zipfile.ZipFile that hands out what has been written so far.
+
+    It has no tell() or seek(), so ZipFile writes entries with data descriptors and never
+    goes back over earlier output, which lets each entry be sent as soon as it is written.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def student_report_filename(payload):
+    name = UNSAFE_FILENAME_CHARS.sub('', str(payload['identifier'])).strip() or str(payload['student_id'])
+    if name == str(payload['student_id']):
+        return f"{name}.docx"
+    return f"{name} - {payload['student_id']}.docx"
+
+
+def iter_student_report_archive(marks_df, student_ids, attendance_df=None, overall_attendance=None):
+    """
+    Yield a ZIP archive with one Word report per student, in pieces as each report is rendered.
+
+    Only one student's document is held in memory at a time. The reports are already
+    compressed .docx files, so they are stored in the archive without recompression.
+    """
+    current_year = datetime.datetime.now().year
+    report_date = datetime.datetime.now().strftime('%d %B %Y')
+
+    with open(LOGO_PATH, 'rb') as logo_file:
+        logo_bytes = logo_file.read()
+    template_bytes = build_report_template(logo_bytes)
+
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for payload in build_student_payloads(marks_df, student_ids, attendance_df, overall_attendance):
+            document = Document(io.BytesIO(template_bytes))
+            render_student_section(document, payload, logo_bytes, current_year, report_date)
+            report = io.BytesIO()
+            document.save(report)
+            archive.writestr(student_report_filename(payload), report.getvalue())
+            yield buffer.drain()
+    yield buffer.drain()  # Central directory, written when the archive is closed
+
+
+def subject_counts(marks_df):
+    """Final marks entries per subject, as text for the debug log."""
+    return marks_df.groupby('Subject', observed=True)['FinalMark'].count().to_string()
+
+
+def log_report_marks(marks_df):
+    """Log the selected students' marks, their per-subject counts and average z-scores; only called at DEBUG."""
+    logger.debug("Students with multiple low z-scores: %s", marks_df['StudentID'].unique())
+    logger.debug("After filtering for students with multiple low z-scores (shape %s):\n%s", marks_df.shape, marks_df)
+    logger.debug("Number of final marks entries for each subject after filtering:\n%s", subject_counts(marks_df))
+
+    subject_z_scores = marks_df.groupby('Subject', observed=True)['zScore'].mean()
+    logger.debug("Average z-score for each subject:\n%s", subject_z_scores.round(2).to_string())
+    for subject in subject_z_scores[subject_z_scores == 0].index:
+        z_scores = marks_df.loc[marks_df['Subject'] == subject, 'zScore']
+        logger.debug("%s has an average z-score of 0; raw z-scores (sorted from lowest to highest): %s", subject, sorted(z_scores.dropna().tolist()))
+
+
+def prepare_report_data(additional_marks_file, additional_attendance_file, low_marks_threshold):
+    """
+    Load and clean the uploaded marks (and attendance, if given) for the report and
+    select the students with a z-score below low_marks_threshold in more than one subject.
+
+    Returns (marks_df, student_ids, attendance_df, overall_attendance); the attendance
+    frames are None when no attendance file is given. Raises ValueError if the marks
+    file is missing required columns.
+    """
+    with substage("Reading marks", metric='report.read_marks') as info:
+        additional_marks_df = read_upload(additional_marks_file)
+        info['rows'] = len(additional_marks_df)
+
+    # Data validation checks
+    required_columns = ['StudentID', 'Subject', 'T1Weight', 'T2Weight', 'T3Weight', 'FinalMark']
+    missing_columns = [col for col in required_columns if col not in additional_marks_df.columns]
+    if missing_columns:
+        raise ValueError(f"Missing columns in the additional data: {', '.join(missing_columns)}. Please check the uploaded file.")
+
+    with substage("Cleaning marks and calculating Z-scores", metric='report.preprocess_marks') as info:
+        # Data cleaning and preprocessing
+        additional_marks_df = additional_marks_df.dropna(subset=['StudentID', 'Subject'])
+        additional_marks_df['StudentID'] = additional_marks_df['StudentID'].astype(int)
+        additional_marks_df['Subject'] = additional_marks_df['Subject'].str.strip()
+        additional_marks_df = compact_dtypes(additional_marks_df)
+        class_resolver = ClassSubjectResolver.from_marks(additional_marks_df)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Number of final marks entries for each subject (additional data):\n%s", subject_counts(additional_marks_df))
+
+        # In float64 from the uploaded decimals, like analysis.preprocess_marks
+        additional_marks_df['CalculatedFinalMark'] = widen_floats(additional_marks_df[['T1Weight', 'T2Weight', 'T3Weight']]).sum(axis=1, skipna=True)
+        standardize_marks(additional_marks_df)
+        additional_marks_df['zScore'] = additional_marks_df['zScore'].fillna(0)
+        # Widen float32 marks first so they round from the decimals that were uploaded
+        additional_marks_df = widen_floats(additional_marks_df).round(2)
+        info['rows'] = len(additional_marks_df)
+
+    with substage("Selecting students with multiple low Z-scores", metric='report.select_students') as info:
+        students_multiple_low = additional_marks_df[additional_marks_df['zScore'] < low_marks_threshold].groupby('StudentID').filter(lambda x: len(x) > 1)['StudentID'].unique()
+        additional_marks_df = additional_marks_df[additional_marks_df['StudentID'].isin(students_multiple_low)]
+        info['rows'] = len(students_multiple_low)
+
+    logger.debug("Number of students with multiple subjects having z-score < %s: %d", low_marks_threshold, len(students_multiple_low))
+    if logger.isEnabledFor(logging.DEBUG):
+        log_report_marks(additional_marks_df)
+
+    # Load attendance data (if available)
+    if additional_attendance_file:
+        with substage("Reading and mapping attendance", metric='report.prepare_attendance') as info:
+            attendance_df = read_upload(additional_attendance_file)
+            attendance_df = attendance_df.dropna(subset=['StudentID', 'Class'])
+            attendance_df['StudentID'] = attendance_df['StudentID'].astype(int)
+            attendance_df['Class'] = attendance_df['Class'].str.strip()
+            attendance_df = compact_dtypes(attendance_df)
+
+            # Map the classes in the attendance data to their respective subjects
+            # (the resolver also handles the trailing 'a' section suffix on attendance class names)
+            attendance_df['Subject'] = class_resolver.map_classes(attendance_df['Class']).astype('category')
+
+            # Drop rows where the subject is not found in the mapping
+            attendance_df = attendance_df.dropna(subset=['Subject'])
+
+            # Rename the attendance percentage column
+            attendance_df = widen_floats(attendance_df.rename(columns={'Percentage': 'AttendancePercentage'}))
+
+            # Calculate overall attendance percentage for each student
+            overall_attendance = attendance_df.groupby('StudentID')['AttendancePercentage'].mean().reset_index()
+            overall_attendance = overall_attendance.round(2)
+            info['rows'] = len(attendance_df)
+    else:
+        attendance_df = None
+        overall_attendance = None
+
+    return additional_marks_df, students_multiple_low, attendance_df, overall_attendance
\ No newline at end of file
@@ -0,0 +1,102 @@
+from .dataset_store import get_dataset_store
+
+# Row-level result sections kept with the dataset and sent to the browser a page at a time
+RESULT_SECTIONS = (
+    'low_z_scores',
+    'high_z_scores',
+    'students_below_threshold_in_multiple_subjects',
+    'students_below_low_threshold',
+    'students_above_high_threshold',
+    'group_z_scores',
+)
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+SORT_ORDERS = ('asc', 'desc')
+
+
+class PageRequestError(ValueError):
+    """Raised for a page request naming an unknown column or an invalid offset, limit or order."""
+
+
+def section_frame_name(section):
+    return f"section_{section}"
+
+
+def section_summary(df):
+    """What the result event carries in place of a section's rows."""
+    return {'rows': int(len(df)), 'columns': [str(column) for column in df.columns]}
+
+
+def summarize_result_sections(results):
+    """
+    results with each row-level section, already stored with its dataset, replaced by its summary.
+
+    The browser then asks /results/<section> for the rows it shows, so the
+    result event stays the same size however many students match.
+    """
+    summarized = dict(results)
+    for section in RESULT_SECTIONS:
+        if section in results:
+            summarized[section] = section_summary(results[section])
+    return summarized
+
+
+def read_page_request(args):
+    """Parse offset, limit, sort, order and columns from the query string."""
+    try:
+        offset = int(args.get('offset', 0))
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError as e:
+        raise PageRequestError(f"Invalid page: {e}")
+    if offset < 0 or limit < 1:
+        raise PageRequestError("offset must be 0 or more and limit at least 1.")
+
+    order = args.get('order', 'asc')
+    if order not in SORT_ORDERS:
+        raise PageRequestError(f"order must be one of {', '.join(SORT_ORDERS)}.")
+
+    columns = [column for column in args.get('columns', '').split(',') if column]
+    return {
+        'offset': offset,
+        'limit': min(limit, MAX_PAGE_SIZE),
+        'sort': args.get('sort') or None,
+        'order': order,
+        'columns': columns or None,
+    }
+
+
+def load_section_page(dataset_id, section, offset=0, limit=DEFAULT_PAGE_SIZE, sort=None, order='asc', columns=None):
+    """
+    Return one page of a stored section: the total row count and the requested
+    rows, sorted by one column and with only the requested columns.
+    """
+    store = get_dataset_store()
+    name = section_frame_name(section)
+    available = store.frame_columns(dataset_id, name)
+    requested = columns or available
+    unknown = [column for column in requested + ([sort] if sort else []) if column not in available]
+    if unknown:
+        raise PageRequestError(f"Unknown column(s) for {section}: {', '.join(unknown)}")
+
+    # Read only the columns the page shows, plus the one it is sorted by
+    df = store.load_frame(dataset_id, name, columns=list(dict.fromkeys(requested + ([sort] if sort else []))))
+    if sort:
+        df = df.sort_values(sort, ascending=order == 'asc', kind='stable', key=sortable_key)
+
+    return {
+        'section': section,
+        'total': int(len(df)),
+        'offset': offset,
+        'limit': limit,
+        'sort': sort,
+        'order': order,
+        'columns': requested,
+        'rows': df.iloc[offset:offset + limit][requested],
+    }
+
+
+def sortable_key(values):
+    """Sort list columns (e.g. Subjects) by their length rather than comparing the lists."""
+    if values.dtype == object and len(values) and not isinstance(values.iloc[0], str) and hasattr(values.iloc[0], '__len__'):
+        return values.map(len)
+    return values
@@ -1,50 +1,130 @@
 # routes.py
 
-from docx import Document
-from app.analysis import perform_comprehensive_analysis
-from .utils import save_temp_files
+# pandas, scipy, matplotlib, python-docx and Celery are imported inside the routes that use them,
+# so starting a worker or serving the index page does not pay for them (see app.prewarm)
 from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, flash, send_file, current_app, session, stream_with_context, Response
 import os
-import pandas as pd
-from .report_generator import generate_student_report
-from scipy.stats import zscore
 import logging
 logging.basicConfig(level=logging.INFO)
-import re
-import tempfile
-from .analysis import perform_comprehensive_analysis, preprocess_data
-from .analysis import nan_to_none, replace_nan
+from . import get_celery
+from .dataset_store import UploadTooLargeError, get_dataset_store
+from .metrics import get_stage_metrics
+from .progress import substage
 
+logger = logging.getLogger(__name__)
 
 
-main = Blueprint('main', __name__)
 
-# Define a maximum file size in bytes (e.g., 5MB)
-MAX_FILE_SIZE = 5 * 1024 * 1024  # 5 Megabytes
+main = Blueprint('main', __name__)
 
-def is_file_size_allowed(file):
-    """Check if file size is within acceptable limits."""
-    file.seek(0, os.SEEK_END)  # Move pointer to end of file to get size
-    file_size = file.tell()  # Get file size in bytes
-    file.seek(0)  # Reset pointer to start of file
-    return file_size <= MAX_FILE_SIZE
+# The two uploads a dataset is analysed from; either can be replaced on its own through /upload/<name>
+UPLOAD_NAMES = ('attendance', 'marks')
+
+def read_thresholds(form):
+    """Parse the four analysis thresholds from submitted form data (the session's for any left out) and remember them in the session."""
+    low_attendance_threshold = float(form.get('lowAttendanceThreshold', session.get('low_attendance_threshold', 85)))
+    high_attendance_threshold = float(form.get('highAttendanceThreshold', session.get('high_attendance_threshold', 95)))
+    low_marks_threshold = float(form.get('lowMarksThreshold', session.get('low_marks_threshold', -1.5)))
+    high_marks_threshold = float(form.get('highMarksThreshold', session.get('high_marks_threshold', 1.2)))
+
+    session['low_attendance_threshold'] = low_attendance_threshold
+    session['high_attendance_threshold'] = high_attendance_threshold
+    session['low_marks_threshold'] = low_marks_threshold
+    session['high_marks_threshold'] = high_marks_threshold
+    return low_attendance_threshold, high_attendance_threshold, low_marks_threshold, high_marks_threshold
+
+def read_chart_mode(form):
+    """The chart mode chosen on the upload form, falling back to the configured default."""
+    chart_mode = form.get('chartMode')
+    if chart_mode in ('image', 'data'):
+        return chart_mode
+    return current_app.config.get('CHART_MODE', 'image')
+
+def check_uploads(**uploads):
+    """
+    Return an error response for uploads (keyed by schema name) that are too large,
+    or whose header and first rows do not match the upload schemas, or None if
+    they can be saved.
+    """
+    from .validation import UploadValidationError, validate_uploads
 
-def check_file_content(file_path):
     try:
-        df = pd.read_excel(file_path)
-        required_columns = ['StudentID', 'Class']  # Adjust based on your logic for 'Subject'
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            return False, f"Missing required column(s): {', '.join(missing_columns)}"
-        return True, "File content is valid."
-    except Exception as e:
-        return False, f"Failed to read file: {e}"
+        get_dataset_store().check_upload_size(*uploads.values())
+        validate_uploads(**uploads)
+    except UploadTooLargeError as e:
+        logger.info(f"Rejected upload: {e}")
+        return jsonify({'error': str(e)}), 413
+    except UploadValidationError as e:
+        logger.info(f"Rejected upload: {e}")
+        return jsonify({'error': str(e), 'problems': e.problems}), 400
+    return None
+
+def save_uploaded_files(attendance_file, marks_file):
+    """
+    Start a new dataset for this upload and save each file into it once.
+
+    Only the dataset ID goes in the session; the session cookie is sent before an
+    analysis stream starts, so it must be assigned here. Returns the dataset ID
+    and the saved attendance and marks paths. Each file's size is checked as it
+    is saved; if either is too large the dataset is discarded and
+    UploadTooLargeError raised.
+    """
+    store = get_dataset_store()
+    dataset_id = store.new_dataset_id()
+    try:
+        attendance_path = store.save_upload(dataset_id, 'attendance', attendance_file)
+        marks_path = store.save_upload(dataset_id, 'marks', marks_file)
+    except UploadTooLargeError:
+        store.delete(dataset_id)
+        raise
+    session['dataset_id'] = dataset_id
+
+    logger.info(f"Saved uploads for dataset {dataset_id}: Attendance: {attendance_path}, Marks: {marks_path}")
+    return dataset_id, attendance_path, marks_path
+
+def replace_uploaded_file(dataset_id, name, upload):
+    """
+    Start a dataset from dataset_id with its name upload replaced, and make it the session's.
+
+    The new dataset keeps the other upload, the preprocessed frames and the
+    analysis state, so the analysis recomputes only what depends on the
+    replaced file. Returns the new dataset ID and its attendance and marks paths.
+    """
+    store = get_dataset_store()
+    new_id = store.derive_dataset(dataset_id, without=name)
+    try:
+        store.save_upload(new_id, name, upload)
+    except UploadTooLargeError:
+        store.delete(new_id)
+        raise
+    session['dataset_id'] = new_id
+
+    logger.info(f"Replaced the {name} upload of dataset {dataset_id} in new dataset {new_id}")
+    return new_id, store.upload_path(new_id, 'attendance'), store.upload_path(new_id, 'marks')
+
+# Chart files are named by a hash of their content, so a URL's image never changes
+CHART_MAX_AGE = 365 * 24 * 60 * 60
+
+def send_chart(key):
+    """Send a rendered chart with its key as the ETag, letting browsers cache it indefinitely."""
+    from .charts import get_chart_service
+
+    chart_path = get_chart_service().chart_path(key)
+    if chart_path is None or not os.path.exists(chart_path):
+        return jsonify({'error': 'Chart not found. Please re-run the analysis.'}), 404
+
+    response = send_file(chart_path, mimetype='image/png', etag=key, max_age=CHART_MAX_AGE, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 @main.route('/scatter_plot.png')
 def serve_scatter_plot():
-    app_root = os.path.dirname(current_app.instance_path)
-    image_path = os.path.join(app_root, 'scatter_plot.png')
-    return send_file(image_path, mimetype='image/png')
+    return send_chart(request.args.get('chart'))
+
+@main.route('/charts/<key>.png')
+def serve_chart(key):
+    return send_chart(key)
 
 @main.route('/')
 def index():
@@ -54,318 +134,390 @@ def index():
 @main.route('/upload', methods=['POST'])
 def upload_files():
     """Handle file uploads and return analysis results."""
-    print("Upload function called")
+    from .analysis import perform_comprehensive_analysis
+
+    logger.info("Upload function called")
     attendance_file = request.files.get('attendanceFile')
     marks_file = request.files.get('marksFile')
 
     if not attendance_file or not marks_file:
         error_message = 'Missing files. Please make sure to select and upload both attendance and marks files before submitting the form.'
-        print(error_message)
+        logger.info(error_message)
         return jsonify({'error': error_message}), 400
 
-    if not is_file_size_allowed(attendance_file) or not is_file_size_allowed(marks_file):
-        max_size_mb = MAX_FILE_SIZE / (1024 * 1024)
-        error_message = f'File size exceeds the limit. Please ensure each file is under {max_size_mb} MB.'
-        print(error_message)
-        return jsonify({'error': error_message}), 400
+    rejection = check_uploads(attendance=attendance_file, marks=marks_file)
+    if rejection:
+        return rejection
 
     try:
         # Extract threshold values from form data
-        low_attendance_threshold = float(request.form.get('lowAttendanceThreshold', 85))
-        high_attendance_threshold = float(request.form.get('highAttendanceThreshold', 95))
-        low_marks_threshold = float(request.form.get('lowMarksThreshold', -1.5))
-        high_marks_threshold = float(request.form.get('highMarksThreshold', 1.2))
-        print(f"Extracted threshold values: Low Attendance Threshold: {low_attendance_threshold}, High Attendance Threshold: {high_attendance_threshold}, Low Marks Threshold: {low_marks_threshold}, High Marks Threshold: {high_marks_threshold}")
-
-        session['low_attendance_threshold'] = low_attendance_threshold
-        session['high_attendance_threshold'] = high_attendance_threshold
-        session['low_marks_threshold'] = low_marks_threshold
-        session['high_marks_threshold'] = high_marks_threshold
-
-        # Save files for processing
-        import os
-        import tempfile
-        from uuid import uuid4
-
-        temp_dir = tempfile.gettempdir()
-
-        # Save the original attendance file
-        attendance_filename = f"attendance_{uuid4().hex}.xlsx"
-        temp_attendance_path = os.path.join(temp_dir, attendance_filename)
-        attendance_file.save(temp_attendance_path)
-
-        # Save a copy of the attendance file
-        attendance_file.stream.seek(0)  # Reset stream before re-saving
-        additional_attendance_filename = f"additional_attendance_{uuid4().hex}.xlsx"
-        additional_attendance_path = os.path.join(temp_dir, additional_attendance_filename)
-        attendance_file.save(additional_attendance_path)
-
-        # Save the original marks file
-        marks_filename = f"marks_{uuid4().hex}.xlsx"
-        temp_marks_path = os.path.join(temp_dir, marks_filename)
-        marks_file.save(temp_marks_path)
-
-        # Save a copy of the marks file
-        marks_file.stream.seek(0)  # Reset stream before re-saving
-        additional_marks_filename = f"additional_marks_{uuid4().hex}.xlsx"
-        additional_marks_path = os.path.join(temp_dir, additional_marks_filename)
-        marks_file.save(additional_marks_path)
-
-        session['attendance_file'] = temp_attendance_path
-        session['marks_file'] = temp_marks_path
-        session['additional_attendance_file'] = additional_attendance_path
-        session['additional_marks_file'] = additional_marks_path
-
-        print(f"Saved temporary files: Attendance: {temp_attendance_path}, Marks: {temp_marks_path}, Additional Attendance: {additional_attendance_path}, Additional Marks: {additional_marks_path}")
+        low_attendance_threshold, high_attendance_threshold, low_marks_threshold, high_marks_threshold = read_thresholds(request.form)
+        logger.info(f"Extracted threshold values: Low Attendance Threshold: {low_attendance_threshold}, High Attendance Threshold: {high_attendance_threshold}, Low Marks Threshold: {low_marks_threshold}, High Marks Threshold: {high_marks_threshold}")
+
+        # Save the files into a new dataset for processing
+        dataset_id, attendance_path, marks_path = save_uploaded_files(attendance_file, marks_file)
 
         # Perform comprehensive analysis with the new thresholds
         analysis_stream = perform_comprehensive_analysis(
-            temp_attendance_path, temp_marks_path,
+            attendance_path, marks_path,
             low_attendance_threshold, high_attendance_threshold,
-            low_marks_threshold, high_marks_threshold
+            low_marks_threshold, high_marks_threshold,
+            dataset_id=dataset_id, chart_mode=read_chart_mode(request.form)
         )
 
         # Stream analysis logs and results back to the client
         return Response(stream_with_context(analysis_stream), content_type='text/event-stream')
 
+    except UploadTooLargeError as e:
+        logger.info(f"Rejected upload: {e}")
+        return jsonify({'error': str(e)}), 413
+
     except KeyError as e:
         error_message = f"The required column \"{str(e).strip('[]')}\" is missing from the file."
-        print(error_message)
+        logger.info(error_message)
         return jsonify({'error': error_message}), 400
 
     except FileNotFoundError as e:
         error_message = f"File not found: {str(e)}. Please check if the uploaded files exist and try again."
-        print(error_message)
+        logger.exception(error_message)
         return jsonify({'error': error_message}), 500
 
     except PermissionError as e:
         error_message = f"Permission denied: {str(e)}. Please ensure the server has write permissions for the temporary directory."
-        print(error_message)
+        logger.exception(error_message)
         return jsonify({'error': error_message}), 500
 
     except ValueError as e:
         error_message = f"Invalid data: {str(e)}. Please check the contents of the uploaded files and ensure they are in the expected format."
-        print(error_message)
+        logger.exception(error_message)
         return jsonify({'error': error_message}), 500
 
     except Exception as e:
         error_message = f"An unexpected error occurred: {str(e)}. Please try again or contact support for assistance."
-        print(error_message)
+        logger.exception(error_message)
+        return jsonify({'error': error_message}), 500
+
+@main.route('/upload/<name>', methods=['POST'])
+def replace_upload(name):
+    """Replace the session dataset's attendance or marks file and stream the re-analysis."""
+    from .analysis import perform_comprehensive_analysis
+
+    if name not in UPLOAD_NAMES:
+        return jsonify({'error': f"Unknown upload '{name}'. Please replace the attendance or marks file."}), 404
+
+    dataset_id = session.get('dataset_id')
+    if not get_dataset_store().has_uploads(dataset_id, *UPLOAD_NAMES):
+        return jsonify({'error': 'No uploaded data available. Please upload both attendance and marks files first.'}), 400
+
+    upload = request.files.get(f'{name}File')
+    if not upload:
+        return jsonify({'error': f"Missing file. Please select the new {name} file."}), 400
+
+    rejection = check_uploads(**{name: upload})
+    if rejection:
+        return rejection
+
+    try:
+        thresholds = read_thresholds(request.form)
+        dataset_id, attendance_path, marks_path = replace_uploaded_file(dataset_id, name, upload)
+    except UploadTooLargeError as e:
+        logger.info(f"Rejected upload: {e}")
+        return jsonify({'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'error': f"Invalid threshold value: {e}"}), 400
+
+    analysis_stream = perform_comprehensive_analysis(
+        attendance_path, marks_path, *thresholds,
+        dataset_id=dataset_id, chart_mode=read_chart_mode(request.form)
+    )
+    return Response(stream_with_context(analysis_stream), content_type='text/event-stream')
+
+@main.route('/apply_thresholds', methods=['POST'])
+def apply_new_thresholds():
+    """Re-run the threshold-dependent analysis against the session's preprocessed dataset."""
+    from .analysis import apply_thresholds
+
+    dataset_id = session.get('dataset_id')
+    store = get_dataset_store()
+    if not store.has_uploads(dataset_id, *UPLOAD_NAMES) or not store.has_frames(dataset_id, 'marks', 'attendance'):
+        return jsonify({'error': 'No analysed data available. Please upload and analyze files first.'}), 400
+
+    try:
+        low_attendance_threshold, high_attendance_threshold, low_marks_threshold, high_marks_threshold = read_thresholds(request.form)
+    except ValueError as e:
+        return jsonify({'error': f"Invalid threshold value: {e}"}), 400
+
+    try:
+        # The preprocessed frames are reused from the store; only the threshold stages run
+        results = apply_thresholds(
+            store.upload_path(dataset_id, 'attendance'), store.upload_path(dataset_id, 'marks'),
+            low_attendance_threshold, high_attendance_threshold,
+            low_marks_threshold, high_marks_threshold,
+            dataset_id=dataset_id
+        )
+        return jsonify(results)
+    except Exception as e:
+        error_message = f"Failed to apply thresholds: {str(e)}"
+        logger.exception(error_message)
         return jsonify({'error': error_message}), 500
 
-def cleanup_files(temp_marks_file, temp_attendance_file):
-    if temp_marks_file and os.path.exists(temp_marks_file):
-        os.remove(temp_marks_file)
-    if temp_attendance_file and os.path.exists(temp_attendance_file):
-        os.remove(temp_attendance_file)
+@main.route('/results/<section>')
+def result_section_page(section):
+    """
+    One page of a row-level result section of the session's analysis.
+
+    Query parameters: offset and limit (capped at MAX_PAGE_SIZE), sort (a column)
+    with order=asc|desc, and columns (comma-separated) to return only those.
+    """
+    from .result_sections import RESULT_SECTIONS, PageRequestError, load_section_page, read_page_request, section_frame_name
+
+    if section not in RESULT_SECTIONS:
+        return jsonify({'error': f"Unknown result section: {section}"}), 404
+
+    dataset_id = session.get('dataset_id')
+    if not get_dataset_store().has_frames(dataset_id, section_frame_name(section)):
+        return jsonify({'error': 'No analysed data available. Please upload and analyze files first.'}), 400
+
+    try:
+        page = load_section_page(dataset_id, section, **read_page_request(request.args))
+    except PageRequestError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page)
+
+@main.route('/regression_explainer', methods=['POST'])
+def regression_explainer():
+    """Explain one regression from the analysis (the whole school or a row of the regression table)."""
+    from .analysis import generate_regression_explainer
+
+    stats = request.get_json(silent=True) or {}
+    try:
+        values = [float(stats[name]) for name in ('slope', 'intercept', 'r_value', 'p_value', 'std_err')]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'A regression needs numeric slope, intercept, r_value, p_value and std_err.'}), 400
+
+    return jsonify({'explainer': generate_regression_explainer(*values)})
+
+MAX_SESSION_JOBS = 20
+
+def remember_job(job_id):
+    """Record a job ID in the session so only the user who submitted it can query it."""
+    session['job_ids'] = (session.get('job_ids', []) + [job_id])[-MAX_SESSION_JOBS:]
+
+def get_session_job(job_id):
+    if job_id not in session.get('job_ids', []):
+        return None
+    return get_celery(current_app).AsyncResult(job_id)
+
+def job_urls(job_id):
+    return {
+        'job_id': job_id,
+        'status_url': url_for('main.job_status', job_id=job_id),
+        'result_url': url_for('main.job_result', job_id=job_id),
+    }
+
+@main.route('/jobs/analysis', methods=['POST'])
+def submit_analysis_job():
+    """Queue a full analysis of the uploaded files and return its job ID."""
+    get_celery(current_app)
+    from .tasks import run_analysis_task
+
+    attendance_file = request.files.get('attendanceFile')
+    marks_file = request.files.get('marksFile')
+
+    if not attendance_file or not marks_file:
+        return jsonify({'error': 'Missing files. Please make sure to select and upload both attendance and marks files before submitting the form.'}), 400
+
+    rejection = check_uploads(attendance=attendance_file, marks=marks_file)
+    if rejection:
+        return rejection
+
+    try:
+        low_attendance_threshold, high_attendance_threshold, low_marks_threshold, high_marks_threshold = read_thresholds(request.form)
+    except ValueError as e:
+        return jsonify({'error': f"Invalid threshold value: {e}"}), 400
+
+    try:
+        dataset_id, attendance_path, marks_path = save_uploaded_files(attendance_file, marks_file)
+    except UploadTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+
+    task = run_analysis_task.delay(
+        attendance_path, marks_path,
+        low_attendance_threshold, high_attendance_threshold,
+        low_marks_threshold, high_marks_threshold,
+        dataset_id=dataset_id, chart_mode=read_chart_mode(request.form)
+    )
+    remember_job(task.id)
+    return jsonify(job_urls(task.id)), 202
+
+@main.route('/jobs/report', methods=['POST'])
+def submit_report_job():
+    """Queue generation of the combined student report for the last upload and return its job ID."""
+    get_celery(current_app)
+    from .tasks import generate_report_task
+
+    dataset_id = session.get('dataset_id')
+    if not get_dataset_store().has_uploads(dataset_id, 'marks', 'attendance'):
+        return jsonify({'error': 'No data available. Please upload and analyze files first.'}), 400
+
+    task = generate_report_task.delay(dataset_id, session.get('low_marks_threshold', -1.5))
+    remember_job(task.id)
+    return jsonify(job_urls(task.id)), 202
+
+@main.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report a job's state, with its log and stage timings while it runs."""
+    result = get_session_job(job_id)
+    if result is None:
+        return jsonify({'error': 'Unknown job.'}), 404
+
+    status = {'job_id': job_id, 'status': result.state}
+    if result.state == 'PROGRESS' and isinstance(result.info, dict):
+        status.update(result.info)
+    elif result.failed():
+        status['error'] = str(result.info)
+    return jsonify(status)
+
+@main.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """Return a finished job's result: the analysis JSON, or the report as a .docx download."""
+    result = get_session_job(job_id)
+    if result is None:
+        return jsonify({'error': 'Unknown job.'}), 404
+    if result.failed():
+        return jsonify({'error': str(result.info)}), 500
+    if not result.ready():
+        return jsonify({'job_id': job_id, 'status': result.state}), 202
+
+    value = result.get()
+    if isinstance(value, dict) and 'report_path' in value:
+        if not os.path.exists(value['report_path']):
+            return jsonify({'error': 'This report has expired. Please upload the files and generate it again.'}), 410
+        return send_file(value['report_path'], as_attachment=True, download_name='Student_Reports.docx', mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+    if isinstance(value, str):
+        # The analysis task stores its result already serialized
+        return current_app.response_class(value, mimetype='application/json')
+    return jsonify(value)
+
+def load_report_data():
+    """
+    Prepare the report data for the files uploaded to the session's dataset.
+
+    Returns (report_data, None), or (None, response) with a redirect back to the index
+    when there is nothing to report on.
+    """
+    from .report_generator import prepare_report_data
+
+    dataset_id = session.get('dataset_id')
+    store = get_dataset_store()
+    if not dataset_id:
+        flash("No data available. Please upload and analyze files first.", "warning")
+        logger.info("No dataset_id found in session")
+        return None, redirect(url_for('main.index'))
+
+    if not store.has_uploads(dataset_id, 'marks', 'attendance'):
+        flash("The uploaded files have expired. Please re-upload and analyze your files.", "error")
+        logger.error(f"Uploads for dataset {dataset_id} not found")
+        return None, redirect(url_for('main.index'))
+
+    low_marks_threshold = session.get('low_marks_threshold', -1.5)
+    try:
+        report_data = prepare_report_data(
+            store.upload_path(dataset_id, 'marks'), store.upload_path(dataset_id, 'attendance'), low_marks_threshold
+        )
+    except ValueError as e:
+        flash(str(e), "error")
+        logger.error(str(e))
+        return None, redirect(url_for('main.index'))
+    return report_data, None
 
 
 @main.route('/download_report')
 def download_report():
-    logging.info("Entering download_report route")
-    if 'additional_marks_file' not in session or 'additional_attendance_file' not in session:
-        flash("No data available. Please upload and analyze files first.", "warning")
-        logging.info("No additional_marks_file or additional_attendance_file found in session")
-        return redirect(url_for('main.index'))
+    from .report_generator import generate_student_report
+
+    logger.info("Entering download_report route")
+    try:
+        # Each step of building the report is logged and counted in /metrics as part of this stage
+        with substage("Generating student report", metric='download_report') as info:
+            report_data, error_response = load_report_data()
+            if error_response is not None:
+                return error_response
+
+            logger.info("Generating report...")
+
+            combined_report = generate_student_report(*report_data, workers=current_app.config.get('REPORT_WORKERS', 1))
+            info['rows'] = len(report_data[1])
 
-    additional_marks_file = session.get('additional_marks_file')
-    if not os.path.exists(additional_marks_file):
-        flash("Additional marks file does not exist. Please re-upload and analyze your files.", "error")
-        logging.error(f"File {additional_marks_file} not found")
+        logger.info("Report generated, sending file to client")
+        return send_file(combined_report, as_attachment=True, download_name='Student_Reports.docx', mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+
+    except Exception as e:
+        flash("Failed to generate the report.", "error")
+        logger.exception(f"Report generation failed: {e}")
         return redirect(url_for('main.index'))
 
-    try:
-        additional_marks_df = pd.read_excel(additional_marks_file)
-
-        # Data validation checks
-        required_columns = ['StudentID', 'Subject', 'T1Weight', 'T2Weight', 'T3Weight', 'FinalMark']
-        missing_columns = [col for col in required_columns if col not in additional_marks_df.columns]
-        if missing_columns:
-            error_message = f"Missing columns in the additional data: {', '.join(missing_columns)}. Please check the uploaded file."
-            flash(error_message, "error")
-            logging.error(error_message)
-            return redirect(url_for('main.index'))
-
-        # Data cleaning and preprocessing
-        additional_marks_df = additional_marks_df.dropna(subset=['StudentID', 'Subject'])
-        additional_marks_df['StudentID'] = additional_marks_df['StudentID'].astype(int)
-        additional_marks_df['Subject'] = additional_marks_df['Subject'].str.strip()
-
-        # Print the number of final marks entries for each subject
-        print("\nNumber of final marks entries for each subject (additional data):")
-        subject_final_marks_counts = additional_marks_df.groupby('Subject')['FinalMark'].count().reset_index()
-        for _, row in subject_final_marks_counts.iterrows():
-            subject = row['Subject']
-            final_marks_count = row['FinalMark']
-            print(f"{subject}: {final_marks_count}")
-
-        additional_marks_df['CalculatedFinalMark'] = additional_marks_df[['T1Weight', 'T2Weight', 'T3Weight']].sum(axis=1, skipna=True)
-        additional_marks_df['zScore'] = additional_marks_df.groupby('Subject')['CalculatedFinalMark'].transform(lambda x: zscore(x[x.notna()], ddof=1))
-        additional_marks_df['zScore'] = additional_marks_df['zScore'].fillna(0)
-        additional_marks_df = additional_marks_df.round(2)
-
-        low_marks_threshold = session.get('low_marks_threshold', -1.5)
-        students_multiple_low = additional_marks_df[additional_marks_df['zScore'] < low_marks_threshold].groupby('StudentID').filter(lambda x: len(x) > 1)['StudentID'].unique()
-
-        print(f"Number of students with multiple subjects having z-score < {low_marks_threshold}: {len(students_multiple_low)}")
-        print("Students with multiple low z-scores:", students_multiple_low)
-
-        additional_marks_df = additional_marks_df[additional_marks_df['StudentID'].isin(students_multiple_low)]
-
-        print("\nAfter filtering for students with multiple low z-scores:")
-        print(additional_marks_df)
-        print("Additional Marks DataFrame shape:", additional_marks_df.shape)
-        print("Additional Marks DataFrame columns:", additional_marks_df.columns)
-
-        # Print the number of final marks entries for each subject after filtering
-        print("\nNumber of final marks entries for each subject after filtering:")
-        subject_final_marks_counts = additional_marks_df.groupby('Subject')['FinalMark'].count().reset_index()
-        for _, row in subject_final_marks_counts.iterrows():
-            subject = row['Subject']
-            final_marks_count = row['FinalMark']
-            print(f"{subject}: {final_marks_count}")
-
-        print("\nStudents in additional_marks_df after filtering:", additional_marks_df['StudentID'].unique())
-
-        print("Additional Marks DataFrame shape after filtering:", additional_marks_df.shape)
-        print("Additional Marks DataFrame columns after filtering:", additional_marks_df.columns)
-        print(f"Students in additional_marks_df: {additional_marks_df['StudentID'].unique()}")
-
-        # Print the average z-score for each subject
-        print("Average z-score for each subject:")
-        subject_z_scores = additional_marks_df.groupby('Subject')['zScore'].mean().reset_index()
-        for _, row in subject_z_scores.iterrows():
-            subject = row['Subject']
-            avg_z_score = row['zScore']
-            print(f"{subject}: {avg_z_score:.2f}")
-
-        # Identify subjects with an average z-score of 0
-        subjects_with_zero_avg = subject_z_scores[subject_z_scores['zScore'] == 0]['Subject'].tolist()
-
-        if subjects_with_zero_avg:
-            print("\nSubjects with an average z-score of 0:")
-            for subject in subjects_with_zero_avg:
-                print(f"\n{subject}:")
-                subject_z_scores = additional_marks_df[additional_marks_df['Subject'] == subject]['zScore']
-                print("Raw z-scores (sorted from lowest to highest):")
-                print(sorted(subject_z_scores.dropna().tolist()))
-
-        print("Generating report...")
-
-        # Load attendance data (if available)
-        additional_attendance_file = session.get('additional_attendance_file')
-        if additional_attendance_file:
-            attendance_df = pd.read_excel(additional_attendance_file)
-            attendance_df = attendance_df.dropna(subset=['StudentID', 'Class'])
-            attendance_df['StudentID'] = attendance_df['StudentID'].astype(int)
-            attendance_df['Class'] = attendance_df['Class'].str.strip()
-
-            # Remove the trailing 'a' from the class names in the attendance data
-            attendance_df['Class'] = attendance_df['Class'].apply(lambda x: re.sub(r'a$', '', x))
-
-            # Map the classes in the attendance data to their respective subjects
-            class_subject_mapping = additional_marks_df.groupby('Class')['Subject'].unique().to_dict()
-            attendance_df['Subject'] = attendance_df['Class'].map(class_subject_mapping)
-
-            # Drop rows where the subject is not found in the mapping
-            attendance_df = attendance_df.dropna(subset=['Subject'])
-
-            # Rename the attendance percentage column
-            attendance_df = attendance_df.rename(columns={'Percentage': 'AttendancePercentage'})
-
-            # Calculate overall attendance percentage for each student
-            overall_attendance = attendance_df.groupby('StudentID')['AttendancePercentage'].mean().reset_index()
-            overall_attendance = overall_attendance.round(2)
-        else:
-            attendance_df = None
-            overall_attendance = None
-
-        combined_report = generate_student_report(additional_marks_df, students_multiple_low, attendance_df, overall_attendance)
-
-        # Validate the generated Word document
-        try:
-            document = Document(combined_report)
-        except Exception as e:
-            flash("The generated Word document is corrupted or invalid. Please try again.", "error")
-            logging.error(f"Error validating Word document: {e}")
-            return redirect(url_for('main.index'))
-
-        # Save the validated Word document to a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as temp_file:
-            temp_file_path = temp_file.name
-            document.save(temp_file_path)
-
-        print("Report generated, sending file to client")
-        return send_file(temp_file_path, as_attachment=True, download_name='Student_Reports.docx', mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
 
+@main.route('/metrics')
+def metrics():
+    """Wall time, CPU time, rows and peak memory per analysis and report stage since this process started."""
+    return jsonify(get_stage_metrics().snapshot())
+
+
+@main.route('/download_report_archive')
+def download_report_archive():
+    """Stream a ZIP with one report per student, sending each report as soon as it is rendered."""
+    from .report_generator import iter_student_report_archive
+
+    logger.info("Entering download_report_archive route")
+    try:
+        report_data, error_response = load_report_data()
+        if error_response is not None:
+            return error_response
     except Exception as e:
         flash("Failed to generate the report.", "error")
-        print(f"Report generation failed: {e}")
+        logger.exception(f"Report generation failed: {e}")
         return redirect(url_for('main.index'))
 
+    logger.info(f"Streaming report archive for {len(report_data[1])} students...")
+    response = Response(iter_student_report_archive(*report_data), mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename=Student_Reports.zip'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
-from .analysis import preprocess_data, get_student_marks, get_student_attendance
 
 @main.route('/get_students', methods=['GET'])
 def get_students():
+    from .student_index import list_students
+
     try:
-        attendance_file = session.get('attendance_file')
-        if not attendance_file:
+        dataset_id = session.get('dataset_id')
+        if not get_dataset_store().has_frames(dataset_id, 'marks', 'attendance'):
             return jsonify({'error': 'No data available'}), 400
-        
-        attendance_df = pd.read_pickle(attendance_file)
-        
-        if 'StudentName' in attendance_df.columns:
-            students = attendance_df[['StudentID', 'StudentName']].drop_duplicates().to_dict(orient='records')
-        else:
-            students = attendance_df[['StudentID']].drop_duplicates().to_dict(orient='records')
-            for student in students:
-                student['StudentName'] = ''
-        
+
+        students = list_students(dataset_id)
         return jsonify(students)
     except Exception as e:
-        print(f"Error fetching students: {e}")
+        logger.exception(f"Error fetching students: {e}")
         return jsonify({'error': str(e)}), 500
     
 
 @main.route('/search_students', methods=['GET'])
 def search_students():
+    from .student_index import get_student_index
+
     try:
         query = request.args.get('query', '').strip().lower()
-        
-        # Read the DataFrames from the temporary files
-        marks_file = session.get('marks_file')
-        attendance_file = session.get('attendance_file')
 
-        if not marks_file or not attendance_file:
+        dataset_id = session.get('dataset_id')
+        if not get_dataset_store().has_frames(dataset_id, 'marks', 'attendance'):
             return jsonify({'error': 'No data available'}), 400
 
-        marks_df = pd.read_pickle(marks_file)
-        attendance_df = pd.read_pickle(attendance_file)
-
-        # Filter students based on the search query
-        students = attendance_df[
-            (attendance_df['StudentID'].astype(str).str.contains(query))
-        ]
-
-        # Prepare the student data
-        student_data = []
-        for _, row in students.iterrows():
-            student_id = row['StudentID']
-            student_name = row.get('StudentName', '')  # Use an empty string if 'StudentName' is not available
-            marks = get_student_marks(student_id, marks_df)
-            attendance = get_student_attendance(student_id, attendance_df)
-
-            student_data.append({
-                'StudentID': student_id,
-                'StudentName': student_name,
-                'Marks': marks,
-                'Attendance': attendance
-            })
-
-        # Convert NaN values to None using the replace_nan function
-        student_data = replace_nan(student_data)
+        # Look up matching students in the per-dataset index, one record per student
+        student_index = get_student_index(dataset_id)
+        student_data = [student_index.student_record(student_id) for student_id in student_index.search(query)]
 
+        # jsonify writes NaN values as null (see utils.AnalysisJSONProvider)
         return jsonify({'students': student_data})
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
@@ -1,6 +1,42 @@
+// Most recent analysis result, kept so threshold changes can update it in place
+let latestResult = null;
+
+// Append the threshold and chart mode fields every analysis request carries
+function appendAnalysisOptions(formData) {
+    ['lowAttendanceThreshold', 'highAttendanceThreshold', 'lowMarksThreshold', 'highMarksThreshold', 'chartMode'].forEach(id => {
+        formData.set(id, document.getElementById(id).value);
+    });
+}
+
 document.getElementById('uploadForm').addEventListener('submit', async function (e) {
     e.preventDefault();
 
+    const formData = new FormData(this);
+    console.log("Form data:", formData);
+
+    // Gather threshold values
+    appendAnalysisOptions(formData);
+    console.log(`Form Data: Low Attendance Threshold: ${formData.get('lowAttendanceThreshold')}, High Marks Threshold: ${formData.get('highMarksThreshold')}, High Attendance Threshold: ${formData.get('highAttendanceThreshold')}, Low Marks Threshold: ${formData.get('lowMarksThreshold')}`);
+
+    await runStreamedAnalysis('/upload', formData);
+});
+
+// Replace one of the uploaded files; the server reuses every stage that does not depend on it
+[['attendance', 'Attendance'], ['marks', 'Marks']].forEach(([name, label]) => {
+    const fileInput = document.getElementById(`replace${label}File`);
+    document.getElementById(`replace${label}Btn`).addEventListener('click', () => fileInput.click());
+    fileInput.addEventListener('change', async function () {
+        if (!this.files.length) return;
+        const formData = new FormData();
+        formData.append(`${name}File`, this.files[0]);
+        appendAnalysisOptions(formData);
+        this.value = ''; // So choosing the same file again still triggers a change
+        await runStreamedAnalysis(`/upload/${name}`, formData);
+    });
+});
+
+// Post formData to an analysis route, showing its streamed progress in the analysis log, then display the result
+async function runStreamedAnalysis(url, formData) {
     // Show the loading overlay
     showLoadingOverlay();
     console.log("Loading overlay shown");
@@ -8,27 +44,16 @@ document.getElementById('uploadForm').addEventListener('submit', async function
     // Clear the analysis log
     document.getElementById('analysisLog').textContent = '';
 
-    const formData = new FormData(this);
-    console.log("Form data:", formData);
-
-    // Gather threshold values
-    const lowAttendanceThreshold = document.getElementById('lowAttendanceThreshold').value;
-    const highMarksThreshold = document.getElementById('highMarksThreshold').value;
-    const highAttendanceThreshold = document.getElementById('highAttendanceThreshold').value;
-    const lowMarksThreshold = document.getElementById('lowMarksThreshold').value;
-    formData.append('lowAttendanceThreshold', lowAttendanceThreshold);
-    formData.append('highMarksThreshold', highMarksThreshold);
-    formData.append('highAttendanceThreshold', highAttendanceThreshold);
-    formData.append('lowMarksThreshold', lowMarksThreshold);
-
-    console.log(`Form Data: Low Attendance Threshold: ${lowAttendanceThreshold}, High Marks Threshold: ${highMarksThreshold}, High Attendance Threshold: ${highAttendanceThreshold}, Low Marks Threshold: ${lowMarksThreshold}`);
-
     document.getElementById('analysisResults').innerHTML = ''; // Clear previous results
     document.getElementById('downloadReportBtn').style.display = 'none'; // Ensure button is hidden initially
+    document.getElementById('applyThresholdsBtn').style.display = 'none';
+    document.getElementById('downloadReportArchiveBtn').style.display = 'none';
+    document.getElementById('replaceAttendanceBtn').style.display = 'none';
+    document.getElementById('replaceMarksBtn').style.display = 'none';
 
     try {
         console.log("Sending form data to server...");
-        const response = await fetch('/upload', { method: 'POST', body: formData });
+        const response = await fetch(url, { method: 'POST', body: formData });
         console.log("Response received from server:", response);
 
         if (!response.ok) {
@@ -43,6 +68,7 @@ document.getElementById('uploadForm').addEventListener('submit', async function
         const decoder = new TextDecoder('utf-8');
 
         let result = null;
+        let buffer = '';
 
         while (true) {
             const { value, done } = await reader.read();
@@ -51,18 +77,30 @@ document.getElementById('uploadForm').addEventListener('submit', async function
                 break;
             }
 
-            const events = decoder.decode(value).trim().split('\n\n');
+            // Events can be split across reads, so only handle the complete ones and keep the remainder
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
             console.log("Stream events received:", events);
 
             for (const event of events) {
-                if (event.trim() === '') continue; // Skip empty events
+                if (event.trim() === '' || event.startsWith(':')) continue; // Skip empty events and keep-alive comments
 
-                const [eventType, eventData] = event.split('\n');
-                const data = eventData.slice(6); // Remove the "data: " prefix
+                const separator = event.indexOf('\n');
+                const eventType = event.slice(0, separator);
+                const data = event.slice(separator + 1).slice(6); // Remove the "data: " prefix
 
                 if (eventType === 'event: log') {
                     console.log("Log data:", data);
                     updateAnalysisLog(data);
+                } else if (eventType === 'event: stage') {
+                    const stage = JSON.parse(data);
+                    const rows = stage.rows !== null ? `, ${stage.rows} rows` : '';
+                    const memory = stage.peak_rss_mb !== null ? `, peak ${stage.peak_rss_mb} MB` : '';
+                    const indent = stage.parent ? '  ' : ''; // Substages are reported under the stage they ran in
+                    updateAnalysisLog(`${indent}${stage.stage} finished in ${stage.elapsed_ms} ms (CPU ${stage.cpu_ms} ms${rows}${memory})`);
+                } else if (eventType === 'event: error') {
+                    result = JSON.parse(data);
                 } else if (eventType === 'event: result') {
                     console.log("Processing result data...", data);
                     result = JSON.parse(data);
@@ -77,50 +115,24 @@ document.getElementById('uploadForm').addEventListener('submit', async function
             }
         }
 
+        if (!result) {
+            throw new Error('The analysis ended without returning a result.');
+        }
+
         if (result.error) {
             console.error("Error in result data:", result.error);
             throw new Error(result.error);
         }
 
-        console.log("Displaying results...");
-        // Dynamically create and display all sections with the new data
-        console.log("Correlation analysis data:", result.correlation_analysis);
-        console.log("Plot filename:", result.plot_filename);
-        displayCorrelationAndScatterPlotResults(result.correlation_analysis || {}, result.plot_filename);
-
-        console.log("Year group attendance summary data:", result.year_group_attendance_summary);
-        createCollapsibleSection('Year Group Attendance Summary', result.year_group_attendance_summary || [], displayYearGroupAttendanceSummary);
-
-        console.log("Low Z-scores data:", result.low_z_scores);
-        createCollapsibleSection('Students With Low Marks (Individual Subjects)', result.low_z_scores || [], displayLowZScoresResults);
-
-        console.log("High Z-scores data:", result.high_z_scores);
-        createCollapsibleSection('High Achievers (By Subject Z-score)', result.high_z_scores || [], displayHighZScoresResults);
-
-        console.log("Average marks by class data:", result.average_marks_by_class);
-        createCollapsibleSection('Average Marks by Class', result.average_marks_by_class || {}, displayAverageMarksByClass);
-
-        console.log("Students below threshold in multiple subjects data:", result.students_below_threshold_in_multiple_subjects);
-        createCollapsibleSection('Students Below Marks Threshold in Multiple Subjects', result.students_below_threshold_in_multiple_subjects || {}, displayStudentsBelowThreshold);
-
-        console.log("Students below attendance threshold data:", result.students_below_low_threshold);
-        createCollapsibleSection(
-            'Students Below Attendance Threshold',
-            result.students_below_low_threshold || [],
-            displayStudentsBelowAttendanceThreshold,
-            document.getElementById('studentsBelowAttendanceThresholdSection')
-        );
-
-        console.log("Students above attendance threshold data:", result.students_above_high_threshold);
-        createCollapsibleSection(
-            'Students Above Attendance Threshold',
-            result.students_above_high_threshold || [],
-            displayStudentsAboveAttendanceThreshold,
-            document.getElementById('studentsAboveAttendanceThresholdSection')
-        );
+        latestResult = result;
+        displayAnalysisResults(result);
 
         // Show the download button after successful data processing
         document.getElementById('downloadReportBtn').style.display = 'inline-block';
+        document.getElementById('applyThresholdsBtn').style.display = 'inline-block';
+        document.getElementById('downloadReportArchiveBtn').style.display = 'inline-block';
+        document.getElementById('replaceAttendanceBtn').style.display = 'inline-block';
+        document.getElementById('replaceMarksBtn').style.display = 'inline-block';
         // Hide the loading overlay
         hideLoadingOverlay();
         // Show the "Open Analysis Log" button
@@ -134,165 +146,80 @@ document.getElementById('uploadForm').addEventListener('submit', async function
         // Hide the loading overlay
         hideLoadingOverlay();
     }
-});
-
-
-
-function displayHighZScoresResults(highZScores, container) {
-    // Check and remove existing results container if it exists
-    const existingResultsContainer = container.querySelector('.high-z-score-results');
-    if (existingResultsContainer) {
-        existingResultsContainer.remove();
-    }
-
-    // Create a new container for the results
-    const resultsContainer = document.createElement('div');
-    resultsContainer.className = 'high-z-score-results';
+}
 
-    if (highZScores.length === 0) {
-        resultsContainer.innerHTML = '<p>No students found with high Z-scores.</p>';
-    } else {
-        const table = document.createElement('table');
-        table.innerHTML = `
-            <thead>
-                <tr>
-                    <th>StudentID</th>
-                    <th>Subject</th>
-                    <th>Z-Score</th>
-                </tr>
-            </thead>
-        `;
 
-        const tbody = document.createElement('tbody');
-        highZScores.forEach(item => {
-            const tr = document.createElement('tr');
-            tr.innerHTML = `
-                <td>${item.StudentID}</td>
-                <td>${item.Subject}</td>
-                <td>${item.zScore.toFixed(2)}</td>
-            `;
-            tbody.appendChild(tr);
-        });
+function displayAnalysisResults(result) {
+    document.getElementById('analysisResults').innerHTML = ''; // Clear previous results
 
-        table.appendChild(tbody);
-        resultsContainer.appendChild(table);
-    }
+    console.log("Displaying results...");
+    // Dynamically create and display all sections with the new data
+    console.log("Correlation analysis data:", result.correlation_analysis);
+    console.log("Plot filename:", result.plot_filename);
+    displayCorrelationAndScatterPlotResults(result.correlation_analysis || {}, result.plot_filename);
+    createCollapsibleSection('Regression by Subject, Year and Class', (result.correlation_analysis || {}).regression_table || [], displayRegressionTable);
 
-    // Append the results container to the collapsible section
-    container.appendChild(resultsContainer);
-}
+    console.log("Year group attendance summary data:", result.year_group_attendance_summary);
+    createCollapsibleSection('Year Group Attendance Summary', result.year_group_attendance_summary || [], displayYearGroupAttendanceSummary);
 
+    // Row-level sections arrive as summaries ({rows, columns}); their rows are fetched a page at a time
+    console.log("Low Z-scores:", result.low_z_scores);
+    createCollapsibleSection('Students With Low Marks (Individual Subjects)', result.low_z_scores, (summary, container) => displayPagedSection('low_z_scores', summary, container));
 
-function displayStudentsBelowAttendanceThreshold(data, container) {
-    console.log("Displaying students below attendance threshold with data:", data);
+    console.log("High Z-scores:", result.high_z_scores);
+    createCollapsibleSection('High Achievers (By Subject Z-score)', result.high_z_scores, (summary, container) => displayPagedSection('high_z_scores', summary, container));
 
-    // Check and remove existing results container if it exists
-    const existingResultsContainer = container.querySelector('.attendance-threshold-results');
-    if (existingResultsContainer) {
-        console.log("Removing existing results container for below threshold");
-        existingResultsContainer.remove();
-    }
+    console.log("Average marks by class data:", result.average_marks_by_class);
+    createCollapsibleSection('Average Marks by Class', result.average_marks_by_class || {}, displayAverageMarksByClass);
 
-    // Create a new container for the results
-    const resultsContainer = document.createElement('div');
-    resultsContainer.className = 'attendance-threshold-results';
+    console.log("Class mapping data:", result.class_mapping);
+    createCollapsibleSection('Class to Subject Mapping', result.class_mapping || {}, displayClassMapping);
 
-    if (data.length === 0) {
-        resultsContainer.innerHTML = '<p>No students found below the specified attendance threshold.</p>';
-        console.log("No students found below threshold");
-    } else {
-        const table = document.createElement('table');
-        table.innerHTML = `
-            <thead>
-                <tr>
-                    <th>StudentID</th>
-                    <th>Subjects Below Threshold</th>
-                    <th>Number of Subjects Below Threshold</th>
-                </tr>
-            </thead>
-        `;
-        const tbody = document.createElement('tbody');
-        data.forEach(student => {
-            const tr = document.createElement('tr');
-            tr.innerHTML = `
-                <td>${student.StudentID}</td>
-                <td>${student.Subjects.join(', ')}</td>
-                <td>${student.SubjectCount}</td>
-            `;
-            tbody.appendChild(tr);
-            console.log("Adding student:", student.StudentID);
-        });
+    console.log("Students below threshold in multiple subjects:", result.students_below_threshold_in_multiple_subjects);
+    createCollapsibleSection('Students Below Marks Threshold in Multiple Subjects', result.students_below_threshold_in_multiple_subjects, (summary, container) => displayPagedSection('students_below_threshold_in_multiple_subjects', summary, container));
 
-        console.log("Created table with data:");
-        console.table(data);
+    console.log("Students below attendance threshold:", result.students_below_low_threshold);
+    createCollapsibleSection('Students Below Attendance Threshold', result.students_below_low_threshold, (summary, container) => displayPagedSection('students_below_low_threshold', summary, container));
 
-        table.appendChild(tbody);
-        resultsContainer.appendChild(table);
-    }
+    console.log("Students above attendance threshold:", result.students_above_high_threshold);
+    createCollapsibleSection('Students Above Attendance Threshold', result.students_above_high_threshold, (summary, container) => displayPagedSection('students_above_high_threshold', summary, container));
 
-    // Append the results container to the collapsible section
-    container.appendChild(resultsContainer);
-    console.log("Results displayed for students below threshold");
+    console.log("Z-scores by class and year group:", result.group_z_scores);
+    createCollapsibleSection('Z-scores by Subject, Class and Year Group', result.group_z_scores, (summary, container) => displayPagedSection('group_z_scores', summary, container));
 }
 
-function displayStudentsAboveAttendanceThreshold(data, container) {
-    console.log("Displaying students above attendance threshold with data:", data);
-
-    // Check and remove existing results container if it exists
-    const existingResultsContainer = container.querySelector('.attendance-threshold-results');
-    if (existingResultsContainer) {
-        console.log("Removing existing results container for above threshold");
-        existingResultsContainer.remove();
-    }
 
-    // Create a new container for the results
-    const resultsContainer = document.createElement('div');
-    resultsContainer.className = 'attendance-threshold-results';
+document.getElementById('downloadReportBtn').addEventListener('click', function() {
+    window.location.href = '/download_report'; // Adjust the route if necessary
+});
 
-    if (data.length === 0) {
-        resultsContainer.innerHTML = '<p>No students found above the specified attendance threshold.</p>';
-        console.log("No students found above threshold");
-    } else {
-        const table = document.createElement('table');
-        table.innerHTML = `
-            <thead>
-                <tr>
-                    <th>StudentID</th>
-                    <th>Subjects Above Threshold</th>
-                    <th>Number of Subjects Above Threshold</th>
-                </tr>
-            </thead>
-        `;
+// One .docx per student in a ZIP, streamed as each report is rendered
+document.getElementById('downloadReportArchiveBtn').addEventListener('click', function() {
+    window.location.href = '/download_report_archive';
+});
 
-        const tbody = document.createElement('tbody');
-        data.forEach(student => {
-            const tr = document.createElement('tr');
-            tr.innerHTML = `
-                <td>${student.StudentID}</td>
-                <td>${student.Subjects.join(', ')}</td>
-                <td>${student.SubjectCount}</td>
-            `;
-            tbody.appendChild(tr);
-            console.log("Adding student:", student.StudentID);
-        });
+// Re-apply the thresholds to the already analysed data without re-uploading the files
+document.getElementById('applyThresholdsBtn').addEventListener('click', async function() {
+    if (!latestResult) return;
 
-        console.log("Created table with data:");
-        console.table(data);
+    const formData = new FormData();
+    ['lowAttendanceThreshold', 'highAttendanceThreshold', 'lowMarksThreshold', 'highMarksThreshold'].forEach(id => {
+        formData.append(id, document.getElementById(id).value);
+    });
 
-        table.appendChild(tbody);
-        resultsContainer.appendChild(table);
+    try {
+        const response = await fetch('/apply_thresholds', { method: 'POST', body: formData });
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'Server responded with an error');
+        }
+        latestResult = { ...latestResult, ...data };
+        displayAnalysisResults(latestResult);
+        updateAnalysisLog('Thresholds re-applied.');
+    } catch (error) {
+        console.error("Error applying thresholds:", error);
+        displayMessage(error.message, 'error');
     }
-
-    // Append the results container to the collapsible section
-    container.appendChild(resultsContainer);
-    console.log("Results displayed for students above threshold");
-}
-
-
-
-
-document.getElementById('downloadReportBtn').addEventListener('click', function() {
-    window.location.href = '/download_report'; // Adjust the route if necessary
 });
 
 function clearResults() {
@@ -322,6 +249,11 @@ function displayCorrelationAndScatterPlotResults(correlationAnalysis, plotFilena
     const correlationDiv = document.createElement('div');
     correlationDiv.className = 'result-section';
     correlationDiv.innerHTML = `<h3>Correlation Results</h3>${displayCorrelationResults(correlationAnalysis)}`;
+    if (correlationAnalysis.line_of_best_fit) {
+        const regressionExplainer = document.createElement('p');
+        correlationDiv.appendChild(createExplainButton(correlationAnalysis.line_of_best_fit, regressionExplainer));
+        correlationDiv.appendChild(regressionExplainer);
+    }
     analysisResults.appendChild(correlationDiv);
     
     // Scatter Plot
@@ -330,9 +262,132 @@ function displayCorrelationAndScatterPlotResults(correlationAnalysis, plotFilena
         scatterPlotDiv.className = 'result-section';
         scatterPlotDiv.innerHTML = `<h3>Scatter Plot</h3><img src="/${plotFilename}" alt="Scatter Plot" class="scatter-plot-image">`;
         analysisResults.appendChild(scatterPlotDiv);
+    } else if (correlationAnalysis.chart_data) {
+        const scatterPlotDiv = document.createElement('div');
+        scatterPlotDiv.className = 'result-section';
+        scatterPlotDiv.innerHTML = '<h3>Scatter Plot</h3>';
+        const canvas = createChartCanvas('Scatter Plot');
+        scatterPlotDiv.appendChild(canvas);
+        analysisResults.appendChild(scatterPlotDiv);
+        drawScatterChart(canvas, correlationAnalysis.chart_data);
     }
 }
 
+// Charts drawn in the browser from the binned data sent in the 'data' chart mode
+const CHART_WIDTH = 720;
+const CHART_HEIGHT = 540;
+const CHART_MARGIN = { top: 40, right: 20, bottom: 50, left: 60 };
+
+function createChartCanvas(label) {
+    const canvas = document.createElement('canvas');
+    canvas.width = CHART_WIDTH;
+    canvas.height = CHART_HEIGHT;
+    canvas.className = 'scatter-plot-image';
+    canvas.setAttribute('role', 'img');
+    canvas.setAttribute('aria-label', label);
+    return canvas;
+}
+
+// Draw the title, axes and tick labels, and return functions mapping data values to canvas pixels
+function drawChartAxes(ctx, [xMin, xMax], [yMin, yMax], title, xLabel, yLabel) {
+    const plotWidth = CHART_WIDTH - CHART_MARGIN.left - CHART_MARGIN.right;
+    const plotHeight = CHART_HEIGHT - CHART_MARGIN.top - CHART_MARGIN.bottom;
+    const x = value => CHART_MARGIN.left + (xMax === xMin ? 0.5 : (value - xMin) / (xMax - xMin)) * plotWidth;
+    const y = value => CHART_MARGIN.top + plotHeight - (yMax === yMin ? 0.5 : (value - yMin) / (yMax - yMin)) * plotHeight;
+
+    ctx.clearRect(0, 0, CHART_WIDTH, CHART_HEIGHT);
+    ctx.strokeStyle = '#333';
+    ctx.fillStyle = '#333';
+    ctx.lineWidth = 1;
+    ctx.font = '12px sans-serif';
+
+    ctx.beginPath();
+    ctx.moveTo(CHART_MARGIN.left, CHART_MARGIN.top);
+    ctx.lineTo(CHART_MARGIN.left, CHART_MARGIN.top + plotHeight);
+    ctx.lineTo(CHART_MARGIN.left + plotWidth, CHART_MARGIN.top + plotHeight);
+    ctx.stroke();
+
+    const ticks = 5;
+    for (let i = 0; i <= ticks; i++) {
+        const xValue = xMin + (xMax - xMin) * i / ticks;
+        const yValue = yMin + (yMax - yMin) * i / ticks;
+        ctx.textAlign = 'center';
+        ctx.fillText(xValue.toFixed(0), x(xValue), CHART_MARGIN.top + plotHeight + 16);
+        ctx.textAlign = 'right';
+        ctx.fillText(yValue.toFixed(0), CHART_MARGIN.left - 6, y(yValue) + 4);
+    }
+
+    ctx.textAlign = 'center';
+    ctx.fillText(xLabel, CHART_MARGIN.left + plotWidth / 2, CHART_HEIGHT - 10);
+    ctx.font = 'bold 14px sans-serif';
+    ctx.fillText(title, CHART_WIDTH / 2, 22);
+    ctx.save();
+    ctx.font = '12px sans-serif';
+    ctx.translate(16, CHART_MARGIN.top + plotHeight / 2);
+    ctx.rotate(-Math.PI / 2);
+    ctx.fillText(yLabel, 0, 0);
+    ctx.restore();
+    return { x, y };
+}
+
+function drawScatterChart(canvas, chartData) {
+    const ctx = canvas.getContext('2d');
+    const { x_edges: xEdges, y_edges: yEdges, cells, line } = chartData;
+    if (!cells.length) {
+        ctx.fillText('No matching attendance and marks data to plot.', CHART_MARGIN.left, CHART_MARGIN.top);
+        return;
+    }
+
+    const scale = drawChartAxes(
+        ctx, [xEdges[0], xEdges[xEdges.length - 1]], [yEdges[0], yEdges[yEdges.length - 1]],
+        'Correlation between Student Attendance and Final Marks', 'Attendance Percentage', 'Final Mark'
+    );
+
+    // Shade each occupied bin by how many students fall in it
+    const maxCount = Math.max(...cells.map(cell => cell[2]));
+    cells.forEach(([xBin, yBin, count]) => {
+        const left = scale.x(xEdges[xBin]);
+        const right = scale.x(xEdges[xBin + 1]);
+        const top = scale.y(yEdges[yBin + 1]);
+        const bottom = scale.y(yEdges[yBin]);
+        ctx.fillStyle = `rgba(31, 119, 180, ${0.15 + 0.85 * count / maxCount})`;
+        ctx.fillRect(left, top, Math.max(right - left, 1), Math.max(bottom - top, 1));
+    });
+
+    if (line) {
+        ctx.strokeStyle = 'red';
+        ctx.lineWidth = 2;
+        ctx.beginPath();
+        line.x.forEach((xValue, i) => {
+            const method = i === 0 ? 'moveTo' : 'lineTo';
+            ctx[method](scale.x(xValue), scale.y(line.y[i]));
+        });
+        ctx.stroke();
+        ctx.fillStyle = 'red';
+        ctx.textAlign = 'right';
+        ctx.fillText(`Line of Best Fit (R²=${line.r_squared.toFixed(2)})`, CHART_WIDTH - CHART_MARGIN.right, CHART_MARGIN.top + 12);
+    }
+    ctx.fillStyle = '#333';
+    ctx.textAlign = 'right';
+    ctx.fillText(`${chartData.points} points`, CHART_WIDTH - CHART_MARGIN.right, CHART_MARGIN.top + 28);
+}
+
+function drawHistogramChart(canvas, histogramData) {
+    const ctx = canvas.getContext('2d');
+    const { edges, counts } = histogramData;
+    const scale = drawChartAxes(
+        ctx, [edges[0], edges[edges.length - 1]], [0, Math.max(...counts, 1)],
+        'Distribution of Attendance Percentages', 'Attendance Percentage', 'Number of Students'
+    );
+
+    ctx.fillStyle = 'rgba(31, 119, 180, 0.7)';
+    counts.forEach((count, i) => {
+        const left = scale.x(edges[i]);
+        const right = scale.x(edges[i + 1]);
+        ctx.fillRect(left, scale.y(count), Math.max(right - left - 1, 1), scale.y(0) - scale.y(count));
+    });
+}
+
 
 function displayCorrelationResults({ correlation, line_of_best_fit, explainer_text }) {
     const correlationValue = isFinite(correlation) ? correlation.toFixed(2) : 'N/A';
@@ -348,41 +403,182 @@ function displayCorrelationResults({ correlation, line_of_best_fit, explainer_te
             <li><strong>P-value:</strong> ${toFixedIfNumber(line_of_best_fit.p_value, 4)}</li>
             <li><strong>Standard Error:</strong> ${toFixedIfNumber(line_of_best_fit.std_err)}</li>
         </ul>
-        <p>${explainer_text.regression}</p>
     `;
     return resultsHTML;
 }
 
-function displayLowZScoresResults(lowZScores, container) {
+// Button that asks the server to explain a regression and shows the text in target
+function createExplainButton(stats, target) {
+    const button = document.createElement('button');
+    button.textContent = 'Explain';
+    const fittable = ['slope', 'intercept', 'r_value', 'p_value', 'std_err'].every(name => typeof stats[name] === 'number');
+    button.disabled = !fittable;
+
+    button.addEventListener('click', async () => {
+        button.disabled = true;
+        try {
+            const response = await fetch('/regression_explainer', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(stats)
+            });
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.error || 'Failed to explain the regression');
+            }
+            target.innerText = data.explainer;
+        } catch (error) {
+            console.error('Error explaining regression:', error);
+            target.innerText = 'Error: ' + error.message;
+            button.disabled = false;
+        }
+    });
+    return button;
+}
+
+// Attendance/marks regression within each subject, year group and class, as one table
+function displayRegressionTable(rows, container) {
     container.innerHTML = ''; // Clear the container
-    if (lowZScores.length === 0) {
-        container.innerHTML = '<p>No low Z-scores found.</p>';
+    if (rows.length === 0) {
+        container.innerHTML = '<p>No data available.</p>';
         return;
     }
-    
+
+    const groupingLabels = { subject: 'Subject', year: 'School Year', class: 'Class' };
+    const explainer = document.createElement('p');
     const table = document.createElement('table');
     table.innerHTML = `
         <thead>
             <tr>
-                <th>StudentID</th>
-                <th>Subject</th>
-                <th>Z-Score</th>
+                <th>Grouping</th>
+                <th>Group</th>
+                <th>Pairs</th>
+                <th>Slope</th>
+                <th>Intercept</th>
+                <th>R-value</th>
+                <th>P-value</th>
+                <th>Standard Error</th>
+                <th></th>
             </tr>
         </thead>
     `;
-    
     const tbody = document.createElement('tbody');
-    lowZScores.forEach(item => {
+    rows.forEach(row => {
         const tr = document.createElement('tr');
         tr.innerHTML = `
-            <td>${item.StudentID}</td>
-            <td>${item.Subject}</td>
-            <td>${toFixedIfNumber(item.zScore)}</td>
+            <td>${groupingLabels[row.grouping] || row.grouping}</td>
+            <td>${row.group}</td>
+            <td>${row.pairs}</td>
+            <td>${toFixedIfNumber(row.slope)}</td>
+            <td>${toFixedIfNumber(row.intercept)}</td>
+            <td>${toFixedIfNumber(row.r_value)}</td>
+            <td>${toFixedIfNumber(row.p_value, 4)}</td>
+            <td>${toFixedIfNumber(row.std_err)}</td>
         `;
+        const explainCell = document.createElement('td');
+        explainCell.appendChild(createExplainButton(row, explainer));
+        tr.appendChild(explainCell);
         tbody.appendChild(tr);
     });
     table.appendChild(tbody);
     container.appendChild(table);
+    container.appendChild(explainer);
+}
+
+// Paged result sections: [column, heading, format] for the columns each one shows
+const joinList = value => Array.isArray(value) ? value.join(', ') : value;
+const RESULT_SECTION_COLUMNS = {
+    low_z_scores: [['StudentID', 'StudentID'], ['Subject', 'Subject'], ['zScore', 'Z-Score', value => toFixedIfNumber(value)]],
+    high_z_scores: [['StudentID', 'StudentID'], ['Subject', 'Subject'], ['zScore', 'Z-Score', value => toFixedIfNumber(value)]],
+    students_below_threshold_in_multiple_subjects: [['StudentID', 'StudentID'], ['Subjects', 'Subjects Below Threshold', joinList]],
+    students_below_low_threshold: [['StudentID', 'StudentID'], ['Subjects', 'Subjects Below Threshold', joinList], ['SubjectCount', 'Number of Subjects Below Threshold']],
+    students_above_high_threshold: [['StudentID', 'StudentID'], ['Subjects', 'Subjects Above Threshold', joinList], ['SubjectCount', 'Number of Subjects Above Threshold']],
+    group_z_scores: [['StudentID', 'StudentID'], ['Subject', 'Subject'], ['Class', 'Class'], ['School Year', 'Year Group'], ['zScore', 'Subject Z-Score', value => toFixedIfNumber(value)], ['ClassZScore', 'Class Z-Score', value => toFixedIfNumber(value)], ['YearGroupZScore', 'Year Group Z-Score', value => toFixedIfNumber(value)]]
+};
+const RESULT_SECTION_EMPTY_MESSAGES = {
+    low_z_scores: 'No low Z-scores found.',
+    high_z_scores: 'No students found with high Z-scores.',
+    students_below_threshold_in_multiple_subjects: 'No students below threshold in multiple subjects.',
+    students_below_low_threshold: 'No students found below the specified attendance threshold.',
+    students_above_high_threshold: 'No students found above the specified attendance threshold.',
+    group_z_scores: 'No marks to compare.'
+};
+const RESULT_PAGE_SIZE = 50;
+
+// Fetch and show one page of a result section; clicking a heading sorts by it, the pager moves between pages
+async function displayPagedSection(section, summary, container, page = { offset: 0, sort: null, order: 'asc' }) {
+    if (!summary || summary.rows === 0) {
+        container.innerHTML = `<p>${RESULT_SECTION_EMPTY_MESSAGES[section]}</p>`;
+        return;
+    }
+
+    const columns = RESULT_SECTION_COLUMNS[section];
+    const params = new URLSearchParams({
+        offset: page.offset,
+        limit: RESULT_PAGE_SIZE,
+        order: page.order,
+        columns: columns.map(([column]) => column).join(',')
+    });
+    if (page.sort) {
+        params.set('sort', page.sort);
+    }
+
+    let data;
+    try {
+        const response = await fetch(`/results/${section}?${params}`);
+        data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'Failed to load results');
+        }
+    } catch (error) {
+        console.error(`Error loading ${section}:`, error);
+        container.innerHTML = `<p>Error: ${error.message}</p>`;
+        return;
+    }
+
+    container.innerHTML = ''; // Clear the container
+    const table = document.createElement('table');
+    const headerRow = document.createElement('tr');
+    columns.forEach(([column, heading]) => {
+        const th = document.createElement('th');
+        const arrow = page.sort === column ? (page.order === 'asc' ? ' ▲' : ' ▼') : '';
+        th.textContent = heading + arrow;
+        th.style.cursor = 'pointer';
+        th.addEventListener('click', () => {
+            const order = page.sort === column && page.order === 'asc' ? 'desc' : 'asc';
+            displayPagedSection(section, summary, container, { offset: 0, sort: column, order });
+        });
+        headerRow.appendChild(th);
+    });
+    const thead = document.createElement('thead');
+    thead.appendChild(headerRow);
+    table.appendChild(thead);
+
+    const tbody = document.createElement('tbody');
+    data.rows.forEach(row => {
+        const tr = document.createElement('tr');
+        columns.forEach(([column, , format]) => {
+            const td = document.createElement('td');
+            td.textContent = format ? format(row[column]) : row[column];
+            tr.appendChild(td);
+        });
+        tbody.appendChild(tr);
+    });
+    table.appendChild(tbody);
+    container.appendChild(table);
+
+    const pager = document.createElement('div');
+    pager.className = 'pager';
+    const last = Math.min(data.offset + data.rows.length, data.total);
+    pager.insertAdjacentHTML('beforeend', `<span>Rows ${data.offset + 1}–${last} of ${data.total}</span>`);
+    [['Previous', data.offset - data.limit, data.offset > 0], ['Next', data.offset + data.limit, last < data.total]].forEach(([label, offset, enabled]) => {
+        const button = document.createElement('button');
+        button.textContent = label;
+        button.disabled = !enabled;
+        button.addEventListener('click', () => displayPagedSection(section, summary, container, { ...page, offset: Math.max(offset, 0) }));
+        pager.appendChild(button);
+    });
+    container.appendChild(pager);
 }
 
 function displayAverageMarksByClass(averageMarks, container) {
@@ -448,6 +644,50 @@ function displaySelectedClasses(selectedClasses, averageMarks, selectedClassesCo
     }
 }
 
+function displayClassMapping(classMapping, container) {
+    container.innerHTML = ''; // Clear the container
+
+    const summary = document.createElement('p');
+    summary.textContent = `Exact matches: ${classMapping.exact || 0}, normalized matches: ${classMapping.normalized || 0}, section suffix matches: ${classMapping.suffix || 0}.`;
+    container.appendChild(summary);
+
+    const fuzzyMatches = Object.entries(classMapping.fuzzy || {});
+    if (fuzzyMatches.length === 0) {
+        container.insertAdjacentHTML('beforeend', '<p>No classes were matched by similarity.</p>');
+    } else {
+        const table = document.createElement('table');
+        table.innerHTML = `
+            <thead>
+                <tr>
+                    <th>Attendance Class</th>
+                    <th>Matched Marks Class</th>
+                    <th>Subject</th>
+                    <th>Similarity</th>
+                </tr>
+            </thead>
+        `;
+        const tbody = document.createElement('tbody');
+        fuzzyMatches.forEach(([className, match]) => {
+            const tr = document.createElement('tr');
+            tr.innerHTML = `
+                <td>${className}</td>
+                <td>${match.matched_class}</td>
+                <td>${match.subject}</td>
+                <td>${toFixedIfNumber(match.similarity)}</td>
+            `;
+            tbody.appendChild(tr);
+        });
+        table.appendChild(tbody);
+        container.appendChild(table);
+    }
+
+    if ((classMapping.unmatched || []).length > 0) {
+        const unmatched = document.createElement('p');
+        unmatched.textContent = `Classes without a matching subject (excluded): ${classMapping.unmatched.join(', ')}`;
+        container.appendChild(unmatched);
+    }
+}
+
 function displayYearGroupAttendanceSummary(yearGroupAttendanceSummary, container) {
     container.innerHTML = ''; // Clear the container
     if (yearGroupAttendanceSummary.length === 0) {
@@ -487,48 +727,28 @@ function displayYearGroupAttendanceSummary(yearGroupAttendanceSummary, container
     table.appendChild(tbody);
     container.appendChild(table);
 
+    if (!latestResult) return;
+
     const histogramDiv = document.createElement('div');
-    histogramDiv.innerHTML = `
-        <h4>Distribution of Attendance Percentages</h4>
-        <img src="/static/images/attendance_distribution_histogram.png" alt="Attendance Distribution Histogram">
-    `;
-    container.appendChild(histogramDiv);
+    if (latestResult.histogram_filename) {
+        histogramDiv.innerHTML = `
+            <h4>Distribution of Attendance Percentages</h4>
+            <img src="/${latestResult.histogram_filename}" alt="Attendance Distribution Histogram">
+        `;
+        container.appendChild(histogramDiv);
+    } else if (latestResult.histogram_data) {
+        histogramDiv.innerHTML = '<h4>Distribution of Attendance Percentages</h4>';
+        const canvas = createChartCanvas('Attendance Distribution Histogram');
+        histogramDiv.appendChild(canvas);
+        container.appendChild(histogramDiv);
+        drawHistogramChart(canvas, latestResult.histogram_data);
+    }
 }
 
 function toFixedIfNumber(value, digits = 2) {
     return typeof value === 'number' ? value.toFixed(digits) : 'N/A';
 }
 
-function displayStudentsBelowThreshold(studentsBelowThreshold, container) {
-    container.innerHTML = ''; // Clear the container
-    if (studentsBelowThreshold.length === 0) {
-        container.innerHTML = '<p>No students below threshold in multiple subjects.</p>';
-        return;
-    }
-    
-    const table = document.createElement('table');
-    table.innerHTML = `
-        <thead>
-            <tr>
-                <th>StudentID</th>
-                <th>Subjects Below Threshold</th>
-            </tr>
-        </thead>
-    `;
-    
-    const tbody = document.createElement('tbody');
-    studentsBelowThreshold.forEach(student => {
-        const tr = document.createElement('tr');
-        tr.innerHTML = `
-            <td>${student.StudentID}</td>
-            <td>${student.Subjects.join(', ')}</td>
-        `;
-        tbody.appendChild(tr);
-    });
-    table.appendChild(tbody);
-    container.appendChild(table);
-}
-
 function displayMessage(message, className) {
     const messagesDiv = document.getElementById('messages');
     messagesDiv.innerHTML = `<div class="${className}">${message}</div>`;
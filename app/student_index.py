@@ -0,0 +1,171 @@
+import threading
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+from .dataset_store import get_dataset_store
+from .dtypes import widen_floats
+
+NAME_COLUMNS = ('StudentName', 'Student Name')
+MIN_NGRAM_QUERY = 3
+MAX_CACHED_INDEXES = 16
+
+# The only columns the index reads from each stored frame, besides any name column
+INDEX_COLUMNS = {
+    'marks': ['StudentID', 'Subject', 'CalculatedFinalMark', 'zScore'],
+    'attendance': ['StudentID', 'Subject', 'OverallAttendancePercentage'],
+}
+
+
+def ngrams(text, n=MIN_NGRAM_QUERY):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def find_name_column(*frames):
+    for df in frames:
+        for column in NAME_COLUMNS:
+            if column in df.columns:
+                return df, column
+    return None, None
+
+
+def student_names(marks_df, attendance_df):
+    """Map every student ID in either frame, in ID order, to their name ('' if neither frame has one)."""
+    names = {}
+    name_df, name_column = find_name_column(attendance_df, marks_df)
+    if name_column is not None:
+        named = name_df[['StudentID', name_column]].dropna().drop_duplicates('StudentID')
+        names = dict(zip(named['StudentID'], named[name_column].astype(str)))
+
+    student_ids = set(attendance_df['StudentID'].dropna().tolist()) | set(marks_df['StudentID'].dropna().tolist())
+    return {student_id: names.get(student_id, '') for student_id in sorted(student_ids)}
+
+
+def load_student_columns(dataset_id, name, columns):
+    """Map only the given columns of a stored frame, plus its student name column if it has one."""
+    store = get_dataset_store()
+    available = store.frame_columns(dataset_id, name)
+    wanted = [column for column in list(columns) + list(NAME_COLUMNS) if column in available]
+    return store.load_frame(dataset_id, name, columns=wanted)
+
+
+class StudentIndex:
+    """
+    Per-dataset lookup structure for the student search routes.
+
+    The marks and attendance frames are sorted by StudentID once so each
+    student's rows are a contiguous slice, and every student's ID and name are
+    indexed by trigram so a search touches only the matching students instead
+    of scanning every row. float32 marks are widened once here, so the records
+    returned hold the decimals that were uploaded.
+    """
+
+    def __init__(self, marks_df, attendance_df):
+        self.marks = widen_floats(marks_df.sort_values('StudentID', kind='stable').reset_index(drop=True))
+        self.attendance = widen_floats(attendance_df.sort_values('StudentID', kind='stable').reset_index(drop=True))
+        self.marks_slices = self._row_slices(self.marks)
+        self.attendance_slices = self._row_slices(self.attendance)
+
+        self.names = student_names(self.marks, self.attendance)
+        self.student_ids = list(self.names)
+        self.ids_by_text = {str(student_id): student_id for student_id in self.student_ids}
+
+        self.search_text = {}
+        self.ngram_index = defaultdict(set)
+        for student_id in self.student_ids:
+            text = f"{student_id}\t{self.names[student_id]}".lower()
+            self.search_text[student_id] = text
+            for gram in ngrams(text):
+                self.ngram_index[gram].add(student_id)
+
+    @staticmethod
+    def _row_slices(df):
+        """Map each StudentID to the slice of rows it occupies in a frame sorted by StudentID."""
+        if df.empty:
+            return {}
+        ids = df['StudentID'].to_numpy()
+        boundaries = np.flatnonzero(ids[1:] != ids[:-1]) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(ids)]))
+        return {ids[start].item(): slice(start, end) for start, end in zip(starts, ends)}
+
+    def students(self):
+        return [{'StudentID': student_id, 'StudentName': self.names[student_id]} for student_id in self.student_ids]
+
+    def search(self, query):
+        """Return the IDs of students whose ID or name contains query, each student once; an exact ID match comes first."""
+        query = query.strip().lower()
+        if not query:
+            return list(self.student_ids)
+
+        if len(query) >= MIN_NGRAM_QUERY:
+            postings = sorted((self.ngram_index.get(gram, set()) for gram in ngrams(query)), key=len)
+            candidates = set.intersection(*postings) if postings and postings[0] else set()
+        else:
+            candidates = self.student_ids
+        matches = sorted(student_id for student_id in candidates if query in self.search_text[student_id])
+
+        exact = self.ids_by_text.get(query)
+        if exact is not None:
+            matches.remove(exact)
+            matches.insert(0, exact)
+        return matches
+
+    def marks_for(self, student_id):
+        rows = self.marks.iloc[self.marks_slices[student_id]] if student_id in self.marks_slices else self.marks.iloc[0:0]
+        return rows[['Subject', 'CalculatedFinalMark', 'zScore']].to_dict(orient='records')
+
+    def attendance_for(self, student_id):
+        rows = self.attendance.iloc[self.attendance_slices[student_id]] if student_id in self.attendance_slices else self.attendance.iloc[0:0]
+        return rows[['Subject', 'OverallAttendancePercentage']].to_dict(orient='records')
+
+    def student_record(self, student_id):
+        return {
+            'StudentID': student_id,
+            'StudentName': self.names[student_id],
+            'Marks': self.marks_for(student_id),
+            'Attendance': self.attendance_for(student_id),
+        }
+
+
+_student_indexes = OrderedDict()
+_student_indexes_lock = threading.Lock()
+
+
+def get_student_index(dataset_id):
+    """Return the StudentIndex for a stored dataset, building it on first use."""
+    with _student_indexes_lock:
+        index = _student_indexes.get(dataset_id)
+        if index is not None:
+            _student_indexes.move_to_end(dataset_id)
+            return index
+
+    index = StudentIndex(
+        load_student_columns(dataset_id, 'marks', INDEX_COLUMNS['marks']),
+        load_student_columns(dataset_id, 'attendance', INDEX_COLUMNS['attendance']),
+    )
+
+    with _student_indexes_lock:
+        _student_indexes[dataset_id] = index
+        while len(_student_indexes) > MAX_CACHED_INDEXES:
+            _student_indexes.popitem(last=False)
+    return index
+
+
+def list_students(dataset_id):
+    """
+    Every student in a stored dataset as {'StudentID', 'StudentName'}, in ID order.
+
+    Uses the dataset's index if it is already built; otherwise only the ID and
+    name columns are read, without building one.
+    """
+    with _student_indexes_lock:
+        index = _student_indexes.get(dataset_id)
+    if index is not None:
+        return index.students()
+
+    names = student_names(
+        load_student_columns(dataset_id, 'marks', ['StudentID']),
+        load_student_columns(dataset_id, 'attendance', ['StudentID']),
+    )
+    return [{'StudentID': student_id, 'StudentName': name} for student_id, name in names.items()]
@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+
+from celery import Celery, Task, shared_task
+from flask import current_app
+
+from .dataset_store import get_dataset_store
+from .progress import ProgressReporter
+from .utils import to_json
+
+MAX_PROGRESS_LOG_LINES = 200
+
+
+def celery_init_app(app):
+    """Create the Celery app from app.config['CELERY'] and run every task inside a Flask app context."""
+    class FlaskTask(Task):
+        def __call__(self, *args, **kwargs):
+            with app.app_context():
+                return self.run(*args, **kwargs)
+
+    celery_config = dict(app.config['CELERY'])
+
+    # The filesystem broker and file result backend need their folders to exist before first use
+    if celery_config.get('broker_url', '').startswith('filesystem://'):
+        for folder in celery_config.get('broker_transport_options', {}).values():
+            if isinstance(folder, str):
+                os.makedirs(folder, exist_ok=True)
+    if celery_config.get('result_backend', '').startswith('file://'):
+        os.makedirs(celery_config['result_backend'][len('file://'):], exist_ok=True)
+
+    celery_app = Celery(app.name, task_cls=FlaskTask)
+    celery_app.config_from_object(celery_config)
+    celery_app.set_default()
+    app.extensions['celery'] = celery_app
+    return celery_app
+
+
+class TaskProgressReporter(ProgressReporter):
+    """Publishes analysis progress as the task's PROGRESS state so /jobs/<job_id> can report it."""
+
+    def __init__(self, task):
+        super().__init__()
+        self.task = task
+        # Pipeline stages report from their own threads, where the task's request is not set
+        self.task_id = task.request.id
+        self.log_lines = []
+        self.stages = []
+        self._lock = threading.Lock()
+
+    def emit(self, event_type, data):
+        with self._lock:
+            if event_type == 'log':
+                self.log_lines = (self.log_lines + [data])[-MAX_PROGRESS_LOG_LINES:]
+            elif event_type == 'stage':
+                self.stages.append(json.loads(data))
+            if self.task_id is not None:
+                self.task.update_state(task_id=self.task_id, state='PROGRESS', meta={'log': self.log_lines, 'stages': self.stages})
+
+
+@shared_task(bind=True)
+def run_analysis_task(self, attendance_file, marks_file, low_attendance_threshold, high_attendance_threshold, low_marks_threshold, high_marks_threshold, dataset_id=None, chart_mode=None):
+    """Celery task running the full upload analysis; the result is the same JSON the SSE stream sends."""
+    from .analysis import run_comprehensive_analysis
+
+    # Serialized here, as the result holds DataFrames the Celery result backend cannot encode
+    return to_json(run_comprehensive_analysis(
+        attendance_file, marks_file,
+        low_attendance_threshold, high_attendance_threshold,
+        low_marks_threshold, high_marks_threshold,
+        dataset_id=dataset_id, reporter=TaskProgressReporter(self), chart_mode=chart_mode
+    ))
+
+
+@shared_task(bind=True)
+def generate_report_task(self, dataset_id, low_marks_threshold):
+    """Celery task building the combined student report for a dataset; the result holds the path of the saved .docx."""
+    from .report_generator import generate_student_report, prepare_report_data
+
+    store = get_dataset_store()
+    marks_df, student_ids, attendance_df, overall_attendance = prepare_report_data(
+        store.upload_path(dataset_id, 'marks'), store.upload_path(dataset_id, 'attendance'), low_marks_threshold
+    )
+    report = generate_student_report(
+        marks_df, student_ids, attendance_df, overall_attendance,
+        workers=current_app.config.get('REPORT_WORKERS', 1)
+    )
+
+    # Kept with the dataset, so it expires along with the uploads it was made from
+    report_path = os.path.join(store.dataset_dir(dataset_id), f"report_{self.request.id or 'report'}.docx")
+    with open(report_path, 'wb') as f:
+        f.write(report.getbuffer())
+    return {'report_path': report_path, 'student_count': len(student_ids)}
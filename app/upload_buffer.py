@@ -0,0 +1,128 @@
+import hashlib
+import io
+import os
+import tempfile
+
+from flask import Request
+
+DEFAULT_SPOOL_MEMORY_BYTES = 1024 * 1024  # 1 Megabyte
+SPOOL_SUFFIX = '.spool'
+
+
+class SpooledUpload:
+    """
+    The buffer an uploaded file is parsed into from the request body.
+
+    It stays in memory up to max_memory bytes, then spills to a named file in
+    spool_dir, which persist() renames into the dataset rather than copying.
+    Bytes are hashed and counted as they arrive, so the upload is hashed once
+    and never re-read for it. Past max_bytes (0 for no limit) the rest of the
+    file is discarded and too_large is set instead.
+
+    Reading and seeking go to whichever buffer holds the bytes. close() removes
+    a spilled file that was never persisted.
+    """
+
+    def __init__(self, spool_dir, max_memory=DEFAULT_SPOOL_MEMORY_BYTES, max_bytes=0):
+        self.spool_dir = spool_dir
+        self.max_memory = max_memory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.too_large = False
+        self.spilled = False
+        self.spill_path = None
+        self.file = io.BytesIO()
+        self._sha256 = hashlib.sha256()
+
+    def __getattr__(self, name):
+        # read, seek, tell, closed and the rest of the file interface
+        if name == 'file':
+            raise AttributeError(name)
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def rollover(self):
+        """Move the bytes held in memory to a new file in spool_dir, which takes every later write."""
+        if self.spilled:
+            return
+        os.makedirs(self.spool_dir, exist_ok=True)
+        fd, self.spill_path = tempfile.mkstemp(suffix=SPOOL_SUFFIX, dir=self.spool_dir)
+        spill = os.fdopen(fd, 'w+b')
+        spill.write(self.file.getbuffer())
+        spill.seek(self.file.tell())
+        self.file = spill
+        self.spilled = True
+
+    def write(self, data):
+        self.size += len(data)
+        if self.too_large or (self.max_bytes and self.size > self.max_bytes):
+            self.too_large = True
+            return len(data)
+        self._sha256.update(data)
+        written = self.file.write(data)
+        if not self.spilled and self.max_memory and self.file.tell() > self.max_memory:
+            self.rollover()
+        return written
+
+    @property
+    def digest(self):
+        return self._sha256.hexdigest()
+
+    def persist(self, path):
+        """Make the upload's bytes the file at path (a rename once spilled) and return their SHA-256."""
+        if self.spilled:
+            self.file.flush()
+            os.replace(self.spill_path, path)
+            self.spill_path = None
+        else:
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(self.file.getbuffer())
+            os.replace(temp_path, path)
+        return self.digest
+
+    def close(self):
+        self.file.close()
+        if self.spill_path is not None:
+            try:
+                os.remove(self.spill_path)
+            except FileNotFoundError:
+                pass
+            self.spill_path = None
+
+
+class UploadRequest(Request):
+    """
+    Request that parses uploaded files into SpooledUpload buffers configured by the dataset store.
+
+    Flask closes the request when it is done with it, even when the handler
+    raised or the body was cut off mid-parse, and closing it closes every buffer
+    it created, so no spilled file outlives its request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.spooled_uploads = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        from .dataset_store import get_dataset_store
+
+        upload = get_dataset_store().spooled_upload()
+        self.spooled_uploads.append(upload)
+        return upload
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            for upload in self.spooled_uploads:
+                upload.close()
+            self.spooled_uploads = []
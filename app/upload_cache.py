@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+import pandas as pd
+from flask import current_app, has_app_context
+
+from .dataset_store import stored_digest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'school_data_analysis', 'upload_cache')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256 Megabytes
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(file_path):
+    """Return the SHA-256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadCache:
+    """
+    Content-addressed cache of parsed uploads.
+
+    Entries are keyed by the SHA-256 of the uploaded bytes and stored as Feather
+    files, so re-uploading an unchanged workbook skips the Excel parse entirely.
+    The cache directory is capped at max_bytes; the least recently used entries
+    (by file modification time, refreshed on every hit) are evicted first.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_path(self, digest, namespace):
+        return os.path.join(self.cache_dir, f"{digest}-{namespace}.feather")
+
+    def get(self, digest, namespace='raw'):
+        path = self._entry_path(digest, namespace)
+        try:
+            df = pd.read_feather(path)
+        except (FileNotFoundError, OSError):
+            return None
+        try:
+            os.utime(path)  # Mark as most recently used
+        except OSError:
+            pass
+        return df
+
+    def put(self, digest, df, namespace='raw'):
+        path = self._entry_path(digest, namespace)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            df.reset_index(drop=True).to_feather(temp_path)
+            os.replace(temp_path, path)
+        except Exception as e:
+            # Frames Arrow can't represent (e.g. mixed-type object columns) are simply not cached
+            logger.warning(f"Could not cache parsed upload {digest[:12]}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+        self._evict()
+        return True
+
+    def get_or_parse(self, file_path, parser, namespace='raw', digest=None):
+        """Return the parsed DataFrame for file_path, parsing with parser only on a cache miss."""
+        if digest is None:
+            digest = stored_digest(file_path) or hash_file(file_path)
+        df = self.get(digest, namespace)
+        if df is not None:
+            logger.info(f"Upload cache hit for {os.path.basename(file_path)} ({digest[:12]})")
+            return df
+        logger.info(f"Upload cache miss for {os.path.basename(file_path)} ({digest[:12]})")
+        df = parser(file_path)
+        self.put(digest, df, namespace)
+        return df
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.feather'):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total_bytes -= size
+
+
+_upload_cache = None
+_upload_cache_lock = threading.Lock()
+
+
+def get_upload_cache():
+    """Return the process-wide upload cache, configured from the Flask app when one is active."""
+    global _upload_cache
+    with _upload_cache_lock:
+        if _upload_cache is None:
+            config = current_app.config if has_app_context() else {}
+            _upload_cache = UploadCache(
+                config.get('UPLOAD_CACHE_DIR', DEFAULT_CACHE_DIR),
+                config.get('UPLOAD_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES),
+            )
+    return _upload_cache
@@ -1,49 +1,62 @@
+import datetime
 import json
-import numpy as np
-import pandas as pd
-from werkzeug.utils import secure_filename
-import os
+import sys
+from flask.json.provider import DefaultJSONProvider
 
-def allowed_file(filename):
-    ALLOWED_EXTENSIONS = {'xls', 'xlsx'}
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+NON_FINITE_JSON = ('NaN', 'Infinity', '-Infinity')
 
 
 class CustomJSONEncoder(json.JSONEncoder):
+    """Encodes the numpy and pandas scalars left in analysis results; missing values become null."""
+
     def default(self, obj):
-        if pd.isnull(obj):
-            return "N/A"  # Or use None for null
-        if isinstance(obj, np.number):
+        import numpy as np
+        import pandas as pd
+
+        if obj is pd.NaT or obj is pd.NA:
+            return None
+        if isinstance(obj, np.float32):
+            return float(str(obj))  # The shortest decimal for the float32 value, e.g. 97.78
+        if isinstance(obj, np.generic):
             return obj.item()
+        if isinstance(obj, (pd.Timestamp, datetime.date)):
+            return obj.isoformat()
         return json.JSONEncoder.default(self, obj)
 
 
-def check_file_content(file_path):
+def to_json(obj):
     """
-    Checks the content of the Excel file to ensure it has the required structure.
-    Returns a tuple (bool, str) indicating whether the file is valid and a message.
+    Serialize analysis results to a JSON string, writing NaN and infinite values as null.
+
+    DataFrames (as a list of records) and Series (as an object) are encoded
+    column-wise by pandas itself instead of being converted to Python dicts and
+    walked value by value. float32 columns are written as the decimals they
+    were read as. The dicts and lists around them are joined as strings, and
+    every other value goes through CustomJSONEncoder.
     """
-    try:
-        df = pd.read_excel(file_path)
-        
-        # Example: Ensure specific required columns are present
-        required_columns = ['StudentID', 'Subject', 'Marks']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-
-        if missing_columns:
-            return False, f"Missing required columns: {', '.join(missing_columns)}"
-        
-        # Add more checks as needed, e.g., data types, empty values, etc.
-
-        return True, "File content is valid."
-    except Exception as e:
-        return False, f"Failed to read file: {e}"
-    
-def save_temp_files(attendance_file, marks_file):
-    attendance_filename = secure_filename(attendance_file.filename)
-    marks_filename = secure_filename(marks_file.filename)
-    temp_attendance_path = os.path.join('/tmp', attendance_filename)
-    temp_marks_path = os.path.join('/tmp', marks_filename)
-    attendance_file.save(temp_attendance_path)
-    marks_file.save(temp_marks_path)
-    return temp_attendance_path, temp_marks_path
\ No newline at end of file
+    # pandas is only imported by code that builds frames; without it obj cannot hold any
+    pd = sys.modules.get('pandas')
+    if pd is not None and isinstance(obj, (pd.DataFrame, pd.Series)):
+        from .dtypes import widen_floats
+
+        obj = widen_floats(obj)
+        if isinstance(obj, pd.DataFrame):
+            return obj.to_json(orient='records', date_format='iso', double_precision=15)
+        return obj.to_json(date_format='iso', double_precision=15)
+
+    if isinstance(obj, dict):
+        items = (f"{json.dumps(key if isinstance(key, str) else to_json(key))}: {to_json(value)}" for key, value in obj.items())
+        return '{' + ', '.join(items) + '}'
+    if isinstance(obj, (list, tuple)):
+        return '[' + ', '.join(to_json(item) for item in obj) + ']'
+
+    text = json.dumps(obj, cls=CustomJSONEncoder)
+    return 'null' if text in NON_FINITE_JSON else text
+
+
+class AnalysisJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes with to_json, so jsonify() accepts DataFrames and NaN."""
+
+    def dumps(self, obj, **kwargs):
+        return to_json(obj)
+
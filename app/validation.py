@@ -0,0 +1,152 @@
+import pandas as pd
+
+from .ingest import SNIFF_BYTES, sniff_format
+
+# Columns each upload must have, and what their values must look like:
+#   'integer': whole numbers, 'number': any numbers, 'text': not only numbers, 'any': anything
+UPLOAD_SCHEMAS = {
+    'attendance': {
+        'StudentID': 'integer',
+        'School Year': 'any',
+        'Class': 'text',
+        'Class Time': 'number',
+        'Absence Time': 'number',
+        'Percentage': 'number',
+    },
+    'marks': {
+        'StudentID': 'integer',
+        'Subject': 'text',
+        'Class': 'text',
+        'T1Weight': 'number',
+        'T2Weight': 'number',
+        'T3Weight': 'number',
+    },
+}
+
+# Rows read after the header to check each column's values
+SAMPLE_ROWS = 200
+MAX_EXAMPLES = 3
+
+KIND_DESCRIPTIONS = {
+    'integer': 'whole numbers',
+    'number': 'numbers',
+    'text': 'text',
+}
+
+
+class UploadValidationError(ValueError):
+    """Raised when uploads do not match UPLOAD_SCHEMAS; problems maps each upload to its list of problems."""
+
+    def __init__(self, problems):
+        self.problems = problems
+        super().__init__(' '.join(
+            f"The {name} file {'; '.join(problem['message'] for problem in file_problems)}."
+            for name, file_problems in problems.items()
+        ))
+
+
+def missing_columns(columns, name):
+    """The columns of the name upload's schema that are not among columns."""
+    return [column for column in UPLOAD_SCHEMAS[name] if column not in columns]
+
+
+def read_sample(stream, rows=SAMPLE_ROWS):
+    """
+    Read the header and first rows of an uploaded file, leaving the stream where it started.
+
+    Excel files are opened read-only and only the first rows are iterated, CSV
+    parsing stops after rows lines and Parquet reads one batch, so the cost does
+    not grow with the size of the file.
+    """
+    start = stream.tell()
+    head = stream.read(SNIFF_BYTES)
+    stream.seek(start)
+    file_format = sniff_format(head)
+    try:
+        if file_format == 'excel':
+            return pd.read_excel(stream, nrows=rows)
+        if file_format == 'csv':
+            return pd.read_csv(stream, nrows=rows, encoding='utf-8-sig')
+
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(stream)
+        batch = next(parquet_file.iter_batches(batch_size=rows), None)
+        return (batch or parquet_file.schema_arrow.empty_table()).to_pandas()
+    finally:
+        stream.seek(start)
+
+
+def _examples(values):
+    return [{'row': int(row) + 2, 'value': str(value)} for row, value in values.head(MAX_EXAMPLES).items()]  # Row 1 is the header
+
+
+def column_problem(values, kind):
+    """Describe how a column's sampled values fail to be of kind, or return None if they fit."""
+    present = values.dropna()
+    if kind == 'any' or present.empty:
+        return None
+    if kind == 'text':
+        if pd.api.types.is_numeric_dtype(present) and not pd.api.types.is_bool_dtype(present):
+            return {'message': 'holds only numbers', 'examples': _examples(present)}
+        return None
+
+    numbers = pd.to_numeric(present, errors='coerce')
+    not_numbers = present[numbers.isna()]
+    if len(not_numbers):
+        return {'message': 'has values that are not numbers', 'examples': _examples(not_numbers)}
+    if kind == 'integer':
+        fractional = present[numbers != numbers.round()]
+        if len(fractional):
+            return {'message': 'has values that are not whole numbers', 'examples': _examples(fractional)}
+    return None
+
+
+def validate_sample(df, name):
+    """Check a sampled upload against the name schema and return its problems, empty if it fits."""
+    problems = []
+    missing = missing_columns(df.columns, name)
+    if missing:
+        problems.append({
+            'column': None,
+            'message': f"is missing required column(s): {', '.join(missing)}",
+            'missing': missing,
+            'found': [str(column) for column in df.columns],
+        })
+    if df.empty:
+        problems.append({'column': None, 'message': 'has no data rows'})
+        return problems
+
+    for column, kind in UPLOAD_SCHEMAS[name].items():
+        if column not in df.columns:
+            continue
+        problem = column_problem(df[column], kind)
+        if problem is not None:
+            examples = ', '.join(f"{example['value']!r} (row {example['row']})" for example in problem['examples'])
+            problem.update(
+                column=column,
+                expected=KIND_DESCRIPTIONS[kind],
+                dtype=str(df[column].dtype),
+                message=f"column '{column}' should hold {KIND_DESCRIPTIONS[kind]} but {problem['message']}, e.g. {examples}",
+            )
+            problems.append(problem)
+    return problems
+
+
+def validate_uploads(**uploads):
+    """
+    Check uploaded files (werkzeug FileStorage objects, keyed by schema name) from
+    their header and first rows, before they are saved or parsed.
+
+    Raises UploadValidationError listing every problem in every file.
+    """
+    problems = {}
+    for name, upload in uploads.items():
+        try:
+            file_problems = validate_sample(read_sample(upload.stream), name)
+        except Exception as e:
+            file_problems = [{'column': None, 'message': f"could not be read: {str(e).rstrip('.')}"}]
+        if file_problems:
+            problems[name] = file_problems
+    if problems:
+        raise UploadValidationError(problems)
@@ -0,0 +1,84 @@
+"""
+Benchmark compact column types on synthetic attendance and marks files.
+
+Compares the frames as read (object strings, int64 and float64) with the
+output of dtypes.compact_dtypes: memory per frame, and the time of the
+analysis's main groupbys (z-scores by subject, attendance by student and
+subject, average mark by class).
+
+    python benchmarks/bench_dtypes.py [students]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.analysis import standardize_marks  # noqa: E402
+from app.correlation import attendance_by  # noqa: E402
+from app.dtypes import compact_dtypes, frame_memory  # noqa: E402
+
+
+def make_dataset(students, subjects=60, classes_per_subject=4, subjects_per_student=6, seed=0):
+    rng = np.random.default_rng(seed)
+    student_ids = rng.choice(np.arange(400000000, 460000000), students, replace=False)
+    rows = students * subjects_per_student
+    subject_ids = rng.integers(0, subjects, rows)
+    class_names = pd.Series(subject_ids * classes_per_subject + rng.integers(0, classes_per_subject, rows)).map(lambda i: f"11CLS{i}")
+    marks = pd.DataFrame({
+        'StudentID': np.repeat(student_ids, subjects_per_student),
+        'Subject': pd.Series(subject_ids).map(lambda i: f"Subject {i}"),
+        'Class': class_names,
+        'T1Weight': rng.normal(20, 5, rows).round(2),
+        'T2Weight': rng.normal(20, 5, rows).round(2),
+        'T3Weight': rng.normal(25, 5, rows).round(2),
+    })
+    marks['CalculatedFinalMark'] = marks['T1Weight'] + marks['T2Weight'] + marks['T3Weight']
+
+    class_time = rng.integers(1000, 6000, rows)
+    attendance = pd.DataFrame({
+        'StudentID': marks['StudentID'],
+        'School Year': pd.Series(rng.integers(11, 13, students)).map(lambda year: f"Year {year}").repeat(subjects_per_student).to_numpy(),
+        'Class': class_names + 'a',
+        'Subject': marks['Subject'],
+        'Class Time': class_time,
+        'Absence Time': (class_time * rng.uniform(0, 0.3, rows)).astype(np.int64),
+    })
+    attendance['Percentage'] = (100 - attendance['Absence Time'] / attendance['Class Time'] * 100).round(2)
+    return attendance, marks
+
+
+def best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def groupbys(attendance, marks):
+    standardize_marks(marks)
+    attendance_by(attendance, ['StudentID', 'Subject'])
+    marks.groupby('Class', observed=True)['CalculatedFinalMark'].mean()
+
+
+if __name__ == '__main__':
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    attendance, marks = make_dataset(students)
+    compact_attendance, compact_marks = compact_dtypes(attendance), compact_dtypes(marks)
+
+    print(f"students: {students}  attendance rows: {len(attendance)}  marks rows: {len(marks)}")
+    for name, before, after in (('attendance', attendance, compact_attendance), ('marks', marks, compact_marks)):
+        print(f"{name + ' memory:':20}{frame_memory(before) / 1e6:8.1f} MB -> {frame_memory(after) / 1e6:6.1f} MB")
+    total_before = frame_memory(attendance) + frame_memory(marks)
+    total_after = frame_memory(compact_attendance) + frame_memory(compact_marks)
+    print(f"{'dataset memory:':20}{total_before / 1e6:8.1f} MB -> {total_after / 1e6:6.1f} MB  ({total_before / total_after:.1f}x smaller)")
+
+    before = best_of(lambda: groupbys(attendance, marks.copy()))
+    after = best_of(lambda: groupbys(compact_attendance, compact_marks.copy()))
+    print(f"groupbys as read (before): {before * 1000:8.1f} ms")
+    print(f"groupbys compact (after):  {after * 1000:8.1f} ms  ({before / after:.1f}x faster)")
@@ -0,0 +1,49 @@
+"""
+Benchmark worker startup: the time for a fresh interpreter to run create_app().
+
+Each case runs in its own subprocess so nothing is already imported. "lazy" is
+the default app, which defers pandas, scipy, matplotlib, python-docx and Celery
+to the routes that use them. "prewarmed" sets PREWARM_IMPORTS and imports all
+of them up front, which is what every worker paid before.
+
+    python benchmarks/bench_imports.py [repeat]
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from app import create_app
+app = create_app()
+elapsed = time.perf_counter() - start
+heavy = [m for m in ('pandas', 'scipy', 'matplotlib', 'docx', 'celery') if m in sys.modules]
+print(elapsed, ','.join(heavy))
+"""
+
+
+def startup_time(prewarm, repeat):
+    env = dict(os.environ, PREWARM_IMPORTS='1' if prewarm else '')
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT], cwd=ROOT, env=env,
+            capture_output=True, text=True, check=True
+        ).stdout.split()
+        timings.append(float(output[0]))
+        loaded = output[1] if len(output) > 1 else '-'
+    return min(timings), loaded
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    lazy, lazy_loaded = startup_time(False, repeat)
+    eager, eager_loaded = startup_time(True, repeat)
+
+    print(f"create_app() in a fresh interpreter, best of {repeat}")
+    print(f"prewarmed (before): {eager * 1000:8.1f} ms  heavy modules loaded: {eager_loaded}")
+    print(f"lazy (after):       {lazy * 1000:8.1f} ms  heavy modules loaded: {lazy_loaded}  ({eager / lazy:.1f}x faster)")
@@ -0,0 +1,55 @@
+"""
+Benchmark reading an attendance export saved as Excel, CSV and Parquet.
+
+Writes the synthetic attendance frame from bench_dtypes in each format and
+times ingest.read_table_file on it, which picks the reader from the file's
+first bytes: openpyxl for Excel, the chunked CSV reader, or the column-pruned
+Parquet reader. The peak traced memory of each read is shown alongside.
+
+    python benchmarks/bench_ingest.py [students]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ingest import read_table_file  # noqa: E402
+from bench_dtypes import make_dataset  # noqa: E402
+
+
+def timed_read(path):
+    start = time.perf_counter()
+    df = read_table_file(path)
+    elapsed = time.perf_counter() - start
+
+    # Traced separately: tracemalloc slows the pure-Python Excel parse several times over
+    tracemalloc.start()
+    read_table_file(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return df, elapsed, peak
+
+
+if __name__ == '__main__':
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    attendance, _ = make_dataset(students)
+
+    with tempfile.TemporaryDirectory() as directory:
+        writers = {
+            'excel': ('xlsx', lambda path: attendance.to_excel(path, index=False)),
+            'csv': ('csv', lambda path: attendance.to_csv(path, index=False)),
+            'parquet': ('parquet', lambda path: attendance.to_parquet(path, index=False)),
+        }
+        print(f"attendance rows: {len(attendance)}")
+        timings = {}
+        for name, (extension, write) in writers.items():
+            path = os.path.join(directory, f"attendance.{extension}")
+            write(path)
+            df, elapsed, peak = timed_read(path)
+            assert len(df) == len(attendance)
+            timings[name] = elapsed
+            print(f"{name:8} {os.path.getsize(path) / 1e6:7.1f} MB on disk  read {elapsed * 1000:8.1f} ms  peak {peak / 1e6:7.1f} MB"
+                  + (f"  ({timings['excel'] / elapsed:.0f}x faster than Excel)" if name != 'excel' else ''))
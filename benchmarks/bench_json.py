@@ -0,0 +1,87 @@
+"""
+Benchmark serializing analysis results on synthetic z-score tables.
+
+Compares the previous path (to_dict(orient='records'), a recursive replace_nan
+walk, then json.dumps) with utils.to_json, which lets pandas write each
+DataFrame column-wise with NaN as null.
+
+    python benchmarks/bench_json.py [rows]
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import to_json  # noqa: E402
+
+
+def make_results(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    marks = pd.DataFrame({
+        'StudentID': rng.integers(400000000, 460000000, rows),
+        'Student Name': [f"Student {i}" for i in range(rows)],
+        'Subject': pd.Series(rng.integers(0, 60, rows)).map(lambda i: f"Subject {i}"),
+        'Class': pd.Series(rng.integers(0, 240, rows)).map(lambda i: f"11CLS{i}"),
+        'T1': rng.normal(65, 15, rows),
+        'T2': rng.normal(65, 15, rows),
+        'T3': rng.normal(65, 15, rows),
+        'CalculatedFinalMark': rng.normal(65, 15, rows),
+        'zScore': rng.normal(0, 1, rows),
+    })
+    marks.loc[rng.random(rows) < 0.1, ['T2', 'zScore']] = np.nan
+    return {
+        'low_z_scores': marks,
+        'high_z_scores': marks.iloc[::-1],
+        'average_marks_by_class': marks.groupby('Class')['CalculatedFinalMark'].mean(),
+        'correlation_analysis': {'correlation': 0.34, 'line_of_best_fit': {'slope': 0.57, 'intercept': float('nan')}},
+    }
+
+
+def replace_nan(obj):
+    if isinstance(obj, float) and np.isnan(obj):
+        return None
+    elif isinstance(obj, dict):
+        return {k: replace_nan(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [replace_nan(item) for item in obj]
+    return obj
+
+
+def records_and_replace_nan(results):
+    converted = {}
+    for key, value in results.items():
+        if isinstance(value, pd.DataFrame):
+            value = value.to_dict(orient='records')
+        elif isinstance(value, pd.Series):
+            value = value.to_dict()
+        converted[key] = replace_nan(value)
+    return json.dumps(converted)
+
+
+def timed(serialize, results, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = serialize(results)
+        timings.append(time.perf_counter() - start)
+    return min(timings), len(payload)
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    results = make_results(rows)
+
+    before, before_bytes = timed(records_and_replace_nan, results)
+    after, after_bytes = timed(to_json, results)
+
+    # Both payloads must decode to the same structure
+    assert json.loads(records_and_replace_nan(results)).keys() == json.loads(to_json(results)).keys()
+
+    print(f"rows per z-score table: {rows}")
+    print(f"to_dict + replace_nan + json.dumps (before): {before * 1000:8.1f} ms  {before_bytes / 1e6:6.1f} MB")
+    print(f"utils.to_json (after):                       {after * 1000:8.1f} ms  {after_bytes / 1e6:6.1f} MB  ({before / after:.1f}x faster)")
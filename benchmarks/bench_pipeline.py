@@ -0,0 +1,70 @@
+"""
+Benchmark the analysis pipeline on synthetic attendance and marks files.
+
+Runs analysis.ANALYSIS_PIPELINE with its stages one at a time and then
+concurrently, and re-runs it against a dataset whose stage outputs are
+memoized after changing one threshold, and after changing nothing.
+
+    python benchmarks/bench_pipeline.py [students]
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.analysis import ANALYSIS_PIPELINE, ANALYSIS_RESULTS, STAGE_FRAMES, upload_digest  # noqa: E402
+from app.dataset_store import DatasetStore  # noqa: E402
+from app.pipeline import DatasetStageMemo  # noqa: E402
+from bench_dtypes import make_dataset  # noqa: E402
+
+PARAMS = {
+    'low_attendance_threshold': 85,
+    'high_attendance_threshold': 95,
+    'low_marks_threshold': -1.5,
+    'high_marks_threshold': 1.2,
+    'chart_mode': 'data',
+}
+
+
+def run(sources, params, executor, memo=None):
+    start = time.perf_counter()
+    ANALYSIS_PIPELINE.run(
+        sources, params, targets=ANALYSIS_RESULTS,
+        source_keys={name: upload_digest(path) for name, path in sources.items()},
+        memo=memo, executor=executor
+    )
+    return time.perf_counter() - start
+
+
+def best_of(func, repeat=3):
+    return min(func() for _ in range(repeat))
+
+
+if __name__ == '__main__':
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    attendance, marks = make_dataset(students)
+
+    with tempfile.TemporaryDirectory() as directory:
+        sources = {'attendance_file': os.path.join(directory, 'attendance.csv'), 'marks_file': os.path.join(directory, 'marks.csv')}
+        attendance.to_csv(sources['attendance_file'], index=False)
+        marks.to_csv(sources['marks_file'], index=False)
+        print(f"students: {students}  attendance rows: {len(attendance)}  marks rows: {len(marks)}")
+
+        sequential_pool, concurrent_pool = ThreadPoolExecutor(max_workers=1), ThreadPoolExecutor(max_workers=4)
+        run(sources, PARAMS, concurrent_pool)  # Parses both files into the upload cache
+        sequential = best_of(lambda: run(sources, PARAMS, sequential_pool))
+        concurrent = best_of(lambda: run(sources, PARAMS, concurrent_pool))
+        print(f"stages one at a time:      {sequential * 1000:8.1f} ms")
+        print(f"stages concurrently:       {concurrent * 1000:8.1f} ms  ({sequential / concurrent:.1f}x faster)")
+
+        store = DatasetStore(root=os.path.join(directory, 'datasets'))
+        dataset_id = store.new_dataset_id()
+        run(sources, PARAMS, concurrent_pool, DatasetStageMemo(store, dataset_id, frame_names=STAGE_FRAMES))
+        changed = dict(PARAMS, low_marks_threshold=-1.0)
+        threshold = run(sources, changed, concurrent_pool, DatasetStageMemo(store, dataset_id, frame_names=STAGE_FRAMES))
+        unchanged = run(sources, changed, concurrent_pool, DatasetStageMemo(store, dataset_id, frame_names=STAGE_FRAMES))
+        print(f"memoized, new threshold:   {threshold * 1000:8.1f} ms  ({concurrent / threshold:.1f}x faster)")
+        print(f"memoized, nothing changed: {unchanged * 1000:8.1f} ms  ({concurrent / unchanged:.1f}x faster)")
@@ -0,0 +1,66 @@
+"""
+Benchmark combined student report generation on synthetic data.
+
+Renders the same report serially and with the report process pool, and reports
+the time and size of each document. The pool is started by the first parallel
+report, so that one is timed on its own.
+
+    python benchmarks/bench_reports.py [students] [workers]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.report_generator import generate_student_report  # noqa: E402
+
+SUBJECTS = ['English Standard', 'Mathematics Advanced', 'Biology', 'Chemistry', 'Physics', 'Modern History']
+
+
+def make_report_data(students, seed=0):
+    rng = np.random.default_rng(seed)
+    student_ids = np.arange(400000000, 400000000 + students)
+    rows = students * len(SUBJECTS)
+    marks_df = pd.DataFrame({
+        'StudentID': np.repeat(student_ids, len(SUBJECTS)),
+        'Student Name': np.repeat([f"Student {i}" for i in range(students)], len(SUBJECTS)),
+        'Subject': np.tile(SUBJECTS, students),
+        'T1': rng.integers(30, 100, rows),
+        'T2': rng.integers(30, 100, rows),
+        'T3': rng.integers(30, 100, rows),
+        'CalculatedFinalMark': rng.integers(30, 100, rows),
+        'zScore': rng.normal(0, 1, rows).round(2),
+    })
+    attendance_df = pd.DataFrame({
+        'StudentID': np.repeat(student_ids, len(SUBJECTS)),
+        'School Year': 11,
+        'Subject': np.tile(SUBJECTS, students),
+        'AttendancePercentage': rng.uniform(60, 100, rows).round(1),
+    })
+    overall_attendance = attendance_df.groupby('StudentID', as_index=False)['AttendancePercentage'].mean()
+    return marks_df, list(student_ids), attendance_df, overall_attendance
+
+
+def timed_report(data, workers):
+    start = time.perf_counter()
+    report = generate_student_report(*data, workers=workers)
+    return time.perf_counter() - start, report.getbuffer().nbytes
+
+
+if __name__ == '__main__':
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    data = make_report_data(students)
+
+    serial, serial_bytes = timed_report(data, 1)
+    first_parallel, _ = timed_report(data, workers)
+    parallel, parallel_bytes = timed_report(data, workers)
+
+    print(f"students: {students}")
+    print(f"serial:             {serial:6.2f} s  {serial_bytes / 1024:7.1f} KiB")
+    print(f"starting the pool:  {first_parallel:6.2f} s")
+    print(f"{workers} worker processes: {parallel:6.2f} s  {parallel_bytes / 1024:7.1f} KiB  ({serial / parallel:.1f}x faster)")
@@ -0,0 +1,61 @@
+"""
+Benchmark the z-score stage on a synthetic 50k-row marks file.
+
+Compares the previous approach (a groupby lambda over scipy's zscore, run three
+times per analysis and once more for the report) with a single call to
+standardize_marks.
+
+    python benchmarks/bench_zscores.py [rows]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.stats import zscore
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.analysis import standardize_marks  # noqa: E402
+
+
+def make_marks(rows, subjects=60, classes_per_subject=4, seed=0):
+    rng = np.random.default_rng(seed)
+    subject_ids = rng.integers(0, subjects, rows)
+    class_ids = subject_ids * classes_per_subject + rng.integers(0, classes_per_subject, rows)
+    return pd.DataFrame({
+        'StudentID': rng.integers(400000000, 460000000, rows),
+        'Subject': pd.Series(subject_ids).map(lambda i: f"Subject {i}"),
+        'Class': pd.Series(class_ids).map(lambda i: f"11CLS{i}"),
+        'School Year': rng.integers(11, 13, rows),
+        'CalculatedFinalMark': rng.normal(65, 15, rows).clip(0, 100),
+    })
+
+
+def lambda_zscores(marks_df):
+    for _ in range(4):  # preprocess_data, identify_low_z_scores, identify_high_z_scores, /download_report
+        marks_df['zScore'] = marks_df.groupby('Subject')['CalculatedFinalMark'].transform(lambda x: zscore(x, ddof=1))
+
+
+def best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    marks_df = make_marks(rows)
+
+    before = best_of(lambda: lambda_zscores(marks_df.copy()))
+    after = best_of(lambda: standardize_marks(marks_df.copy()))
+    after_all_levels = best_of(lambda: standardize_marks(marks_df.copy(), levels=('subject', 'class', 'year')))
+
+    print(f"rows: {rows}")
+    print(f"lambda transform x4 (before):     {before * 1000:8.1f} ms")
+    print(f"standardize_marks subject (after): {after * 1000:8.1f} ms  ({before / after:.1f}x faster)")
+    print(f"standardize_marks all levels:      {after_all_levels * 1000:8.1f} ms")
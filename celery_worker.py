@@ -0,0 +1,5 @@
+from app import create_app, prewarm
+
+app = create_app()
+prewarm(app)  # Load the analysis and report modules once, before the worker pool forks
+celery = app.extensions['celery']
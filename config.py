@@ -1,5 +1,61 @@
 import os
+import tempfile
 
 class Config:
     SECRET_KEY = os.urandom(24)
     # Add other configurations here
+
+    # Cache of parsed uploads keyed by the SHA-256 of the file bytes
+    UPLOAD_CACHE_DIR = os.environ.get('UPLOAD_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'school_data_analysis', 'upload_cache'))
+    UPLOAD_CACHE_MAX_BYTES = int(os.environ.get('UPLOAD_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+    # Server-side store for preprocessed datasets, keyed by the dataset ID kept in the session
+    DATASET_STORE_DIR = os.environ.get('DATASET_STORE_DIR', os.path.join(tempfile.gettempdir(), 'school_data_analysis', 'datasets'))
+    # Datasets unused for this long are deleted, and the least recently used go first once the store is over its size;
+    # a background thread checks every DATASET_SWEEP_INTERVAL seconds (0 disables it)
+    DATASET_TTL_SECONDS = int(os.environ.get('DATASET_TTL_SECONDS', 2 * 60 * 60))
+    DATASET_STORE_MAX_BYTES = int(os.environ.get('DATASET_STORE_MAX_BYTES', 1024 * 1024 * 1024))
+    DATASET_SWEEP_INTERVAL = int(os.environ.get('DATASET_SWEEP_INTERVAL', 5 * 60))
+    # Largest accepted upload, per file; checked while the file is saved, 0 for no limit
+    MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 1024 * 1024 * 1024))
+    # Uploaded files up to this size are buffered in memory while the request is parsed; larger ones spill to the store's disk
+    UPLOAD_SPOOL_MEMORY_BYTES = int(os.environ.get('UPLOAD_SPOOL_MEMORY_BYTES', 1024 * 1024))
+
+    # Level of the app's loggers; DEBUG adds frame shapes and samples to the per-stage JSON timing lines logged at INFO
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+    # Number of background threads that run uploaded analyses while their progress is streamed
+    ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', 2))
+    # Threads shared by all analyses for running independent pipeline stages at the same time
+    PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', 4))
+
+    # Charts are rendered on a thread pool and cached as PNGs named by a hash of their data
+    CHART_CACHE_DIR = os.environ.get('CHART_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'school_data_analysis', 'charts'))
+    CHART_CACHE_MAX_BYTES = int(os.environ.get('CHART_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    CHART_WORKERS = int(os.environ.get('CHART_WORKERS', 2))
+    # Default chart mode: 'image' (server-rendered PNGs) or 'data' (binned JSON drawn by the browser)
+    CHART_MODE = os.environ.get('CHART_MODE', 'image')
+
+    # Import pandas, scipy, matplotlib, python-docx and Celery when the app is created instead of on first use
+    PREWARM_IMPORTS = os.environ.get('PREWARM_IMPORTS', '').lower() in ('1', 'true', 'yes')
+
+    # Celery job queue for analysis and report generation. Without CELERY_BROKER_URL (e.g. a Redis URL)
+    # jobs go through a filesystem broker and results are kept on disk, so a single box needs no Redis;
+    # start a worker with: celery -A celery_worker.celery worker
+    CELERY_DATA_DIR = os.environ.get('CELERY_DATA_DIR', os.path.join(tempfile.gettempdir(), 'school_data_analysis', 'celery'))
+    CELERY = {
+        'broker_url': os.environ.get('CELERY_BROKER_URL', 'filesystem://'),
+        'broker_transport_options': {
+            'data_folder_in': os.path.join(CELERY_DATA_DIR, 'queue'),
+            'data_folder_out': os.path.join(CELERY_DATA_DIR, 'queue'),
+            'processed_folder': os.path.join(CELERY_DATA_DIR, 'processed'),
+            'control_folder': os.path.join(CELERY_DATA_DIR, 'control'),
+        },
+        'result_backend': os.environ.get('CELERY_RESULT_BACKEND', 'file://' + os.path.join(CELERY_DATA_DIR, 'results')),
+        'task_ignore_result': False,
+        'task_track_started': True,
+        'task_always_eager': os.environ.get('CELERY_TASK_ALWAYS_EAGER', '').lower() in ('1', 'true', 'yes'),
+        'task_store_eager_result': True,
+    }
+    # Processes rendering student report sections in parallel; 1 renders them in the request thread
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 1))
@@ -0,0 +1,76 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app.charts
+import app.dataset_store
+import app.upload_cache
+from app import create_app
+from app.charts import ChartService
+from app.dataset_store import DatasetStore
+from app.upload_cache import UploadCache
+
+SUBJECTS = {'MAT': 'Mathematics', 'ENG': 'English', 'SCI': 'Science'}
+
+
+def make_uploads(students=30, seed=5):
+    """Small attendance and marks frames that pass the upload schemas, one class per student and subject."""
+    rng = np.random.default_rng(seed)
+    attendance, marks = [], []
+    for student_id in range(1001, 1001 + students):
+        year = 10 if student_id % 2 else 11
+        for code, subject in SUBJECTS.items():
+            class_name = f"{year}{code}{student_id % 3 + 1}"
+            class_time = int(rng.integers(1200, 3000))
+            absence = int(rng.integers(0, class_time // 4))
+            attendance.append({
+                'StudentID': student_id, 'Student Name': f"Student {student_id}", 'School Year': year,
+                # Attendance exports add a section letter to some classes
+                'Class': class_name + ('a' if student_id % 5 == 0 else ''),
+                'Class Time': class_time, 'Absence Time': absence,
+                'Percentage': round(100 - absence / class_time * 100, 2),
+            })
+            weights = rng.uniform(5, 33, 3).round(2)
+            marks.append({
+                'StudentID': student_id, 'Subject': subject, 'Class': class_name,
+                'T1Weight': weights[0], 'T2Weight': weights[1], 'T3Weight': weights[2],
+            })
+    return pd.DataFrame(attendance), pd.DataFrame(marks)
+
+
+def csv_file(df, name):
+    return io.BytesIO(df.to_csv(index=False).encode()), name
+
+
+def sse_events(chunks):
+    """Parse server-sent events (a string, or an iterable of event strings) into (event_type, data) pairs."""
+    text = chunks if isinstance(chunks, str) else ''.join(chunks)
+    events = []
+    for block in text.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if ': ' in line and not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields['event'], fields.get('data')))
+    return events
+
+
+@pytest.fixture
+def uploads():
+    return make_uploads()
+
+
+@pytest.fixture
+def flask_app(tmp_path, monkeypatch):
+    """The app with its dataset store, upload cache and chart cache under tmp_path."""
+    monkeypatch.setattr(app.dataset_store, '_dataset_store', DatasetStore(str(tmp_path / 'datasets')))
+    monkeypatch.setattr(app.upload_cache, '_upload_cache', UploadCache(str(tmp_path / 'upload_cache')))
+    monkeypatch.setattr(app.charts, '_chart_service', ChartService(str(tmp_path / 'charts')))
+    flask_app = create_app()
+    flask_app.config['TESTING'] = True
+    return flask_app
+
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.test_client()
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import zscore
+
+from app.analysis import calculate_group_z_scores, standardize_marks
+from app.dtypes import compact_dtypes
+
+
+def marks_frame():
+    rng = np.random.default_rng(3)
+    rows = []
+    for student_id in range(1, 41):
+        year = '10' if student_id <= 25 else '11'
+        for subject in ('Maths', 'English', 'Art'):
+            if subject == 'Art' and student_id % 3:
+                continue
+            rows.append({
+                'StudentID': student_id,
+                'Subject': subject,
+                'Class': f"{year}{subject[:3].upper()}{student_id % 2 + 1}",
+                'CalculatedFinalMark': round(rng.uniform(30, 98), 2),
+            })
+    marks = pd.DataFrame(rows)
+    marks.loc[[4, 17], 'CalculatedFinalMark'] = np.nan
+    # A class of one has no spread, so its class z-score is undefined
+    marks.loc[len(marks)] = {'StudentID': 41, 'Subject': 'Maths', 'Class': '11MAT9', 'CalculatedFinalMark': 70.0}
+    return compact_dtypes(marks)
+
+
+def attendance_frame(marks):
+    student_ids = marks['StudentID'].unique()
+    return compact_dtypes(pd.DataFrame({
+        'StudentID': student_ids,
+        'School Year': ['10' if student_id <= 25 else '11' for student_id in student_ids],
+    }))
+
+
+def naive_z_scores(marks, keys):
+    """The per-group scipy zscore the vectorized version replaces, ignoring missing marks."""
+    def group_z_scores(values):
+        present = values.dropna()
+        result = pd.Series(np.nan, index=values.index)
+        result[present.index] = zscore(present.to_numpy(dtype=float), ddof=1) if len(present) > 1 else np.nan
+        return result
+
+    return marks.groupby(keys, observed=True)['CalculatedFinalMark'].transform(group_z_scores)
+
+
+def test_subject_z_scores_match_a_per_group_zscore():
+    marks = marks_frame()
+    expected = naive_z_scores(marks, ['Subject'])
+    pd.testing.assert_series_equal(standardize_marks(marks)['zScore'], expected, check_names=False, rtol=1e-12)
+
+
+def test_class_and_year_group_z_scores_match_a_per_group_zscore():
+    marks = marks_frame()
+    attendance = attendance_frame(marks)
+    result = calculate_group_z_scores(standardize_marks(marks.copy()), attendance)
+
+    school_years = marks['StudentID'].map(attendance.set_index('StudentID')['School Year'])
+    expected_class = naive_z_scores(marks, ['Class'])
+    expected_year = naive_z_scores(marks.assign(**{'School Year': school_years}), ['School Year', 'Subject'])
+    pd.testing.assert_series_equal(result['ClassZScore'], expected_class, check_names=False, rtol=1e-12)
+    pd.testing.assert_series_equal(result['YearGroupZScore'], expected_year, check_names=False, rtol=1e-12)
+    assert np.isnan(result['ClassZScore'].iloc[-1])
+    assert result['zScore'].notna().sum() == marks['CalculatedFinalMark'].notna().sum()
+
+
+def test_group_z_scores_leave_the_marks_frame_unchanged():
+    marks = marks_frame()
+    before = marks.copy()
+    calculate_group_z_scores(marks, attendance_frame(marks))
+    pd.testing.assert_frame_equal(marks, before)
+
+
+def test_standardize_marks_adds_its_columns_in_place():
+    marks = marks_frame()
+    assert standardize_marks(marks, levels=('class',)) is marks
+    assert 'ClassZScore' in marks.columns
+    with pytest.raises(KeyError):
+        standardize_marks(marks_frame(), levels=('year',))
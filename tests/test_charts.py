@@ -0,0 +1,129 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import app.charts
+from app.charts import ChartService, chart_key, render_attendance_histogram
+
+PERCENTAGES = np.array([55.0, 72.5, 88.0, 91.25, 97.0])
+renders = []
+
+
+def render_text(path, values, label):
+    renders.append(label)
+    with open(path, 'w') as f:
+        f.write(f"{label}: {list(values)}")
+
+
+def render_broken(path, values, label):
+    renders.append(label)
+    with open(path, 'w') as f:
+        f.write('half a chart')
+    raise RuntimeError('no fonts')
+
+
+@pytest.fixture
+def charts(tmp_path):
+    renders.clear()
+    service = ChartService(str(tmp_path / 'charts'))
+    yield service
+    service._executor.shutdown()
+
+
+def test_key_hashes_kind_data_and_parameters():
+    key = chart_key('histogram', [PERCENTAGES], {'bins': 20})
+    assert len(key) == 64
+    assert chart_key('histogram', [PERCENTAGES.astype(np.float32)], {'bins': 20}) == key
+    assert chart_key('histogram', [PERCENTAGES], {'bins': 10}) != key
+    assert chart_key('scatter', [PERCENTAGES], {'bins': 20}) != key
+    assert chart_key('histogram', [PERCENTAGES[:-1], PERCENTAGES[-1:]], {'bins': 20}) != key
+
+
+def test_the_same_chart_is_rendered_once(charts):
+    key = charts.submit('test', render_text, [PERCENTAGES], label='first')
+    charts.wait(key)
+    assert charts.submit('test', render_text, [PERCENTAGES.copy()], label='first') == key
+    charts.wait(key)
+
+    assert renders == ['first']
+    assert os.listdir(charts.output_dir) == [f"{key}.png"]
+    other = charts.submit('test', render_text, [PERCENTAGES], label='second')
+    charts.wait(other)
+    assert other != key and renders == ['first', 'second']
+
+
+def test_concurrent_submits_share_one_render(charts):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_render(path, values, label):
+        started.set()
+        release.wait(5)
+        render_text(path, values, label)
+
+    key = charts.submit('test', slow_render, [PERCENTAGES], label='slow')
+    assert started.wait(5)
+    assert charts.submit('test', slow_render, [PERCENTAGES], label='slow') == key
+    release.set()
+    charts.wait(key)
+    assert renders == ['slow']
+
+
+def test_a_failed_render_is_reported_once_then_retried(charts):
+    key = charts.submit('test', render_broken, [PERCENTAGES], label='broken')
+    with pytest.raises(RuntimeError, match='no fonts'):
+        charts.wait(key)
+    charts.wait(key)  # Already reported
+    assert charts.chart_path(key) and not os.path.exists(charts.chart_path(key))
+    assert os.listdir(charts.output_dir) == []  # No partly written file is left
+
+    assert charts.submit('test', render_broken, [PERCENTAGES], label='broken') == key
+    with pytest.raises(RuntimeError):
+        charts.wait(key)
+    assert renders == ['broken', 'broken']
+
+
+def test_oldest_charts_are_evicted_over_capacity(charts):
+    keys = []
+    for label in ('a', 'b', 'c'):
+        keys.append(charts.submit('test', render_text, [PERCENTAGES], label=label))
+        charts.wait(keys[-1])
+        os.utime(charts.chart_path(keys[-1]), (1000 + len(keys),) * 2)
+    charts.max_bytes = 2 * os.path.getsize(charts.chart_path(keys[0]))
+    charts.wait(charts.submit('test', render_text, [PERCENTAGES], label='d'))
+    assert [os.path.exists(charts.chart_path(key)) for key in keys] == [False, False, True]
+
+
+def test_chart_path_rejects_anything_but_a_key(charts):
+    assert charts.chart_path('../../etc/passwd') is None
+    assert charts.chart_path(None) is None
+
+
+@pytest.fixture
+def rendered_histogram(flask_app):
+    with flask_app.app_context():
+        service = app.charts.get_chart_service()
+        key = service.submit('histogram', render_attendance_histogram, [PERCENTAGES], bins=5)
+        service.wait(key)
+    return key
+
+
+def test_send_chart_uses_the_key_as_etag(client, rendered_histogram):
+    response = client.get(f"/charts/{rendered_histogram}.png")
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.data.startswith(b'\x89PNG')
+    assert response.get_etag() == (rendered_histogram, False)
+    assert response.cache_control.immutable and response.cache_control.public
+
+    cached = client.get(f"/charts/{rendered_histogram}.png", headers={'If-None-Match': f'"{rendered_histogram}"'})
+    assert cached.status_code == 304
+    assert cached.data == b''
+    assert client.get(f"/scatter_plot.png?chart={rendered_histogram}", headers={'If-None-Match': f'"{rendered_histogram}"'}).status_code == 304
+
+
+def test_send_chart_404s_for_unknown_and_invalid_keys(client):
+    assert client.get(f"/charts/{'0' * 64}.png").status_code == 404
+    assert client.get('/charts/not-a-key.png').status_code == 404
+    assert client.get('/scatter_plot.png').status_code == 404
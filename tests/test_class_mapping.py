@@ -0,0 +1,104 @@
+import re
+
+import pandas as pd
+import pytest
+
+from app.class_mapping import ClassSubjectResolver, normalize_class_name
+
+CLASS_TO_SUBJECT = {
+    '11AGR1': 'Agriculture',
+    '11HIA4/8': 'Ancient History',
+    '12CHE2': 'Chemistry',
+    '12MAT(A)': 'Mathematics Advanced',
+    '10ENG3': 'English',
+}
+
+
+def baseline_closest_match(class_name, class_to_subject):
+    """find_closest_match as it was in perform_comprehensive_analysis before the resolver replaced it."""
+    closest_match = None
+    closest_distance = float('inf')
+    for pattern, subject in class_to_subject.items():
+        distance = len(re.sub(pattern, '', class_name)) + len(re.sub(class_name, '', pattern))
+        if distance < closest_distance:
+            closest_match = subject
+            closest_distance = distance
+    return closest_match
+
+
+def baseline_subject(class_name):
+    return CLASS_TO_SUBJECT.get(class_name, baseline_closest_match(class_name, CLASS_TO_SUBJECT))
+
+
+@pytest.mark.parametrize('class_name, match_type', [
+    ('11AGR1', 'exact'),
+    ('11AGR1a', 'suffix'),
+    ('12CHE2a', 'suffix'),
+    ('10ENG3x', 'fuzzy'),
+])
+def test_each_tier_resolves_like_the_baseline(class_name, match_type):
+    resolver = ClassSubjectResolver(CLASS_TO_SUBJECT)
+    assert resolver.resolve(class_name) == baseline_subject(class_name)
+    assert resolver.match_types[class_name] == match_type
+
+
+@pytest.mark.parametrize('class_name, subject', [
+    ('12che2', 'Chemistry'),
+    ('11HIA4/8 ', 'Ancient History'),
+    ('11hia48', 'Ancient History'),
+])
+def test_normalized_names_resolve(class_name, subject):
+    resolver = ClassSubjectResolver(CLASS_TO_SUBJECT)
+    assert resolver.resolve(class_name) == subject
+    assert resolver.match_types[class_name] == 'normalized'
+
+
+def test_case_differences_no_longer_pick_the_wrong_subject():
+    # The baseline compared case literally, so the nearest class by its distance was another subject
+    assert baseline_subject('12che2') == 'Agriculture'
+    assert ClassSubjectResolver(CLASS_TO_SUBJECT).resolve('12che2') == 'Chemistry'
+
+
+def test_names_with_regex_metacharacters_resolve():
+    resolver = ClassSubjectResolver(CLASS_TO_SUBJECT)
+    # The baseline used class names as patterns, so '(A)' matched the text 'A' and never its own name
+    assert resolver.resolve('12MAT(A)') == 'Mathematics Advanced'
+    assert resolver.resolve('12MAT(A)a') == 'Mathematics Advanced'
+    assert resolver.match_types['12MAT(A)a'] == 'suffix'
+    with pytest.raises(re.error):
+        baseline_subject('12MAT(A')
+
+
+def test_an_unrelated_name_stays_unresolved():
+    resolver = ClassSubjectResolver(CLASS_TO_SUBJECT)
+    # The baseline always picked the nearest class, however far away it was
+    assert baseline_subject('STUDY') is not None
+    assert resolver.resolve('STUDY') is None
+    assert resolver.resolve('') is None
+    assert resolver.summary()['unmatched'] == ['', 'STUDY']
+
+
+def test_fuzzy_matches_are_recorded():
+    resolver = ClassSubjectResolver(CLASS_TO_SUBJECT)
+    resolver.resolve('10ENG3x')
+    assert resolver.summary()['fuzzy'] == {
+        '10ENG3x': {'matched_class': '10ENG3', 'subject': 'English', 'similarity': pytest.approx(0.667, abs=1e-3)},
+    }
+
+
+def test_map_classes_resolves_each_name_once():
+    resolver = ClassSubjectResolver(CLASS_TO_SUBJECT)
+    classes = pd.Series(['11AGR1a', '12CHE2', None, '11AGR1a', 'STUDY'])
+    mapped = resolver.map_classes(classes)
+    assert mapped.tolist()[:2] == ['Agriculture', 'Chemistry']
+    assert mapped.isna().tolist() == [False, False, True, False, True]
+    assert resolver.summary() | {'fuzzy': None} == {'exact': 1, 'normalized': 0, 'suffix': 1, 'fuzzy': None, 'unmatched': ['STUDY']}
+
+
+def test_from_marks_keeps_the_first_subject_of_each_class():
+    marks = pd.DataFrame({'Class': ['11AGR1', '11AGR1', None], 'Subject': ['Agriculture', 'Other', 'Art']})
+    assert ClassSubjectResolver.from_marks(marks).exact == {'11AGR1': 'Agriculture'}
+
+
+def test_normalize_class_name():
+    assert normalize_class_name(' 11HIA4/8 ') == '11hia48'
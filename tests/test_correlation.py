@@ -0,0 +1,74 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import linregress
+
+from app.correlation import REGRESSION_STATS, grouped_regressions, linear_regression
+
+
+def regression_pairs():
+    rng = np.random.default_rng(7)
+    groups = []
+    for group, size in (('noisy', 40), ('small', 3), ('negative', 25)):
+        x = rng.uniform(60, 100, size)
+        slope = -0.4 if group == 'negative' else 0.8
+        groups.append(pd.DataFrame({'group': group, 'AttendancePercentage': x, 'FinalMark': 10 + slope * x + rng.normal(0, 5, size)}))
+    # Degenerate groups: one pair, a flat y, a perfect fit and no spread in x
+    groups.append(pd.DataFrame({'group': 'single', 'AttendancePercentage': [90.0], 'FinalMark': [70.0]}))
+    groups.append(pd.DataFrame({'group': 'flat', 'AttendancePercentage': [70.0, 80.0, 90.0, 95.0], 'FinalMark': [65.3] * 4}))
+    groups.append(pd.DataFrame({'group': 'perfect', 'AttendancePercentage': [70.0, 80.0, 90.0], 'FinalMark': [50.0, 60.0, 70.0]}))
+    groups.append(pd.DataFrame({'group': 'same_x', 'AttendancePercentage': [85.0] * 3, 'FinalMark': [50.0, 60.0, 70.0]}))
+    return pd.concat(groups, ignore_index=True)
+
+
+def expected_stats(rows):
+    result = linregress(rows['AttendancePercentage'], rows['FinalMark'])
+    return {'slope': result.slope, 'intercept': result.intercept, 'r_value': result.rvalue, 'p_value': result.pvalue, 'std_err': result.stderr}
+
+
+@pytest.mark.parametrize('group', ['noisy', 'small', 'negative', 'flat', 'perfect'])
+def test_grouped_regressions_match_linregress(group):
+    pairs = regression_pairs()
+    table = grouped_regressions(pairs, 'group')
+    expected = expected_stats(pairs[pairs['group'] == group])
+
+    assert table.loc[group, 'pairs'] == (pairs['group'] == group).sum()
+    for stat, value in expected.items():
+        assert table.loc[group, stat] == pytest.approx(value, rel=1e-9, abs=1e-9), stat
+
+
+def test_grouped_regressions_flat_y_is_a_flat_line():
+    stats = grouped_regressions(regression_pairs(), 'group').loc['flat']
+    assert stats['r_value'] == 0.0
+    assert stats['p_value'] == 1.0
+    assert stats['std_err'] == 0.0
+    assert stats['intercept'] == pytest.approx(65.3)
+
+
+@pytest.mark.parametrize('group', ['single', 'same_x'])
+def test_grouped_regressions_leave_unfittable_groups_empty(group):
+    stats = grouped_regressions(regression_pairs(), 'group').loc[group]
+    assert all(math.isnan(stats[stat]) for stat in REGRESSION_STATS[1:])
+
+
+def test_grouped_regressions_respect_min_pairs():
+    table = grouped_regressions(regression_pairs(), 'group', min_pairs=4)
+    assert math.isnan(table.loc['small', 'slope'])
+    assert math.isnan(table.loc['perfect', 'slope'])
+    assert not math.isnan(table.loc['flat', 'slope'])
+
+
+def test_linear_regression_matches_linregress_over_all_pairs():
+    pairs = regression_pairs()
+    pairs = pairs[pairs['group'].isin(['noisy', 'negative'])]
+    stats = linear_regression(pairs)
+    assert stats['pairs'] == len(pairs)
+    for stat, value in expected_stats(pairs).items():
+        assert stats[stat] == pytest.approx(value, rel=1e-9, abs=1e-9), stat
+
+
+def test_linear_regression_of_two_equal_marks_is_flat():
+    stats = linear_regression(pd.DataFrame({'AttendancePercentage': [80.0, 90.0], 'FinalMark': [60.0, 60.0]}))
+    assert stats == pytest.approx(expected_stats(pd.DataFrame({'AttendancePercentage': [80.0, 90.0], 'FinalMark': [60.0, 60.0]})) | {'pairs': 2})
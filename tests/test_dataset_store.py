@@ -0,0 +1,119 @@
+import hashlib
+import os
+import time
+
+import pandas as pd
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from app.dataset_store import DatasetStore, UploadTooLargeError, stored_digest
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DatasetStore(root=str(tmp_path), spool_memory_bytes=64, max_upload_bytes=1024)
+
+
+def spooled(store, data):
+    buffer = store.spooled_upload()
+    buffer.write(data)
+    buffer.seek(0)
+    return FileStorage(stream=buffer, filename='marks.csv')
+
+
+def dataset_with_frame(store, rows, last_used):
+    dataset_id = store.new_dataset_id()
+    store.save_frame(dataset_id, 'marks', pd.DataFrame({'Mark': [70.5] * rows}))
+    os.utime(store.dataset_dir(dataset_id), (last_used, last_used))
+    return dataset_id
+
+
+def test_save_upload_stores_a_read_only_copy_with_its_digest(store):
+    dataset_id = store.new_dataset_id()
+    path = store.save_upload(dataset_id, 'marks', spooled(store, b'StudentID,Mark\n1,70.5\n'))
+
+    with open(path, 'rb') as f:
+        assert f.read() == b'StudentID,Mark\n1,70.5\n'
+    assert os.stat(path).st_mode & 0o777 == 0o444
+    assert stored_digest(path) == hashlib.sha256(b'StudentID,Mark\n1,70.5\n').hexdigest()
+    assert store.has_uploads(dataset_id, 'marks')
+
+
+@pytest.mark.parametrize('size', [1025, 64 * 1024])
+def test_save_upload_rejects_a_file_past_the_limit(store, size):
+    dataset_id = store.new_dataset_id()
+    upload = spooled(store, b'x' * size)
+    assert upload.stream.too_large
+
+    with pytest.raises(UploadTooLargeError, match='under 1024 bytes'):
+        store.save_upload(dataset_id, 'marks', upload)
+    assert not store.has_uploads(dataset_id, 'marks')
+
+
+def test_save_upload_accepts_a_spilled_file_at_the_limit(store):
+    dataset_id = store.new_dataset_id()
+    path = store.save_upload(dataset_id, 'marks', spooled(store, b'x' * 1024))
+    assert os.path.getsize(path) == 1024
+    # The spilled file was renamed into the dataset, not copied
+    assert os.listdir(store.spool_dir) == []
+
+
+def test_frames_round_trip_and_can_be_read_by_column(store):
+    dataset_id = store.new_dataset_id()
+    df = pd.DataFrame({'StudentID': [1, 2], 'Mark': [70.5, 64.25]})
+    store.save_frame(dataset_id, 'marks', df)
+
+    pd.testing.assert_frame_equal(store.load_frame(dataset_id, 'marks'), df)
+    assert list(store.load_frame(dataset_id, 'marks', columns=['Mark']).columns) == ['Mark']
+    assert store.frame_columns(dataset_id, 'marks') == ['StudentID', 'Mark']
+
+
+def test_sweep_deletes_expired_datasets(store):
+    now = time.time()
+    expired = dataset_with_frame(store, 10, now - store.ttl_seconds - 60)
+    fresh = dataset_with_frame(store, 10, now - 60)
+
+    assert store.sweep() == 1
+    assert not store.has_frames(expired, 'marks')
+    assert store.has_frames(fresh, 'marks')
+
+
+def test_sweep_evicts_least_recently_used_until_the_store_fits(store):
+    now = time.time()
+    oldest = dataset_with_frame(store, 1000, now - 300)
+    older = dataset_with_frame(store, 1000, now - 200)
+    newest = dataset_with_frame(store, 1000, now - 100)
+    # Reading a dataset marks it as used, so it outlives one written later
+    store.load_frame(oldest, 'marks')
+
+    store.max_bytes = 2 * store._dir_size(store.dataset_dir(newest))
+    assert store.sweep() == 1
+    assert [store.has_frames(dataset_id, 'marks') for dataset_id in (oldest, older, newest)] == [True, False, True]
+
+
+def test_derive_dataset_links_everything_but_the_replaced_upload(store):
+    dataset_id = store.new_dataset_id()
+    store.save_upload(dataset_id, 'marks', spooled(store, b'StudentID,Mark\n1,70.5\n'))
+    store.save_upload(dataset_id, 'attendance', spooled(store, b'StudentID,Percentage\n1,91.5\n'))
+    store.save_frame(dataset_id, 'marks', pd.DataFrame({'Mark': [70.5]}))
+    store.save_state(dataset_id, '{"keys": {}}')
+
+    derived = store.derive_dataset(dataset_id, without='attendance')
+
+    assert store.has_uploads(derived, 'marks')
+    assert not store.has_uploads(derived, 'attendance')
+    assert store.load_state(derived) == {'keys': {}}
+    for name in ('marks.upload', 'marks.upload.sha256', 'marks.feather'):
+        source = os.stat(os.path.join(store.dataset_dir(dataset_id), name))
+        linked = os.stat(os.path.join(store.dataset_dir(derived), name))
+        assert linked.st_ino == source.st_ino
+
+    # Writes replace files, so the source dataset keeps its own frame
+    store.save_frame(derived, 'marks', pd.DataFrame({'Mark': [12.0]}))
+    assert store.load_frame(dataset_id, 'marks')['Mark'].tolist() == [70.5]
+
+
+def test_invalid_dataset_ids_are_rejected(store):
+    with pytest.raises(ValueError, match='Invalid dataset ID'):
+        store.dataset_dir('../etc')
+    assert not store.has_frames('../etc', 'marks')
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.analysis import calculate_average_marks_by_class, calculate_year_group_attendance_summary, preprocess_marks
+from app.dtypes import compact_dtypes, widen_floats
+
+WEIGHTS = {
+    'T1Weight': [10.33, 9.998999999999999, 12.1, 11.45],
+    'T2Weight': [11.2, 7.199999999999999, 10.05, 9.0],
+    'T3Weight': [11.1, 32.40000000000001, 10.5, 12.35],
+}
+
+
+def marks_frame():
+    return pd.DataFrame({
+        'StudentID': [101.0, 102.0, 103.0, 104.0],
+        'Class': ['10MAT1', '10MAT1', '10MAT1', '10ENG2'],
+        'Subject': ['Maths', 'Maths', 'Maths', 'English'],
+        **WEIGHTS,
+        'Notes': ['a', 'b', 'c', 'd'],
+    })
+
+
+def test_compact_dtypes_pins_each_known_column():
+    df = compact_dtypes(marks_frame())
+    assert df['StudentID'].dtype == np.int32
+    assert isinstance(df['Class'].dtype, pd.CategoricalDtype)
+    assert isinstance(df['Subject'].dtype, pd.CategoricalDtype)
+    assert all(df[column].dtype == np.float32 for column in WEIGHTS)
+    assert df['Notes'].dtype == object
+
+
+def test_compact_dtypes_leaves_unconvertible_columns_alone():
+    df = compact_dtypes(pd.DataFrame({'StudentID': [1.0, None, 3.5], 'FinalMark': ['high', 'low', 'mid']}))
+    assert df['StudentID'].dtype == np.float64
+    assert df['FinalMark'].dtype == object
+
+
+def test_widen_floats_round_trips_the_uploaded_decimals():
+    widened = widen_floats(compact_dtypes(marks_frame()))
+    assert widened['T1Weight'].dtype == np.float64
+    assert widened['T1Weight'].tolist() == [10.33, 9.999, 12.1, 11.45]
+    assert widened['T3Weight'].tolist() == [11.1, 32.4, 10.5, 12.35]
+    assert widen_floats(widened['StudentID']) is widened['StudentID']
+
+
+def test_means_are_computed_in_float64_from_the_uploaded_decimals():
+    marks_df = preprocess_marks(compact_dtypes(marks_frame()))
+    assert marks_df['CalculatedFinalMark'].dtype == np.float64
+
+    averages = calculate_average_marks_by_class(marks_df)
+    assert averages.dtype == np.float64
+    expected = (np.array([10.33, 9.999, 12.1]) + np.array([11.2, 7.2, 10.05]) + np.array([11.1, 32.4, 10.5])).mean()
+    # A float32 mean is only right to about 1e-6 and shows as e.g. 32.633667
+    assert averages['10MAT1'] == pytest.approx(expected, rel=1e-12)
+
+
+def test_attendance_summary_is_computed_in_float64():
+    attendance_df = compact_dtypes(pd.DataFrame({
+        'StudentID': [1, 1, 2, 3],
+        'School Year': ['10', '10', '10', '11'],
+        'Percentage': [91.3, 88.7, 97.1, 62.35],
+    }))
+    [year_10, year_11] = calculate_year_group_attendance_summary(attendance_df)
+    assert year_10['mean'] == pytest.approx((90.0 + 97.1) / 2, rel=1e-12)
+    assert year_10['PercentageAbove90'] == 50.0
+    assert year_11['min'] == 62.35
@@ -0,0 +1,113 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.dataset_store import UPLOAD_CHUNK_SIZE, DatasetStore, UploadTooLargeError
+from app.dtypes import compact_dtypes
+from app.ingest import read_csv_file, read_parquet_file, read_table_file, sniff_format
+
+MARKS = pd.DataFrame({
+    'StudentID': [101, 102, 103, 104, 105],
+    'Class': ['10MATA', '10MATA', '10ENGB', '10ENGB', '10MATA'],
+    'Subject': ['Maths', 'Maths', 'English', 'English', 'Maths'],
+    'FinalMark': [72.5, 64.25, 88.0, 51.75, 90.0],
+    'Student Name': ['Ann', 'Ben', 'Cat', 'Dan', 'Eve'],
+})
+
+
+def marks_bytes(fmt):
+    buffer = io.BytesIO()
+    if fmt == 'csv':
+        buffer.write(MARKS.to_csv(index=False).encode('utf-8-sig'))
+    elif fmt == 'parquet':
+        MARKS.to_parquet(buffer, index=False)
+    else:
+        MARKS.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def write_upload(tmp_path, fmt):
+    path = tmp_path / f"upload.{fmt}"
+    path.write_bytes(marks_bytes(fmt))
+    return str(path)
+
+
+@pytest.mark.parametrize('fmt, expected', [('csv', 'csv'), ('parquet', 'parquet'), ('xlsx', 'excel')])
+def test_sniff_format_reads_the_content_not_the_name(fmt, expected):
+    assert sniff_format(marks_bytes(fmt)[:4096]) == expected
+
+
+def test_sniff_format_accepts_a_head_cut_inside_a_character():
+    head = 'StudentID,Name\n1,Zoë'.encode('utf-8')
+    assert sniff_format(head[:-1]) == 'csv'
+
+
+@pytest.mark.parametrize('head', [b'%PDF-1.7\n\xe2\xe3\xcf\xd3', b'\x89PNG\r\n\x1a\n\x00\x00', b''])
+def test_sniff_format_rejects_other_files(head):
+    with pytest.raises(ValueError, match='Unrecognised file format'):
+        sniff_format(head)
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet', 'xlsx'])
+def test_every_format_reads_to_the_same_compact_frame(tmp_path, fmt):
+    # Excel frames are compacted after reading (see analysis.compact_frame); CSV and Parquet already are
+    df = compact_dtypes(read_table_file(write_upload(tmp_path, fmt)))
+    assert df['StudentID'].dtype == np.int32
+    assert isinstance(df['Class'].dtype, pd.CategoricalDtype)
+    assert df['FinalMark'].dtype == np.float32
+    assert df['FinalMark'].tolist() == MARKS['FinalMark'].tolist()
+    assert df['Student Name'].tolist() == MARKS['Student Name'].tolist()
+
+
+def test_read_csv_file_merges_categories_across_chunks(tmp_path):
+    df = read_csv_file(write_upload(tmp_path, 'csv'), chunk_rows=2)
+    assert isinstance(df['Subject'].dtype, pd.CategoricalDtype)
+    assert df['Subject'].astype(str).tolist() == MARKS['Subject'].tolist()
+    assert df['StudentID'].tolist() == MARKS['StudentID'].tolist()
+
+
+def test_read_csv_file_rejects_an_empty_file(tmp_path):
+    path = tmp_path / 'empty.csv'
+    path.write_text('')
+    with pytest.raises(ValueError, match='Failed to read CSV file'):
+        read_csv_file(str(path))
+
+
+def test_read_parquet_file_prunes_unknown_columns(tmp_path):
+    path = tmp_path / 'extra.parquet'
+    MARKS.assign(Notes='unused').to_parquet(path, index=False)
+    assert 'Notes' not in read_parquet_file(str(path)).columns
+
+
+class Upload:
+    """The parts of a werkzeug FileStorage the store reads, over a plain stream."""
+
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+
+def test_oversized_upload_is_rejected_mid_write_and_leaves_nothing(tmp_path):
+    store = DatasetStore(root=str(tmp_path), max_upload_bytes=UPLOAD_CHUNK_SIZE + 1)
+    dataset_id = store.new_dataset_id()
+    upload = Upload(b'x' * (4 * UPLOAD_CHUNK_SIZE))
+
+    with pytest.raises(UploadTooLargeError, match='under 1.0 MB'):
+        store.save_upload(dataset_id, 'marks', upload)
+    # The copy stopped at the chunk that crossed the limit rather than reading the whole stream
+    assert upload.stream.tell() == 2 * UPLOAD_CHUNK_SIZE
+    assert os.listdir(store.dataset_dir(dataset_id)) == []
+
+
+def test_upload_at_the_limit_is_saved(tmp_path):
+    store = DatasetStore(root=str(tmp_path), max_upload_bytes=len(marks_bytes('csv')))
+    dataset_id = store.new_dataset_id()
+    path = store.save_upload(dataset_id, 'marks', Upload(marks_bytes('csv')))
+    assert read_table_file(path)['StudentID'].tolist() == MARKS['StudentID'].tolist()
+
+
+def test_size_limit_message_is_readable():
+    assert str(UploadTooLargeError(60000)).endswith('under 60000 bytes.')
+    assert str(UploadTooLargeError(5 * 1024 * 1024)).endswith('under 5.0 MB.')
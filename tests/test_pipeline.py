@@ -0,0 +1,199 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from app.dataset_store import DatasetStore
+from app.pipeline import DatasetStageMemo, Pipeline, Stage
+
+calls = Counter()
+
+
+def load_scores(scores_file):
+    calls['scores'] += 1
+    return pd.DataFrame({'student': [1, 2, 3, 4], 'score': [float(value) for value in scores_file.split(',')]})
+
+
+def scores_above(scores, threshold):
+    calls['above'] += 1
+    return scores[scores['score'] > threshold].reset_index(drop=True)
+
+
+def mean_score(scores):
+    calls['mean'] += 1
+    return float(scores['score'].mean())
+
+
+def score_range(scores):
+    calls['range'] += 1
+    return sorted({int(scores['score'].min() // 10), int(scores['score'].max() // 10)})
+
+
+def range_label(range):
+    calls['label'] += 1
+    return f"{range[0] * 10}-{range[-1] * 10 + 9}"
+
+
+def scores_above_again(scores, threshold):
+    calls['above_again'] += 1
+    return scores[scores['score'] > threshold].reset_index(drop=True)
+
+
+def make_pipeline(above=scores_above):
+    return Pipeline([
+        Stage('scores', load_scores, inputs=('scores_file',)),
+        Stage('above', above, inputs=('scores',), params=('threshold',)),
+        Stage('mean', mean_score, inputs=('scores',)),
+        # Fingerprinted on its value: a new file with the same range leaves 'label' alone
+        Stage('range', score_range, inputs=('scores',), fingerprint=lambda value: value),
+        Stage('label', range_label, inputs=('range',)),
+    ])
+
+
+TARGETS = ('above', 'mean', 'label')
+
+
+@pytest.fixture(autouse=True)
+def reset_calls():
+    calls.clear()
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        yield pool
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DatasetStore(root=str(tmp_path))
+
+
+def run(pipeline, executor, scores_file, threshold, memo=None):
+    calls.clear()
+    return pipeline.run(
+        {'scores_file': scores_file}, {'threshold': threshold}, targets=TARGETS,
+        source_keys={'scores_file': f"digest of {scores_file}"}, memo=memo, executor=executor
+    )
+
+
+def assert_same_outputs(outputs, expected):
+    assert outputs.keys() == expected.keys()
+    for name, value in expected.items():
+        if isinstance(value, pd.DataFrame):
+            pd.testing.assert_frame_equal(outputs[name], value)
+        else:
+            assert outputs[name] == value
+
+
+def test_run_produces_targets_in_dependency_order(executor):
+    outputs = run(make_pipeline(), executor, '50,60,70,80', 65)
+    assert list(outputs['above']['student']) == [3, 4]
+    assert outputs['mean'] == 65.0
+    assert outputs['label'] == '50-89'
+    assert calls == Counter(scores=1, above=1, mean=1, range=1, label=1)
+
+
+def test_only_stages_needed_for_the_targets_run(executor):
+    make_pipeline().run({'scores_file': '50,60,70,80'}, {'threshold': 65}, targets=('mean',), executor=executor)
+    assert calls == Counter(scores=1, mean=1)
+
+
+def test_stage_reruns_only_when_its_inputs_or_params_change(store, executor):
+    pipeline = make_pipeline()
+    dataset_id = store.new_dataset_id()
+
+    def memo():
+        # A new memo per run reloads what the previous run committed to the store
+        return DatasetStageMemo(store, dataset_id)
+
+    run(pipeline, executor, '50,60,70,80', 65, memo())
+    assert calls == Counter(scores=1, above=1, mean=1, range=1, label=1)
+
+    # A fingerprinted stage is not memoized: it runs every time, and only what depends on it is skipped
+    unchanged = run(pipeline, executor, '50,60,70,80', 65, memo())
+    assert calls == Counter(range=1)
+    assert_same_outputs(unchanged, run(pipeline, executor, '50,60,70,80', 65))
+
+    new_threshold = run(pipeline, executor, '50,60,70,80', 75, memo())
+    assert calls == Counter(above=1, range=1)
+    assert_same_outputs(new_threshold, run(pipeline, executor, '50,60,70,80', 75))
+
+    new_file = run(pipeline, executor, '55,60,70,85', 75, memo())
+    # The range is still 50-89, so its fingerprint is unchanged and 'label' is reused
+    assert calls == Counter(scores=1, above=1, mean=1, range=1)
+    assert_same_outputs(new_file, run(pipeline, executor, '55,60,70,85', 75))
+
+    wider = run(pipeline, executor, '35,60,70,95', 75, memo())
+    assert calls == Counter(scores=1, above=1, mean=1, range=1, label=1)
+    assert wider['label'] == '30-99'
+
+
+def test_changing_a_stage_function_reruns_it(store, executor):
+    dataset_id = store.new_dataset_id()
+    run(make_pipeline(), executor, '50,60,70,80', 65, DatasetStageMemo(store, dataset_id))
+
+    outputs = run(make_pipeline(above=scores_above_again), executor, '50,60,70,80', 65, DatasetStageMemo(store, dataset_id))
+    assert calls == Counter(above_again=1, range=1)
+    assert list(outputs['above']['student']) == [3, 4]
+
+
+def test_memo_commit_stores_frames_and_values_with_their_keys(store, executor):
+    dataset_id = store.new_dataset_id()
+    memo = DatasetStageMemo(store, dataset_id, frame_names={'scores': 'scores'})
+    run(make_pipeline(), executor, '50,60,70,80', 65, memo)
+
+    reloaded = DatasetStageMemo(store, dataset_id, frame_names={'scores': 'scores'})
+    assert reloaded.keys == memo.keys
+    assert set(reloaded.keys) == {'scores', 'above', 'mean', 'label'}  # 'range' has a fingerprint and is not stored
+    assert store.has_frames(dataset_id, 'scores', 'stage_above')
+    assert reloaded.load('mean') == 65.0
+    pd.testing.assert_frame_equal(reloaded.load('scores'), load_scores('50,60,70,80'))
+    assert not reloaded.has('mean', 'another key')
+
+
+def test_memo_is_not_written_when_a_stage_fails(store, executor):
+    def broken_mean(scores):
+        raise RuntimeError('no mean')
+
+    pipeline = Pipeline([
+        Stage('scores', load_scores, inputs=('scores_file',)),
+        Stage('mean', broken_mean, inputs=('scores',)),
+    ])
+    dataset_id = store.new_dataset_id()
+    with pytest.raises(RuntimeError, match='no mean'):
+        pipeline.run({'scores_file': '50,60,70,80'}, {}, source_keys={'scores_file': 'digest'},
+                     memo=DatasetStageMemo(store, dataset_id), executor=executor)
+    assert store.load_state(dataset_id) is None
+
+
+def test_stages_that_are_not_memoized_always_run(store, executor):
+    pipeline = Pipeline([
+        Stage('scores', load_scores, inputs=('scores_file',)),
+        Stage('mean', mean_score, inputs=('scores',), memoize=False),
+    ])
+    dataset_id = store.new_dataset_id()
+    for _ in range(2):
+        calls.clear()
+        pipeline.run({'scores_file': '50,60,70,80'}, {}, source_keys={'scores_file': 'digest'},
+                     memo=DatasetStageMemo(store, dataset_id), executor=executor)
+    assert calls == Counter(mean=1)
+
+
+def test_stages_in_a_cycle_can_never_run(executor):
+    pipeline = Pipeline([
+        Stage('first', mean_score, inputs=('second',)),
+        Stage('second', mean_score, inputs=('first',)),
+    ])
+    with pytest.raises(ValueError, match='can never run: first, second'):
+        pipeline.run({}, {}, executor=executor)
+
+
+def test_pipeline_rejects_duplicate_outputs_and_missing_sources(executor):
+    with pytest.raises(ValueError, match="Output 'mean' is produced by both"):
+        Pipeline([Stage('mean', mean_score, inputs=('scores',)), Stage('other', mean_score, outputs=('mean',))])
+    with pytest.raises(ValueError, match='Missing pipeline source'):
+        make_pipeline().run({}, {'threshold': 65}, targets=('mean',), executor=executor)
+    with pytest.raises(ValueError, match='No stage produces: median'):
+        make_pipeline().run({'scores_file': '50,60,70,80'}, {'threshold': 65}, targets=('median',), executor=executor)
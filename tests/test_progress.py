@@ -0,0 +1,81 @@
+import json
+import threading
+
+import pytest
+from flask import Flask, Response, stream_with_context
+
+from app.progress import AnalysisCancelled, stream_job_events, substage
+from conftest import sse_events
+
+job_finished = threading.Event()
+job_outcome = {}
+
+
+def count_rows(rows, reporter):
+    with reporter.stage('Counting rows') as info:
+        with substage('Checking rows'):
+            pass
+        info['rows'] = rows
+    return {'rows': rows, 'mean': float('nan')}
+
+
+def broken_job(reporter):
+    reporter.log('Reading the upload...')
+    raise ValueError('the marks file has no rows')
+
+
+def endless_job(reporter):
+    try:
+        while True:
+            reporter.log('Still working...')
+            reporter.cancel_event.wait(0.01)
+    except AnalysisCancelled:
+        job_outcome['cancelled'] = True
+        raise
+    finally:
+        job_finished.set()
+
+
+@pytest.fixture
+def stream_client():
+    flask_app = Flask(__name__)
+    jobs = {'count': (count_rows, 12), 'broken': (broken_job,), 'endless': (endless_job,)}
+
+    @flask_app.route('/jobs/<name>')
+    def run_job(name):
+        return Response(stream_with_context(stream_job_events(*jobs[name])), content_type='text/event-stream')
+
+    job_finished.clear()
+    job_outcome.clear()
+    return flask_app.test_client()
+
+
+def test_stream_ends_with_the_result(stream_client):
+    events = sse_events(stream_client.get('/jobs/count').get_data(as_text=True))
+    assert [event_type for event_type, _ in events] == ['log', 'stage', 'stage', 'log', 'stage', 'result']
+
+    stages = [json.loads(data) for event_type, data in events if event_type == 'stage']
+    assert [(stage['stage'], stage['parent']) for stage in stages] == [
+        ('Checking rows', 'Counting rows'), ('Counting rows', None), ('Serializing results', None),
+    ]
+    assert stages[1]['rows'] == 12
+    assert all(stage['status'] == 'ok' for stage in stages)
+    assert json.loads(events[-1][1]) == {'rows': 12, 'mean': None}
+
+
+def test_a_failing_job_ends_with_an_error_event(stream_client):
+    events = sse_events(stream_client.get('/jobs/broken').get_data(as_text=True))
+    assert events[0] == ('log', 'Reading the upload...')
+    assert events[-1] == ('error', json.dumps({'error': 'An error occurred during analysis: the marks file has no rows'}))
+    assert 'result' not in [event_type for event_type, _ in events]
+
+
+def test_closing_the_stream_cancels_the_job(stream_client):
+    response = stream_client.get('/jobs/endless', buffered=False)
+    stream = iter(response.response)
+    assert sse_events([next(stream).decode()]) == [('log', 'Still working...')]
+
+    # What the server does when the client disconnects: close the response, and with it the generator
+    response.close()
+    assert job_finished.wait(5)
+    assert job_outcome == {'cancelled': True}
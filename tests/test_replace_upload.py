@@ -0,0 +1,75 @@
+import json
+import re
+
+from app.dataset_store import get_dataset_store
+from conftest import csv_file, sse_events
+
+THRESHOLDS = {
+    'lowAttendanceThreshold': '85', 'highAttendanceThreshold': '95',
+    'lowMarksThreshold': '-1', 'highMarksThreshold': '1', 'chartMode': 'data',
+}
+MARKS_STAGES = {
+    'Reading and preprocessing marks',
+    'Identifying low Z-scores',
+    'Identifying students with subjects below threshold',
+    'Calculating average marks by class',
+    'Identifying high Z-scores above threshold 1.0',
+}
+
+
+def analyse(client, url, **files):
+    response = client.post(url, data={**THRESHOLDS, **files}, content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_data(as_text=True)
+    events = sse_events(response.get_data(as_text=True))
+    reused = {match.group(1) for event_type, data in events if event_type == 'log'
+              for match in [re.match(r"Reusing the result of '(.*)': its inputs are unchanged\.", data)] if match}
+    ran = {json.loads(data)['stage'] for event_type, data in events if event_type == 'stage'}
+    assert events[-1][0] == 'result', events[-1]
+    return json.loads(events[-1][1]), reused, ran
+
+
+def session_dataset(client):
+    with client.session_transaction() as session:
+        return session['dataset_id']
+
+
+def test_replacing_the_attendance_reuses_every_marks_only_stage(client, uploads):
+    attendance, marks = uploads
+    first, reused, _ = analyse(client, '/upload', attendanceFile=csv_file(attendance, 'a.csv'), marksFile=csv_file(marks, 'm.csv'))
+    assert reused == set()
+    first_dataset = session_dataset(client)
+
+    changed = attendance.index[:20]
+    attendance.loc[changed, 'Absence Time'] += 100
+    attendance.loc[changed, 'Percentage'] -= 10
+    replaced, reused, ran = analyse(client, '/upload/attendance', attendanceFile=csv_file(attendance, 'a.csv'))
+
+    assert reused == MARKS_STAGES
+    assert not ran & MARKS_STAGES
+    assert 'Reading, mapping and preprocessing attendance' in ran
+    for name in ('low_z_scores', 'high_z_scores', 'average_marks_by_class', 'students_below_threshold_in_multiple_subjects'):
+        assert replaced[name] == first[name], name
+    assert replaced['year_group_attendance_summary'] != first['year_group_attendance_summary']
+
+    # The replacement is a new dataset; the one it was derived from is left as it was
+    assert session_dataset(client) != first_dataset
+    assert get_dataset_store().has_frames(first_dataset, 'marks', 'attendance')
+
+
+def test_resubmitting_the_same_attendance_reuses_everything_but_charts(client, uploads):
+    attendance, marks = uploads
+    analyse(client, '/upload', attendanceFile=csv_file(attendance, 'a.csv'), marksFile=csv_file(marks, 'm.csv'))
+    _, reused, _ = analyse(client, '/upload/attendance', attendanceFile=csv_file(attendance, 'a.csv'))
+    assert MARKS_STAGES | {'Reading, mapping and preprocessing attendance', 'Analyzing correlation'} <= reused
+
+
+def test_replace_needs_a_known_name_an_analysed_dataset_and_a_valid_file(client, uploads):
+    attendance, marks = uploads
+    assert client.post('/upload/grades').status_code == 404
+    assert client.post('/upload/marks', data={'marksFile': csv_file(marks, 'm.csv')}, content_type='multipart/form-data').status_code == 400
+
+    analyse(client, '/upload', attendanceFile=csv_file(attendance, 'a.csv'), marksFile=csv_file(marks, 'm.csv'))
+    response = client.post('/upload/marks', data={'marksFile': csv_file(marks.drop(columns='T3Weight'), 'm.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert response.get_json()['problems']['marks'][0]['missing'] == ['T3Weight']
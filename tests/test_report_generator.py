@@ -0,0 +1,105 @@
+import io
+import zipfile
+
+import pandas as pd
+import pytest
+from docx import Document
+from docx.oxml.ns import qn
+
+import app.report_generator
+from app.report_generator import ZipStreamBuffer, body_elements, generate_student_report, iter_student_report_archive
+
+STUDENT_IDS = [2001, 2002, 2003, 2004, 2005, 2006, 2007]
+
+
+def report_data():
+    marks, attendance = [], []
+    for position, student_id in enumerate(STUDENT_IDS):
+        for subject, offset in (('Mathematics', 0.0), ('English', 4.5)):
+            marks.append({
+                'StudentID': student_id, 'Student Name': f"Student {position}" if position % 3 else None,
+                'Subject': subject, 'T1': 50.0 + position, 'T2': 55.5 + offset, 'T3': 60.25,
+                'T4': 70.0 if student_id == 2004 else None,
+                'CalculatedFinalMark': 58.75 + position, 'zScore': round(-1.2 + position * 0.1, 2),
+            })
+            attendance.append({
+                'StudentID': student_id, 'School Year': 11, 'Subject': subject,
+                'AttendancePercentage': 80.0 + position + offset,
+            })
+    attendance = pd.DataFrame(attendance)
+    overall = attendance.groupby('StudentID')['AttendancePercentage'].mean().reset_index()
+    return pd.DataFrame(marks), attendance, overall
+
+
+def render(monkeypatch, students_per_chunk, workers=None):
+    monkeypatch.setattr(app.report_generator, 'STUDENTS_PER_CHUNK', students_per_chunk)
+    marks, attendance, overall = report_data()
+    return Document(generate_student_report(marks, STUDENT_IDS, attendance, overall, workers=workers))
+
+
+def block_texts(document):
+    """The text of each paragraph and table in the document's body, in order."""
+    return [' | '.join(text for text in element.itertext()) for element in body_elements(document)]
+
+
+def test_merged_document_has_unique_drawing_ids(monkeypatch):
+    document = render(monkeypatch, 2)
+    ids = [doc_pr.get('id') for doc_pr in document.element.body.iter(qn('wp:docPr'))]
+    assert len(ids) == len(STUDENT_IDS)  # One logo per student
+    assert len(set(ids)) == len(ids)
+
+
+def test_merged_document_shares_one_logo_image(monkeypatch):
+    document = render(monkeypatch, 2)
+    images = [part.partname for part in document.part.package.iter_parts() if part.partname.startswith('/word/media/')]
+    assert images == ['/word/media/image1.png']
+
+
+@pytest.mark.parametrize('students_per_chunk', [1, 3])
+def test_chunked_report_has_the_same_sections_as_a_single_chunk(monkeypatch, students_per_chunk):
+    single = block_texts(render(monkeypatch, len(STUDENT_IDS)))
+    assert block_texts(render(monkeypatch, students_per_chunk)) == single
+
+    headings = [text for text in single if ' - Year 11' in text]
+    assert headings[0].startswith('2001 - ') and headings[1].startswith('Student 1 - ')
+    assert len(headings) == len(STUDENT_IDS)
+
+
+def test_report_rendered_on_the_process_pool_matches_the_serial_one(monkeypatch):
+    serial = block_texts(render(monkeypatch, 2))
+    assert block_texts(render(monkeypatch, 2, workers=2)) == serial
+
+
+def test_students_with_term_4_marks_get_the_extra_column(monkeypatch):
+    tables = render(monkeypatch, 3).tables
+    # Each student has a header table, a results table and an attendance table
+    results_tables = tables[1::3]
+    assert [len(table.columns) for table in results_tables] == [6, 6, 6, 7, 6, 6, 6]
+    assert results_tables[3].rows[1].cells[4].text == '70.0%'
+
+
+def test_archive_is_streamed_with_one_report_per_student():
+    marks, attendance, overall = report_data()
+    pieces = iter_student_report_archive(marks, STUDENT_IDS, attendance, overall)
+    first = next(pieces)
+    assert first.startswith(b'PK\x03\x04')  # The first report is sent before the others are rendered
+    data = first + b''.join(pieces)
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        names = archive.namelist()
+        assert len(names) == len(STUDENT_IDS)
+        assert names[:2] == ['2001.docx', 'Student 1 - 2002.docx']
+        for name in names:
+            document = Document(io.BytesIO(archive.read(name)))
+            headings = [text for text in block_texts(document) if ' - Year 11' in text]
+            assert len(headings) == 1
+            assert headings[0].startswith(name.split(' - ')[0].removesuffix('.docx') + ' - ')
+
+
+def test_zip_stream_buffer_hands_out_each_write_once():
+    buffer = ZipStreamBuffer()
+    buffer.write(b'PK')
+    buffer.write(memoryview(b'\x03\x04'))
+    assert buffer.drain() == b'PK\x03\x04'
+    assert buffer.drain() == b''
@@ -0,0 +1,55 @@
+import pandas as pd
+
+from app.student_index import StudentIndex
+
+
+def make_index():
+    students = pd.DataFrame({
+        'StudentID': [1234, 12, 123, 456, 789],
+        'StudentName': ['Dana Moss', 'Alice Wong', 'Bob Natale', 'Natalie Cho', 'Eve Stone'],
+    })
+    marks = pd.DataFrame({
+        'StudentID': [123, 12, 123, 456],
+        'Subject': ['Maths', 'Maths', 'English', 'Maths'],
+        'CalculatedFinalMark': [70.5, 64.25, 81.0, 55.0],
+        'zScore': [0.5, -0.1, 1.2, -1.0],
+    })
+    attendance = students.assign(Subject='Maths', OverallAttendancePercentage=[90.0, 85.5, 77.0, 99.0, 60.0])
+    return StudentIndex(marks, attendance)
+
+
+def test_exact_id_comes_first_and_keeps_substring_matches():
+    # Regression: an exact ID match used to return only that student, dropping 1234
+    assert make_index().search('123') == [123, 1234]
+
+
+def test_short_query_scans_ids_and_names():
+    assert make_index().search('12') == [12, 123, 1234]
+
+
+def test_name_substring_is_case_insensitive():
+    assert make_index().search('NATAL') == [123, 456]
+    assert make_index().search('  wong ') == [12]
+
+
+def test_trigram_lookup_matches_ids_and_names():
+    index = make_index()
+    assert index.search('ston') == [789]
+    # 'ali' is shared by Alice and Natalie; 'lie' narrows it to Natalie
+    assert index.search('alie') == [456]
+    assert index.search('45') == [456]
+    assert index.search('xyz') == []
+
+
+def test_empty_query_lists_every_student_in_id_order():
+    assert make_index().search('') == [12, 123, 456, 789, 1234]
+
+
+def test_student_record_joins_marks_and_attendance():
+    record = make_index().student_record(123)
+    assert record['StudentName'] == 'Bob Natale'
+    assert record['Marks'] == [
+        {'Subject': 'Maths', 'CalculatedFinalMark': 70.5, 'zScore': 0.5},
+        {'Subject': 'English', 'CalculatedFinalMark': 81.0, 'zScore': 1.2},
+    ]
+    assert make_index().student_record(789)['Marks'] == []
@@ -0,0 +1,138 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+from flask import Flask, request
+
+import app.dataset_store
+from app.dataset_store import DatasetStore
+from app.upload_buffer import SpooledUpload, UploadRequest
+
+DATA = b'StudentID,Mark\n' + b''.join(f"{i},{i % 100}.5\n".encode() for i in range(200))
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = DatasetStore(root=str(tmp_path), spool_memory_bytes=256)
+    monkeypatch.setattr(app.dataset_store, '_dataset_store', store)
+    return store
+
+
+def spool_files(store):
+    return os.listdir(store.spool_dir) if os.path.isdir(store.spool_dir) else []
+
+
+def write_in_chunks(buffer, data, size=100):
+    for start in range(0, len(data), size):
+        buffer.write(data[start:start + size])
+
+
+def test_small_upload_stays_in_memory(store):
+    buffer = store.spooled_upload()
+    buffer.write(DATA[:200])
+    buffer.seek(0)
+    assert not buffer.spilled
+    assert buffer.read() == DATA[:200]
+    assert spool_files(store) == []
+
+
+def test_large_upload_spills_and_reads_back(store):
+    buffer = store.spooled_upload()
+    write_in_chunks(buffer, DATA)
+    assert buffer.spilled
+    assert os.path.dirname(buffer.spill_path) == store.spool_dir
+    assert buffer.digest == hashlib.sha256(DATA).hexdigest()
+    assert buffer.size == len(DATA)
+
+    buffer.seek(0)
+    assert buffer.read(15) == DATA[:15]
+    assert buffer.tell() == 15
+    buffer.seek(0)
+    assert b''.join(buffer) == DATA
+
+
+def test_persist_renames_the_spilled_file(store, tmp_path):
+    buffer = store.spooled_upload()
+    write_in_chunks(buffer, DATA)
+    spill_inode = os.stat(buffer.spill_path).st_ino
+
+    target = str(tmp_path / 'marks.upload')
+    assert buffer.persist(target) == hashlib.sha256(DATA).hexdigest()
+    assert os.stat(target).st_ino == spill_inode
+    buffer.close()
+    assert open(target, 'rb').read() == DATA
+    assert spool_files(store) == []
+
+
+def test_close_removes_a_spill_that_was_never_persisted(store):
+    with store.spooled_upload() as buffer:
+        write_in_chunks(buffer, DATA)
+        assert spool_files(store) == [os.path.basename(buffer.spill_path)]
+    assert buffer.closed
+    assert spool_files(store) == []
+
+
+def test_bytes_past_the_limit_are_discarded():
+    buffer = SpooledUpload('unused', max_memory=0, max_bytes=100)
+    write_in_chunks(buffer, DATA, size=60)
+    assert buffer.too_large
+    assert buffer.size == len(DATA)
+    assert buffer.tell() == 60
+
+
+def upload_app():
+    flask_app = Flask(__name__)
+    flask_app.request_class = UploadRequest
+
+    @flask_app.post('/upload')
+    def upload():
+        spooled = request.files['marksFile'].stream
+        assert spooled.spilled
+        if request.form.get('fail'):
+            raise RuntimeError('analysis failed')
+        return 'ok'
+
+    return flask_app
+
+
+@pytest.mark.parametrize('fail', ['', '1'])
+def test_request_removes_its_spilled_uploads_however_it_ends(store, fail):
+    flask_app = upload_app()
+    flask_app.config['PROPAGATE_EXCEPTIONS'] = False
+    response = flask_app.test_client().post(
+        '/upload', data={'marksFile': (io.BytesIO(DATA), 'marks.csv'), 'fail': fail}, content_type='multipart/form-data'
+    )
+    assert response.status_code == (500 if fail else 200)
+    assert spool_files(store) == []
+
+
+def test_sweep_removes_stale_spilled_uploads(store):
+    os.makedirs(store.spool_dir)
+    stale = os.path.join(store.spool_dir, 'tmpstale.spool')
+    recent = os.path.join(store.spool_dir, 'tmprecent.spool')
+    for path in (stale, recent):
+        with open(path, 'wb') as f:
+            f.write(DATA)
+    old = time.time() - store.ttl_seconds - 60
+    os.utime(stale, (old, old))
+
+    store.sweep()
+    assert spool_files(store) == ['tmprecent.spool']
+
+
+def test_a_body_cut_off_mid_file_leaves_no_spilled_upload(store):
+    flask_app = Flask(__name__)
+    flask_app.request_class = UploadRequest
+
+    @flask_app.post('/upload')
+    def upload():
+        assert 'marksFile' not in request.files
+        return 'rejected'
+
+    # The form parser gives up on a file part with no closing boundary, dropping the buffer it was writing
+    body = b'--cut\r\nContent-Disposition: form-data; name="marksFile"; filename="marks.csv"\r\n\r\n' + DATA
+    response = flask_app.test_client().post('/upload', data=body, content_type='multipart/form-data; boundary=cut')
+    assert response.status_code == 200
+    assert spool_files(store) == []
@@ -0,0 +1,88 @@
+import os
+
+import pandas as pd
+import pytest
+
+from app.upload_cache import UploadCache, hash_file
+
+
+class CountingParser:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, file_path):
+        self.calls += 1
+        return pd.read_csv(file_path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return UploadCache(cache_dir=str(tmp_path / 'cache'))
+
+
+def write_upload(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def cache_entries(cache):
+    return sorted(name for name in os.listdir(cache.cache_dir) if name.endswith('.feather'))
+
+
+def test_identical_bytes_share_an_entry_and_skip_the_parse(cache, tmp_path):
+    parser = CountingParser()
+    first = cache.get_or_parse(write_upload(tmp_path, 'term1.csv', 'StudentID,Mark\n1,70.5\n2,64\n'), parser)
+    # Same bytes under another name, as when staff re-upload the same export
+    second = cache.get_or_parse(write_upload(tmp_path, 'copy of term1.csv', 'StudentID,Mark\n1,70.5\n2,64\n'), parser)
+
+    assert parser.calls == 1
+    pd.testing.assert_frame_equal(second, first)
+    assert cache_entries(cache) == [f"{hash_file(str(tmp_path / 'term1.csv'))}-raw.feather"]
+
+
+def test_different_bytes_miss(cache, tmp_path):
+    parser = CountingParser()
+    cache.get_or_parse(write_upload(tmp_path, 'term1.csv', 'StudentID,Mark\n1,70.5\n'), parser)
+    changed = cache.get_or_parse(write_upload(tmp_path, 'term1 fixed.csv', 'StudentID,Mark\n1,71.5\n'), parser)
+
+    assert parser.calls == 2
+    assert changed['Mark'].tolist() == [71.5]
+    assert len(cache_entries(cache)) == 2
+
+
+def test_namespaces_are_cached_separately(cache, tmp_path):
+    parser = CountingParser()
+    path = write_upload(tmp_path, 'term1.csv', 'StudentID,Mark\n1,70.5\n')
+    cache.get_or_parse(path, parser)
+    cache.get_or_parse(path, parser, namespace='report')
+    cache.get_or_parse(path, parser, namespace='report')
+    assert parser.calls == 2
+
+
+def test_oldest_entry_is_evicted_once_over_capacity(tmp_path):
+    cache = UploadCache(cache_dir=str(tmp_path / 'cache'), max_bytes=10 ** 9)
+    # The same frame under every digest, so every entry has the same size
+    df = pd.DataFrame({'Mark': [70.5] * 100})
+    for age, digest in zip((300, 200, 100), ('a' * 64, 'b' * 64, 'c' * 64)):
+        cache.put(digest, df)
+        path = cache._entry_path(digest, 'raw')
+        os.utime(path, (os.path.getmtime(path) - age,) * 2)
+
+    # A hit refreshes the oldest entry, so the next oldest goes first
+    assert cache.get('a' * 64) is not None
+    entry_bytes = os.path.getsize(cache._entry_path('a' * 64, 'raw'))
+    cache.max_bytes = 3 * entry_bytes
+    cache.put('d' * 64, df)
+
+    assert cache.get('b' * 64) is None
+    assert cache.get('a' * 64) is not None
+    assert cache.get('c' * 64) is not None
+    assert cache.get('d' * 64) is not None
+
+
+def test_frames_arrow_cannot_store_are_returned_uncached(cache, tmp_path):
+    mixed = pd.DataFrame({'Mark': [1, 'absent']})
+    assert not cache.put('e' * 64, mixed)
+    assert cache.get('e' * 64) is None
+    assert os.listdir(cache.cache_dir) == []
@@ -0,0 +1,99 @@
+import io
+import json
+
+import pytest
+
+from app.validation import UploadValidationError, read_sample, validate_sample, validate_uploads
+from conftest import csv_file, sse_events
+
+
+class Upload:
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+
+def test_a_valid_sample_has_no_problems(uploads):
+    attendance, marks = uploads
+    assert validate_sample(attendance, 'attendance') == []
+    assert validate_sample(marks, 'marks') == []
+
+
+def test_missing_columns_are_listed_with_the_columns_found(uploads):
+    _, marks = uploads
+    [problem] = validate_sample(marks.drop(columns=['T2Weight', 'T3Weight']), 'marks')
+    assert problem['missing'] == ['T2Weight', 'T3Weight']
+    assert problem['found'] == ['StudentID', 'Subject', 'Class', 'T1Weight']
+    assert problem['message'] == 'is missing required column(s): T2Weight, T3Weight'
+
+
+def test_a_misnamed_column_is_reported_as_missing(uploads):
+    attendance, _ = uploads
+    [problem] = validate_sample(attendance.rename(columns={'Class Time': 'ClassTime'}), 'attendance')
+    assert problem['missing'] == ['Class Time']
+    assert 'ClassTime' in problem['found']
+
+
+def test_values_of_the_wrong_kind_are_shown_with_their_rows(uploads):
+    _, marks = uploads
+    marks = marks.astype({'T1Weight': object, 'StudentID': float})
+    marks.loc[3, 'T1Weight'] = 'absent'
+    marks.loc[7, 'StudentID'] = 1007.5
+    problems = {problem['column']: problem for problem in validate_sample(marks, 'marks')}
+
+    assert set(problems) == {'StudentID', 'T1Weight'}
+    assert problems['T1Weight']['examples'] == [{'row': 5, 'value': 'absent'}]
+    assert problems['T1Weight']['expected'] == 'numbers'
+    assert problems['StudentID']['message'].startswith("column 'StudentID' should hold whole numbers but has values that are not whole numbers")
+    assert problems['StudentID']['dtype'] == 'float64'
+
+
+def test_header_without_rows_is_rejected(uploads):
+    _, marks = uploads
+    assert validate_sample(marks.head(0), 'marks') == [{'column': None, 'message': 'has no data rows'}]
+
+
+def test_read_sample_reads_only_the_first_rows_and_rewinds(uploads):
+    _, marks = uploads
+    stream = io.BytesIO(marks.to_csv(index=False).encode())
+    sample = read_sample(stream, rows=5)
+    assert len(sample) == 5
+    assert stream.tell() == 0
+
+
+def test_validate_uploads_names_every_file_with_a_problem(uploads):
+    attendance, marks = uploads
+    with pytest.raises(UploadValidationError) as raised:
+        validate_uploads(
+            attendance=Upload(marks.to_csv(index=False).encode()),  # The files swapped round
+            marks=Upload(b'%PDF-1.7\n\xe2\xe3\xcf\xd3'),
+        )
+    assert set(raised.value.problems) == {'attendance', 'marks'}
+    assert 'could not be read: Unrecognised file format' in str(raised.value)
+
+
+def test_upload_with_a_missing_column_is_a_400_with_diagnostics(client, uploads):
+    attendance, marks = uploads
+    response = client.post('/upload', content_type='multipart/form-data', data={
+        'attendanceFile': csv_file(attendance, 'attendance.csv'),
+        'marksFile': csv_file(marks.rename(columns={'Subject': 'Subjects'}), 'marks.csv'),
+    })
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['error'] == 'The marks file is missing required column(s): Subject.'
+    [problem] = body['problems']['marks']
+    assert problem['missing'] == ['Subject']
+    assert 'Subjects' in problem['found']
+
+
+def test_upload_with_valid_headers_is_analysed(client, uploads):
+    attendance, marks = uploads
+    response = client.post('/upload', content_type='multipart/form-data', data={
+        'attendanceFile': csv_file(attendance, 'attendance.csv'),
+        'marksFile': csv_file(marks, 'marks.csv'),
+        'chartMode': 'data',
+    })
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    event_type, data = sse_events(response.get_data(as_text=True))[-1]
+    assert event_type == 'result'
+    assert json.loads(data)['class_mapping']['suffix'] > 0